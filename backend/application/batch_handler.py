@@ -0,0 +1,186 @@
+import backend.file_handler as file_handler
+import backend.structure_interpreter as structure_interpreter
+import backend.application.process_handler as process_handler
+import backend.application.process_registry as process_registry
+import backend.application.execute_node as execute_node
+import backend.application.near_duplicates as near_duplicates
+import backend.application.retention as retention
+
+import os
+import uuid
+import time
+import threading
+
+MAX_BATCH_SIZE = 1000
+
+# Guards read-modify-write cycles on batch files
+_batch_lock = threading.Lock()
+
+def get_batch_file(structure_id, batch_id):
+    return os.path.join("data", "processes", structure_id, "batches", f"{batch_id}.json")
+
+def start_batch(response):
+    """
+    Run one structure over many inputs.
+
+    Each input (text or feed item) becomes an independent auto-run process
+    tagged with the batch id. The runs are executed by the job queue
+    workers, which share the LLM concurrency budget with interactive use.
+
+    Inputs that are near-duplicates of one run recently for the same
+    structure (dedup.inputs) are skipped or, in flag mode, run with
+    near_duplicate_of set.
+    """
+    request = response.get('request', {})
+    user_id = response.get('userid', '')
+    structure_data = request.get('structure_data', {})
+    inputs = request.get('inputs', [])
+
+    if not user_id:
+        response['status'] = 'error'
+        response['message'] = 'User not authenticated'
+        return response
+
+    if not structure_data:
+        response['status'] = 'error'
+        response['message'] = 'Missing structure_data parameter'
+        return response
+
+    if not isinstance(inputs, list) or not inputs:
+        response['status'] = 'error'
+        response['message'] = 'Missing inputs parameter'
+        return response
+
+    if len(inputs) > MAX_BATCH_SIZE:
+        response['status'] = 'error'
+        response['message'] = f'Too many inputs (maximum {MAX_BATCH_SIZE})'
+        return response
+
+    structure_id, compiled, start_node, error = process_handler.prepare_structure(structure_data)
+    if error:
+        response['status'] = 'error'
+        response['message'] = error
+        return response
+
+    batch_id = str(uuid.uuid4())
+    scope = near_duplicates.scope_key(user_id, structure_id)
+    run_options, duplicates = [], []
+    for position, item in enumerate(inputs):
+        fingerprint, match = near_duplicates.check('inputs', execute_node.format_inputs(item), scope)
+        if match and near_duplicates.mode('inputs') == 'skip':
+            duplicates.append({'index': position, **match})
+            continue
+        options = {'id': str(uuid.uuid4()), 'auto_run': True, 'input': item, 'batch_id': batch_id}
+        if match:
+            options['near_duplicate_of'] = match['duplicate_of']
+        else:
+            # Remembered at once so later copies in the same batch match it
+            near_duplicates.remember('inputs', fingerprint, scope, options['id'])
+        run_options.append(options)
+
+    if not run_options:
+        response['status'] = 'success'
+        response['message'] = f'All {len(inputs)} inputs were near-duplicates of recent runs'
+        response['data'] = {'batch_id': None, 'structure_id': structure_id, 'process_ids': [], 'duplicates': duplicates}
+        return response
+
+    # Written before the runs are queued, since runs forked by a
+    # similarity node add themselves to it
+    batch = {
+        'id': batch_id,
+        'structure_id': structure_id,
+        'user_id': user_id,
+        'created_at': time.time(),
+        'total': len(run_options),
+        'process_ids': [options['id'] for options in run_options],
+        'skipped_duplicates': len(duplicates)
+    }
+    with _batch_lock:
+        file_handler.save_data(get_batch_file(structure_id, batch_id), batch)
+
+    runs = process_handler.create_runs(user_id, structure_id, compiled, start_node, run_options)
+
+    response['status'] = 'success'
+    response['message'] = f'Batch of {len(runs)} runs started'
+    if duplicates:
+        response['message'] += f' ({len(duplicates)} near-duplicate inputs skipped)'
+    response['data'] = {
+        'batch_id': batch_id,
+        'structure_id': structure_id,
+        'process_ids': [run['id'] for run in runs],
+        'duplicates': duplicates
+    }
+    return response
+
+def add_runs(structure_id, batch_id, process_ids):
+    """Count runs forked from a batch run (after a similarity node) in the batch."""
+    batch_file = get_batch_file(structure_id, batch_id)
+    with _batch_lock:
+        batch = file_handler.load_data(batch_file)
+        if not batch:
+            return
+        known = set(batch['process_ids'])
+        batch['process_ids'].extend(process_id for process_id in process_ids if process_id not in known)
+        batch['total'] = len(batch['process_ids'])
+        file_handler.save_data(batch_file, batch)
+
+def get_batch_status(response):
+    request = response.get('request', {})
+    user_id = response.get('userid', '')
+    structure_id = request.get('structure_id')
+    batch_id = request.get('batch_id')
+
+    if not structure_id or not batch_id:
+        response['status'] = 'error'
+        response['message'] = 'Missing structure_id or batch_id parameter'
+        return response
+
+    if not structure_interpreter.SAFE_ID.match(str(structure_id)) or not structure_interpreter.SAFE_ID.match(str(batch_id)):
+        response['status'] = 'error'
+        response['message'] = 'Invalid structure_id or batch_id'
+        return response
+
+    batch = file_handler.load_data(get_batch_file(structure_id, batch_id))
+    if not batch or batch.get('user_id') != user_id:
+        response['status'] = 'error'
+        response['message'] = 'Batch not found'
+        return response
+
+    # One read of process.json rather than a registry lookup per run,
+    # which could rehydrate and evict up to MAX_BATCH_SIZE entries
+    records = file_handler.load_data(os.path.join(process_registry.PROCESSES_DIR, structure_id, "process.json"), {}) or {}
+    wanted = set(batch['process_ids'])
+    runs = {run['id']: run for run in records.get('runs', []) if run.get('id') in wanted}
+    missing = set(batch['process_ids']) - set(runs)
+    if missing:
+        # Runs of a finished batch may have been moved to the archive
+        archived, _ = retention.query_archive(user_id, structure_id, batch_id=batch_id, limit=len(batch['process_ids']))
+        runs.update((run['id'], run) for run in archived if run.get('id') in missing)
+
+    counts = {}
+    last_completed_at = None
+    for process_id in batch['process_ids']:
+        run = runs.get(process_id)
+        status = run.get('status', 'unknown') if run else 'unknown'
+        counts[status] = counts.get(status, 0) + 1
+        if run and run.get('completed_at'):
+            last_completed_at = max(last_completed_at or 0, run['completed_at'])
+
+    finished = counts.get('completed', 0) + counts.get('failed', 0)
+    done = finished == batch['total']
+    end = last_completed_at if done and last_completed_at else time.time()
+    # Run timestamps have one-second resolution
+    elapsed = max(end - batch['created_at'], 1.0)
+
+    response['status'] = 'success'
+    response['data'] = {
+        'batch_id': batch_id,
+        'total': batch['total'],
+        'counts': counts,
+        'finished': finished,
+        'progress': finished / batch['total'] if batch['total'] else 1.0,
+        'done': done,
+        'elapsed_seconds': round(elapsed, 3),
+        'runs_per_minute': round(finished / elapsed * 60, 3)
+    }
+    return response
@@ -1,12 +1,53 @@
 import backend.llm as llm
+import backend.llm_scheduler as llm_scheduler
+import backend.prompt_templates as prompt_templates
+import backend.tracing as tracing
+import backend.application.routing as routing
+import backend.application.execute_node as execute_node
 import backend.application.refinement as refinement
-import json
 
 def handle_choose_next_node(response: dict) -> dict:
     request = response.get('request')
-    current_node = request.get('current_node')
-    connections = request.get('connections')
+    current_node = request.get('current_node') or {}
+    connections = request.get('connections') or []
+    structure_id = request.get('structure_id')
+    user_id = response.get('userid', '')
 
+    output_text = request.get('output', '')
+    if not output_text and structure_id and user_id:
+        output_text = execute_node.latest_output_text(user_id, structure_id, current_node.get('id'))
+
+    errors = []
+    def ask(node, candidates):
+        result = ask_llm(node, candidates, user_id)
+        if isinstance(result, dict) and result.get('status') == 'error':
+            errors.append(result)
+            return None
+        return result.get('next_node_id') if isinstance(result, dict) else None
+
+    with tracing.trace(request.get('process_id'), structure_id, action='choose_next_node'):
+        decision = routing.choose(
+            current_node,
+            connections,
+            request.get('edges'),
+            output_text,
+            request.get('input'),
+            ask
+        )
+
+    if not decision:
+        if errors:
+            return errors[0]
+        response['status'] = 'error'
+        response['message'] = 'Could not choose the next node'
+        return response
+
+    response['status'] = 'success'
+    response['next_node_id'] = decision['next_node_id']
+    response['routing_source'] = decision['source']
+    return response
+
+def ask_llm(current_node, connections, user_id=None, priority=llm_scheduler.INTERACTIVE):
     node = {}
     node['header'] = current_node.get('configuration', {}).get('header', '')
     node['prompt'] = current_node.get('configuration', {}).get('prompt', '')
@@ -19,35 +60,23 @@ def handle_choose_next_node(response: dict) -> dict:
         con['header'] = connections[i].get('configuration', {}).get('header', '')
         con['prompt'] = connections[i].get('configuration', {}).get('prompt', '')
         cons.append(con)
-        print()
         i += 1
     
-    prompt = '''
-<|im_system|>
-You are a helpful assistant.
-<|im_end|>
-<|im_user|>
-This is the current node:
-''' + json.dumps(node, indent=2) + '''.
-
-These are the possible next nodes:
-''' + json.dumps(cons, indent=2) + '''.
-
-Choose the next node based on the current node and the possible next nodes.
-
-Provide the next node id in the following format:
-{
-    "next_node_id": <next_node_id>
-}
-
-Task: Return only one message that includes a valid JSON object with the next_node_id.
-<|im_end|>
-<|im_assistant|>
-    '''
+    model = current_node.get('configuration', {}).get('model')
+    prompt = prompt_templates.render(
+        'choose_next_node',
+        model,
+        budget_field='candidates',
+        node=node,
+        candidates=cons
+    )
+    tracing.add_attributes(prompt_tokens=prompt_templates.estimate_tokens(prompt))
 
-    llm_response = llm.generate_llm_response(prompt)
+    llm_response = llm.generate_llm_response(prompt, user_id=user_id, priority=priority, model=model)
+    if isinstance(llm_response, dict):
+        return llm_response
 
-    refined_response = refinement.refine_response(llm_response)
+    refined_response = refinement.refine_response(llm_response, prompt_templates.assistant_marker(model))
     
     return refined_response
 
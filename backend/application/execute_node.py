@@ -1,10 +1,25 @@
+import backend.logger as logger
 import backend.file_handler as file_handler
 import backend.llm as llm
+import backend.llm_scheduler as llm_scheduler
+import backend.prompt_templates as prompt_templates
+import backend.event_bus as event_bus
+import backend.tracing as tracing
 import backend.application.refinement as refinement
+import backend.structure_interpreter as structure_interpreter
+import backend.application.node_cache as node_cache
+import backend.application.search_index as search_index
+import backend.application.near_duplicates as near_duplicates
+import backend.application.similarity as similarity
 import os
 import json
 import uuid
 import time
+import threading
+
+log = logger.get_logger("execute_node")
+
+_registry_lock = threading.Lock()
 
 def handle_execute_node(response: dict) -> dict:
     """
@@ -36,25 +51,121 @@ def handle_execute_node(response: dict) -> dict:
         response['status'] = 'error'
         response['message'] = 'Missing structure ID'
         return response
+
+    if request.get('job_id') and not structure_interpreter.SAFE_ID.match(str(request['job_id'])):
+        response['status'] = 'error'
+        response['message'] = 'Invalid job_id'
+        return response
     
+    try:
+        with tracing.trace(request.get('process_id'), structure_id, action='execute_node'):
+            data = execute_node_output(
+                user_id,
+                structure_id,
+                node,
+                job_id=request.get('job_id'),
+                idempotency_key=request.get('idempotency_key'),
+                upstream_node_ids=request.get('upstream_node_ids', node.get('connections', {}).get('comingFrom', [])),
+                force=bool(request.get('force')),
+                process_id=request.get('process_id'),
+                inputs=request.get('inputs')
+            )
+    except Exception as e:
+        event_bus.publish(user_id, 'node_error', {
+            'structure_id': structure_id,
+            'node_id': node.get('id', ''),
+            'error': str(e)
+        }, request.get('process_id'))
+        response['status'] = 'error'
+        response['message'] = f'Error generating file: {str(e)}'
+        return response
+    
+    response['status'] = 'success'
+    if data.get('cached'):
+        response['message'] = f"File {data['file_info']['filename']} reused (node unchanged)"
+    elif data.get('near_duplicate'):
+        response['message'] = f"Output is a near-duplicate of {data['file_info']['filename']}, not stored again"
+    elif data['file_generated']:
+        response['message'] = f"File {data['file_info']['filename']} generated successfully"
+    else:
+        response['message'] = f"Node {node.get('type', '').lower()} executed (no file generated)"
+    response['data'] = data
+    return response
+
+def execute_node_output(user_id, structure_id, node, job_id=None, idempotency_key=None, upstream_node_ids=None, force=False, process_id=None, inputs=None, batch_id=None, priority=llm_scheduler.INTERACTIVE):
+    """
+    Generate and register the output file of a single node.
+    
+    When an idempotency key is given and the registry already holds a file
+    for it, that file is returned instead of generating a new one, so a
+    resumed step does not write its output twice.
+    
+    Outputs are also memoized on a hash of the node configuration and the
+    latest outputs of its upstream nodes: if neither changed since a
+    previous run, the earlier file is reused without calling the LLM
+    (unless force is set). A generated output that is a near-duplicate of
+    a recent output of the same node is flagged or, with dedup.outputs
+    set to skip, replaced by the earlier file.
+    
+    Similarity nodes cluster or rank their input items locally instead of
+    calling the LLM; their output is the grouping as JSON.
+    
+    priority selects the LLM scheduler class: interactive requests are
+    served before batch work.
+    
+    Returns:
+        Dictionary with node_executed, file_generated and file_info
+    """
+    with tracing.span('execute_node', node_id=node.get('id', ''), node_type=node.get('type', '').lower()) as span:
+        data = _execute_node_output(user_id, structure_id, node, job_id, idempotency_key, upstream_node_ids, force, process_id, inputs, batch_id, priority)
+        span['attrs']['cache_hit'] = bool(data.get('cached'))
+        span['attrs']['idempotent_replay'] = bool(data.get('idempotent_replay'))
+        span['attrs']['near_duplicate'] = bool(data.get('near_duplicate') or (data.get('file_info') or {}).get('near_duplicate_of'))
+        span['attrs']['bytes_written'] = (data.get('file_info') or {}).get('size', 0) if data.get('file_generated') else 0
+        return data
+
+def _execute_node_output(user_id, structure_id, node, job_id, idempotency_key, upstream_node_ids, force, process_id, inputs, batch_id, priority):
     # Create output directory path for the user and structure
     output_dir = os.path.join("data", "users", user_id, structure_id)
     file_handler.ensure_directory(output_dir)
+    registry_path = os.path.join(output_dir, "file_registry.json")
     
     # Extract node content
     node_type = node.get('type', '').lower()
     node_name = node.get('name', '')
-    node_config = node.get('configuration', {})
     
     # Skip file generation for start/finish nodes
     if node_type in ['start', 'finish', 'end']:
-        response['status'] = 'success'
-        response['message'] = f'Node {node_type} executed (no file generated)'
-        response['data'] = {
+        return {
             'node_executed': True,
             'file_generated': False
         }
-        return response
+    
+    with _registry_lock:
+        registry = file_handler.load_data(registry_path, {"files": []})
+    
+    if idempotency_key:
+        for file_info in registry["files"]:
+            if file_info.get("idempotency_key") == idempotency_key:
+                return {
+                    'node_executed': True,
+                    'file_generated': True,
+                    'file_info': file_info,
+                    'idempotent_replay': True
+                }
+    
+    input_text = format_inputs(inputs)
+    cache_key = node_cache.compute_cache_key(node, upstream_node_ids, registry["files"], input_text)
+    if not force:
+        cached_file = node_cache.find_cached_output(cache_key, registry["files"], os.path.exists)
+        if cached_file:
+            publish_file_event(user_id, structure_id, cached_file, process_id, cached=True)
+            return {
+                'node_executed': True,
+                'file_generated': False,
+                'file_info': cached_file,
+                'cached': True
+            }
     
     # Generate filename based on node name or type
     filename = f"{node_name or node_type}_{int(time.time())}"
@@ -62,77 +173,142 @@ def handle_execute_node(response: dict) -> dict:
     # Clean filename (remove special characters)
     filename = ''.join(c if c.isalnum() or c in ['-', '_'] else '_' for c in filename)
     
-    # Generate file content using LLM
-    file_content = generate_file_content(node)
+    analysis = similarity.is_similarity_node(node)
+    if analysis:
+        # Grouping and ranking run locally, without the LLM
+        file_content = similarity.run_node(node, [format_inputs(item) for item in similarity.input_items(inputs)])
+    else:
+        # Generate file content using LLM
+        file_content = generate_file_content(node, input_text, user_id, priority)
     
     # Detect file extension based on content or node type
     file_extension = detect_file_extension(file_content, node_type)
     
-    # Complete filename with extension
-    full_filename = f"{filename}.{file_extension}"
-    file_path = os.path.join(output_dir, full_filename)
+    # Near-identical output of the same node (e.g. a wire story arriving again)
+    dedup_scope = near_duplicates.scope_key(user_id, structure_id, node.get('id', ''))
+    fingerprint, duplicate = near_duplicates.check('outputs', file_content, dedup_scope) if not analysis else (None, None)
+    if duplicate and near_duplicates.mode('outputs') == 'skip':
+        with _registry_lock:
+            registry = file_handler.load_data(registry_path, {"files": []})
+        earlier = next((file_info for file_info in registry["files"] if file_info.get("id") == duplicate['duplicate_of']), None)
+        if earlier and os.path.exists(earlier.get("path", "")):
+            publish_file_event(user_id, structure_id, earlier, process_id, cached=True)
+            return {
+                'node_executed': True,
+                'file_generated': False,
+                'file_info': earlier,
+                'near_duplicate': duplicate
+            }
     
-    # Save file
-    try:
+    file_info = {
+        "id": str(uuid.uuid4()),
+        "node_id": node.get('id', ''),
+        "node_name": node_name,
+        "created_at": int(time.time()),
+        "size": len(file_content),
+        "content": file_content,
+        "content_hash": node_cache.hash_content(file_content),
+        "cache_key": cache_key
+    }
+    if idempotency_key:
+        file_info["idempotency_key"] = idempotency_key
+    if batch_id:
+        file_info["batch_id"] = batch_id
+    if duplicate:
+        file_info["near_duplicate_of"] = duplicate['duplicate_of']
+        file_info["similarity"] = duplicate['similarity']
+    else:
+        near_duplicates.remember('outputs', fingerprint, dedup_scope, file_info["id"])
+    
+    # Save file and update the file registry for the structure
+    with tracing.span('write_output', bytes=len(file_content)), _registry_lock:
+        # Complete filename with extension, never overwriting an earlier
+        # output that a cache entry may still point to
+        full_filename = f"{filename}.{file_extension}"
+        file_path = os.path.join(output_dir, full_filename)
+        suffix = 1
+        while os.path.exists(file_path):
+            full_filename = f"{filename}_{suffix}.{file_extension}"
+            file_path = os.path.join(output_dir, full_filename)
+            suffix += 1
+        
+        file_info["filename"] = full_filename
+        file_info["path"] = file_path
+        
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(file_content)
-            
-        # Update file registry for the structure
-        registry_path = os.path.join(output_dir, "file_registry.json")
-        registry = file_handler.load_data(registry_path, {"files": []})
-        
-        file_info = {
-            "id": str(uuid.uuid4()),
-            "filename": full_filename,
-            "path": file_path,
-            "node_id": node.get('id', ''),
-            "node_name": node_name,
-            "created_at": int(time.time()),
-            "size": len(file_content),
-            "content": file_content
-        }
         
+        registry = file_handler.load_data(registry_path, {"files": []})
         registry["files"].append(file_info)
         file_handler.save_data(registry_path, registry)
-        
-        response['status'] = 'success'
-        response['message'] = f'File {full_filename} generated successfully'
-        response['data'] = {
-            'node_executed': True,
-            'file_generated': True,
-            'file_info': file_info
-        }
-        
-    except Exception as e:
-        response['status'] = 'error'
-        response['message'] = f'Error generating file: {str(e)}'
-        
-    return response
+    
+    if not analysis:
+        search_index.add_document(
+            f"output:{file_info['id']}", file_content, user_id, 'output',
+            title=f"{node_name or node_type}: {full_filename}", ref=file_path, timestamp=file_info['created_at']
+        )
+    
+    # Step artefacts of a job are only created once the step runs
+    if job_id:
+        step_folder = structure_interpreter.materialize_step(user_id, job_id, node.get('id', ''))
+        if step_folder:
+            file_handler.save_data(os.path.join(step_folder, "output.json"), file_info)
+    
+    publish_file_event(user_id, structure_id, file_info, process_id)
+    
+    return {
+        'node_executed': True,
+        'file_generated': True,
+        'file_info': file_info
+    }
 
-def generate_file_content(node):
+def publish_file_event(user_id, structure_id, file_info, process_id=None, cached=False):
+    event_bus.publish(user_id, 'file_generated', {
+        'structure_id': structure_id,
+        'node_id': file_info.get('node_id'),
+        'file_id': file_info.get('id'),
+        'filename': file_info.get('filename'),
+        'size': file_info.get('size'),
+        'cached': cached
+    }, process_id)
+
+def format_inputs(inputs):
+    """Flatten run inputs (text or feed items) into prompt text."""
+    if inputs is None:
+        return ''
+    if isinstance(inputs, str):
+        return inputs
+    if isinstance(inputs, dict):
+        parts = [str(inputs[key]) for key in ('title', 'text', 'content', 'summary', 'link') if inputs.get(key)]
+        return '\n'.join(parts) if parts else json.dumps(inputs)
+    if isinstance(inputs, list):
+        return '\n\n'.join(format_inputs(item) for item in inputs)
+    return str(inputs)
+
+def generate_file_content(node, input_text='', user_id=None, priority=llm_scheduler.INTERACTIVE):
     node_config = node.get('configuration', {})
     header = node_config.get('header', '')
     prompt = node_config.get('prompt', '')
+    input_section = f"\nInput:\n{input_text}\n" if input_text else ''
+    model = node_config.get('model')
     
-    llm_prompt = f'''
-<|im_system|>
-You are a helpful assistant that generates file content based on instructions.
-<|im_end|>
-<|im_user|>
-Generate content for a file based on the following information:
-
-Header: {header}
-Instructions: {prompt}
+    with tracing.span('render_prompt', template='generate_file') as span:
+        llm_prompt = prompt_templates.render(
+            'generate_file',
+            model,
+            budget_field='input_section',
+            header=header,
+            instructions=prompt,
+            input_section=input_section
+        )
+        span['attrs']['prompt_tokens'] = prompt_templates.estimate_tokens(llm_prompt)
 
-Your task is to generate appropriate content for a file based on this information.
-Keep the content concise and focused on the requirements in the instructions.
-<|im_end|>
-<|im_assistant|>
-'''
+    response = llm.generate_llm_response(llm_prompt, user_id=user_id, priority=priority, model=model)
+    if isinstance(response, dict):
+        raise RuntimeError(response.get('message', 'LLM request failed'))
 
-    response = llm.generate_llm_response(llm_prompt)
-
-    refined_response = refinement.refine_response(response)
+    with tracing.span('refine', response_bytes=len(response.content)):
+        refined_response = refinement.refine_response(response, prompt_templates.assistant_marker(model))
 
     return refined_response
 
@@ -156,7 +332,7 @@ def detect_file_extension(content, node_type):
     
     return extension
 
-def get_output_files(user_id, structure_id):
+def get_output_files(user_id, structure_id, batch_id=None):
     output_dir = os.path.join("data", "users", user_id, structure_id)
     registry_path = os.path.join(output_dir, "file_registry.json")
     
@@ -164,6 +340,9 @@ def get_output_files(user_id, structure_id):
         # Load the file registry
         files = file_handler.load_data(registry_path, {"files": []}).get("files", [])
         
+        if batch_id:
+            files = [file_info for file_info in files if file_info.get("batch_id") == batch_id]
+        
         # Ensure each file has its content loaded if it exists in the registry but not in memory
         for file_info in files:
             # If file doesn't have content but has a path, load content from file
@@ -174,13 +353,21 @@ def get_output_files(user_id, structure_id):
                         with open(file_path, 'r', encoding='utf-8') as f:
                             file_info["content"] = f.read()
                 except Exception as e:
-                    print(f"Error loading content for file {file_path}: {str(e)}")
+                    log.warning("Error loading output content", extra={"fields": {"path": file_path, "error": str(e)}})
                     file_info["content"] = f"Error loading content: {str(e)}"
         
         return files
     
     return []
 
+def latest_output_text(user_id, structure_id, node_id):
+    """Return the content of the newest output registered for node_id, or ''."""
+    registry_path = os.path.join("data", "users", user_id, structure_id, "file_registry.json")
+    with _registry_lock:
+        files = file_handler.load_data(registry_path, {"files": []}).get("files", [])
+    file_info = node_cache.latest_outputs(files).get(node_id)
+    return file_info.get("content", "") if file_info else ''
+
 def delete_output_file(user_id, structure_id, file_id):
     output_dir = os.path.join("data", "users", user_id, structure_id)
     registry_path = os.path.join(output_dir, "file_registry.json")
@@ -188,20 +375,22 @@ def delete_output_file(user_id, structure_id, file_id):
     if not os.path.exists(registry_path):
         return False
     
-    registry = file_handler.load_data(registry_path, {"files": []})
-    files = registry.get("files", [])
-    
-    for i, file_info in enumerate(files):
-        if file_info.get("id") == file_id:
-            file_path = file_info.get("path")
-            
-            files.pop(i)
-            file_handler.save_data(registry_path, registry)
-            
-            if file_path and os.path.exists(file_path):
-                os.remove(file_path)
+    with _registry_lock:
+        registry = file_handler.load_data(registry_path, {"files": []})
+        files = registry.get("files", [])
+        
+        for i, file_info in enumerate(files):
+            if file_info.get("id") == file_id:
+                file_path = file_info.get("path")
                 
-            return True
+                files.pop(i)
+                file_handler.save_data(registry_path, registry)
+                search_index.remove_documents([f"output:{file_id}"])
+                
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+                    
+                return True
     
     return False
 
@@ -226,55 +415,58 @@ def delete_all_output_files(user_id, structure_id):
     old_dir = os.path.join(output_dir, "old")
     file_handler.ensure_directory(old_dir)
     
-    # Load the file registry
-    registry = file_handler.load_data(registry_path, {"files": []})
-    files = registry.get("files", [])
-    
-    # Store original file paths and their new destination paths
-    moved_files = []
-    
-    try:
-        # Move each file to the old directory
-        for file_info in files:
-            file_path = file_info.get("path")
-            
-            if file_path and os.path.exists(file_path):
-                filename = os.path.basename(file_path)
-                new_path = os.path.join(old_dir, filename)
-                
-                # If a file with the same name exists in the old directory,
-                # add a timestamp to make the filename unique
-                if os.path.exists(new_path):
-                    name, ext = os.path.splitext(filename)
-                    new_path = os.path.join(old_dir, f"{name}_{int(time.time())}{ext}")
-                
-                # Move the file (os.rename is used for moving files)
-                os.rename(file_path, new_path)
-                
-                # Store file movement information
-                moved_files.append({
-                    "original_path": file_path,
-                    "new_path": new_path,
-                    "file_id": file_info.get("id")
-                })
-        
-        # Clear the file registry
-        registry["files"] = []
-        file_handler.save_data(registry_path, registry)
-        
-        return True
-    except Exception as e:
-        print(f"Error moving files to old directory: {str(e)}")
+    # Held throughout, so outputs registered meanwhile are neither dropped nor resurrected
+    with _registry_lock:
+        # Load the file registry
+        registry = file_handler.load_data(registry_path, {"files": []})
+        files = registry.get("files", [])
         
-        # If there was an error, attempt to move files back to their original locations
-        for file_move in moved_files:
-            try:
-                if os.path.exists(file_move["new_path"]):
-                    os.rename(file_move["new_path"], file_move["original_path"])
-            except Exception as restore_err:
-                print(f"Error restoring file {file_move['original_path']}: {str(restore_err)}")
+        # Store original file paths and their new destination paths
+        moved_files = []
         
-        return False
+        try:
+            # Move each file to the old directory
+            for file_info in files:
+                file_path = file_info.get("path")
+                
+                if file_path and os.path.exists(file_path):
+                    filename = os.path.basename(file_path)
+                    new_path = os.path.join(old_dir, filename)
+                    
+                    # If a file with the same name exists in the old directory,
+                    # add a timestamp to make the filename unique
+                    if os.path.exists(new_path):
+                        name, ext = os.path.splitext(filename)
+                        new_path = os.path.join(old_dir, f"{name}_{int(time.time())}{ext}")
+                    
+                    # Move the file (os.rename is used for moving files)
+                    os.rename(file_path, new_path)
+                    
+                    # Store file movement information
+                    moved_files.append({
+                        "original_path": file_path,
+                        "new_path": new_path,
+                        "file_id": file_info.get("id")
+                    })
+            
+            # Clear the file registry
+            registry["files"] = []
+            file_handler.save_data(registry_path, registry)
+            search_index.remove_documents([f"output:{file_info.get('id')}" for file_info in files])
+            
+            return True
+        except Exception as e:
+            log.error("Error moving files to old directory", extra={"fields": {"error": str(e)}})
+            
+            # If there was an error, attempt to move files back to their original locations
+            for file_move in moved_files:
+                try:
+                    if os.path.exists(file_move["new_path"]):
+                        os.rename(file_move["new_path"], file_move["original_path"])
+                except Exception as restore_err:
+                    log.error("Error restoring file", extra={"fields": {"path": file_move['original_path'], "error": str(restore_err)}})
+            
+            return False
 
 if __name__ == '__main__':
     # Test Case: Article Generation
@@ -0,0 +1,392 @@
+import backend.logger as logger
+import backend.file_handler as file_handler
+import backend.metrics as metrics
+import backend.structure_interpreter as structure_interpreter
+import backend.application.feed_parser as feed_parser
+import backend.application.search_index as search_index
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logger.get_logger("feeds")
+
+FEEDS_DIR = os.path.join("data", "feeds")
+FEEDS_FILE = os.path.join(FEEDS_DIR, "feeds.json")
+
+_settings = {
+    'poll_interval': 300,
+    'workers': 16,
+    'timeout': 10,
+    'max_items': 200,
+    'recent_items': 50,
+    'seen_limit': 5000
+}
+_lock = threading.Lock()
+_feeds = None
+# Item keys already delivered per feed, oldest first (bounded by seen_limit)
+_seen = {}
+_polling = set()
+_stop_event = threading.Event()
+_scheduler_thread = None
+_pool = None
+_session = requests.Session()
+_stats = {'polls': 0, 'not_modified': 0, 'errors': 0, 'new_items': 0}
+
+def configure(config):
+    global _pool
+
+    feeds_config = config.get('feeds', {})
+    for key in ('poll_interval', 'timeout'):
+        _settings[key] = float(feeds_config.get(key, _settings[key]))
+    for key in ('workers', 'max_items', 'recent_items', 'seen_limit'):
+        _settings[key] = int(feeds_config.get(key, _settings[key]))
+    _pool = ThreadPoolExecutor(max_workers=max(_settings['workers'], 1), thread_name_prefix="feed-poll")
+    # Keep one connection per worker to each feed host
+    adapter = HTTPAdapter(pool_connections=_settings['workers'], pool_maxsize=_settings['workers'])
+    _session.mount('http://', adapter)
+    _session.mount('https://', adapter)
+
+def feed_hash(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+def get_seen_file(url):
+    return os.path.join(FEEDS_DIR, "seen", f"{feed_hash(url)}.json")
+
+def _load_feeds():
+    global _feeds
+
+    if _feeds is None:
+        _feeds = file_handler.load_data(FEEDS_FILE, {}) or {}
+    return _feeds
+
+def _save_feeds():
+    with _lock:
+        snapshot = {url: dict(feed) for url, feed in _load_feeds().items()}
+    file_handler.save_data(FEEDS_FILE, snapshot)
+
+def _mark_seen(url, items):
+    """Return the items not delivered before and remember their keys."""
+    if url not in _seen:
+        keys = file_handler.load_data(get_seen_file(url), []) or []
+        with _lock:
+            _seen.setdefault(url, {'order': deque(keys), 'keys': set(keys)})
+
+    with _lock:
+        seen = _seen[url]
+        new_items = []
+        for item in items:
+            if item['id'] in seen['keys']:
+                continue
+            seen['keys'].add(item['id'])
+            seen['order'].append(item['id'])
+            new_items.append(item)
+        while len(seen['order']) > _settings['seen_limit']:
+            seen['keys'].discard(seen['order'].popleft())
+        keys = list(seen['order']) if new_items else None
+    if keys is not None:
+        file_handler.save_data(get_seen_file(url), keys)
+    return new_items
+
+def is_valid_url(url):
+    parsed = urlparse(url or '')
+    return parsed.scheme in ('http', 'https') and bool(parsed.netloc)
+
+def subscribe(url, user_id, target=None, kind='structure', auto_run=False):
+    """
+    Register a user (and optionally a job or structure that receives the
+    items) for a feed. Returns True when the subscription is new.
+    """
+    subscriber = {'user_id': user_id, 'target': target, 'kind': kind, 'auto_run': bool(auto_run)}
+    with _lock:
+        feed = _load_feeds().setdefault(url, {
+            'url': url,
+            'title': None,
+            'etag': None,
+            'last_modified': None,
+            'last_polled': None,
+            'last_status': None,
+            'error': None,
+            'subscribers': [],
+            'recent': []
+        })
+        for existing in feed['subscribers']:
+            if existing['user_id'] == user_id and existing.get('target') == target:
+                existing['auto_run'] = subscriber['auto_run']
+                return False
+        feed['subscribers'].append(subscriber)
+        return True
+
+class _ResponseStream:
+    """
+    File-like view of a streamed response body for iterparse. Reading it
+    to the end marks the response consumed, so its connection is reused
+    instead of closed.
+    """
+
+    def __init__(self, response):
+        self.chunks = response.iter_content(chunk_size=16384)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def fetch_feed(url, etag=None, last_modified=None):
+    """
+    Conditional GET of a feed, parsed while it downloads.
+
+    Returns:
+        (status_code, etag, last_modified, title, items); items is empty
+        for 304 Not Modified
+    """
+    headers = {'Accept': 'application/rss+xml, application/atom+xml, application/xml;q=0.9, */*;q=0.8'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    with _session.get(url, headers=headers, timeout=_settings['timeout'], stream=True) as response:
+        if response.status_code == 304:
+            # Reading the (empty) body lets the connection go back to the pool
+            response.content
+            return 304, etag, last_modified, None, []
+        response.raise_for_status()
+        title, items = feed_parser.parse_feed(_ResponseStream(response), _settings['max_items'])
+        return (
+            response.status_code,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            title,
+            items
+        )
+
+def poll_feed(url):
+    """
+    Fetch one feed and deliver its new items to every subscriber.
+
+    Returns a result dict with new_items and not_modified, or None when
+    the feed is unknown or already being polled.
+    """
+    with _lock:
+        feed = _load_feeds().get(url)
+        if not feed or url in _polling:
+            return None
+        _polling.add(url)
+        etag, last_modified = feed.get('etag'), feed.get('last_modified')
+
+    try:
+        try:
+            with metrics.timer('feed_fetch_seconds'):
+                status, etag, last_modified, title, items = fetch_feed(url, etag, last_modified)
+        except (requests.exceptions.RequestException, feed_parser.ET.ParseError) as e:
+            with _lock:
+                _stats['polls'] += 1
+                _stats['errors'] += 1
+                feed.update(last_polled=int(time.time()), last_status='error', error=str(e))
+            log.warning("Feed poll failed", extra={"fields": {"url": url, "error": str(e)}})
+            return {'url': url, 'error': str(e), 'new_items': [], 'not_modified': False}
+
+        new_items = _mark_seen(url, items)
+        with _lock:
+            _stats['polls'] += 1
+            _stats['new_items'] += len(new_items)
+            if status == 304:
+                _stats['not_modified'] += 1
+            feed.update(
+                etag=etag,
+                last_modified=last_modified,
+                title=title or feed.get('title'),
+                last_polled=int(time.time()),
+                last_status=status,
+                error=None
+            )
+            if new_items:
+                feed['recent'] = (new_items + feed.get('recent', []))[:_settings['recent_items']]
+            subscribers = list(feed['subscribers'])
+            feed_title = feed.get('title')
+
+        if new_items:
+            search_index.add_documents([
+                search_index.make_document(f"feed:{item['id']}", item.get('summary', ''), None, 'feed',
+                                           title=item.get('title'), link=item.get('link'), ref=url)
+                for item in new_items
+            ])
+            for subscriber in subscribers:
+                deliver(subscriber, url, feed_title, new_items)
+        return {'url': url, 'title': feed_title, 'new_items': new_items, 'not_modified': status == 304}
+    finally:
+        with _lock:
+            _polling.discard(url)
+
+def deliver(subscriber, url, title, items):
+    """
+    Append a batch of feed items to the subscriber's job inputs, or to
+    the structure's inputs, and start a batch run when auto_run is set.
+    """
+    batch = {
+        'type': 'rss_feed',
+        'url': url,
+        'title': title,
+        'items': items,
+        'timestamp': int(time.time())
+    }
+    user_id, target = subscriber['user_id'], subscriber.get('target')
+    if not target:
+        return
+
+    try:
+        if subscriber.get('kind') == 'job':
+            structure_interpreter.add_job_inputs(user_id, target, [batch])
+            return
+
+        # Refused for subscriptions stored before targets were validated
+        if not structure_interpreter.add_structure_inputs(user_id, target, [batch]):
+            return
+
+        if subscriber.get('auto_run'):
+            start_feed_batch(user_id, target, items)
+    except Exception as e:
+        log.error("Delivering feed items failed", extra={"fields": {"url": url, "user_id": user_id, "error": str(e)}})
+
+def start_feed_batch(user_id, structure_id, items):
+    """Run the subscribed structure once per new item as a batch."""
+    import backend.application.batch_handler as batch_handler
+
+    structure_file = os.path.join("data", "processes", structure_id, "structure.json")
+    structure_data = file_handler.load_data(structure_file)
+    if not structure_data:
+        log.warning("Feed batch skipped, structure not found", extra={"fields": {"structure_id": structure_id}})
+        return None
+    response = batch_handler.start_batch({
+        'request': {'structure_data': structure_data, 'inputs': items[:batch_handler.MAX_BATCH_SIZE]},
+        'userid': user_id
+    })
+    if response.get('status') != 'success':
+        log.warning("Feed batch failed", extra={"fields": {"structure_id": structure_id, "error": response.get('message')}})
+    return response
+
+def poll_all():
+    """Poll every subscribed feed on the worker pool; returns the number of feeds polled."""
+    with _lock:
+        urls = [url for url, feed in _load_feeds().items() if feed.get('subscribers')]
+    if not urls:
+        return 0
+
+    started = time.time()
+    results = list(_pool.map(poll_feed, urls))
+    _save_feeds()
+    new_items = sum(len(result['new_items']) for result in results if result)
+    log.info("Polled feeds", extra={"fields": {
+        "feeds": len(urls),
+        "new_items": new_items,
+        "duration": round(time.time() - started, 3)
+    }})
+    return len(urls)
+
+def _scheduler_loop():
+    while not _stop_event.wait(_settings['poll_interval']):
+        try:
+            poll_all()
+        except Exception as e:
+            log.error("Feed polling failed", extra={"fields": {"error": str(e)}})
+
+def start(config):
+    """Start the periodic poller when feeds.poll_interval is positive."""
+    global _scheduler_thread
+
+    configure(config)
+    if _settings['poll_interval'] <= 0 or _scheduler_thread is not None:
+        return False
+
+    _stop_event.clear()
+    _scheduler_thread = threading.Thread(target=_scheduler_loop, name="feed-poller", daemon=True)
+    _scheduler_thread.start()
+    return True
+
+def stop():
+    global _scheduler_thread
+
+    _stop_event.set()
+    _scheduler_thread = None
+
+def handle_read_rss(response):
+    """
+    Subscribe to a feed and return its latest items.
+
+    Items go to the job (job_id) or structure (structure_data) the request
+    names; later items arrive through the poller. A new subscription also
+    receives the feed's recent items once.
+    """
+    request = response.get('request', {})
+    user_id = response.get('userid', '')
+    url = (request.get('rss_url') or '').strip()
+
+    if not is_valid_url(url):
+        response['status'] = 'error'
+        response['message'] = 'A valid http(s) RSS URL is required'
+        return response
+
+    if _pool is None:
+        configure({})
+
+    if request.get('job_id'):
+        target, kind = request['job_id'], 'job'
+    else:
+        target, kind = (request.get('structure_data') or {}).get('id'), 'structure'
+    # The target becomes a path under the user's directory when items are delivered
+    if target and not structure_interpreter.SAFE_ID.match(str(target)):
+        response['status'] = 'error'
+        response['message'] = 'Invalid job_id or structure id'
+        return response
+
+    is_new = subscribe(url, user_id, target, kind, request.get('auto_run'))
+    with _lock:
+        recent = list(_load_feeds()[url].get('recent', []))
+    result = poll_feed(url) or {'url': url, 'new_items': [], 'not_modified': False}
+    _save_feeds()
+
+    if result.get('error') and not recent:
+        response['status'] = 'error'
+        response['message'] = f"Could not read feed: {result['error']}"
+        return response
+
+    # Items the poll just delivered already reached this subscriber
+    if is_new and recent:
+        deliver({'user_id': user_id, 'target': target, 'kind': kind, 'auto_run': request.get('auto_run')}, url, result.get('title'), recent)
+
+    with _lock:
+        feed = dict(_load_feeds()[url])
+    response['status'] = 'success'
+    response['message'] = f"{len(result['new_items'])} new items from {feed.get('title') or url}"
+    response['data'] = {
+        'feed': {'url': url, 'title': feed.get('title'), 'last_polled': feed.get('last_polled')},
+        'items': feed.get('recent', []),
+        'new_items': len(result['new_items']),
+        'not_modified': result.get('not_modified', False)
+    }
+    return response
+
+def collect_metrics():
+    with _lock:
+        feeds = _load_feeds()
+        samples = [
+            ('feeds_subscribed', 'gauge', {}, sum(1 for feed in feeds.values() if feed.get('subscribers'))),
+            ('feed_polls_total', 'counter', {}, _stats['polls']),
+            ('feed_not_modified_total', 'counter', {}, _stats['not_modified']),
+            ('feed_errors_total', 'counter', {}, _stats['errors']),
+            ('feed_new_items_total', 'counter', {}, _stats['new_items'])
+        ]
+    return samples
@@ -0,0 +1,81 @@
+import hashlib
+import xml.etree.ElementTree as ET
+
+ITEM_TAGS = ('item', 'entry')
+TITLE_TAGS = ('title',)
+LINK_TAGS = ('link',)
+ID_TAGS = ('guid', 'id')
+SUMMARY_TAGS = ('description', 'summary', 'content', 'encoded')
+DATE_TAGS = ('pubDate', 'published', 'updated', 'date')
+
+def local_name(tag):
+    """Tag without its XML namespace ("{http://www.w3.org/2005/Atom}entry" -> "entry")."""
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+def item_key(item):
+    """Dedup key of an item: its GUID, else its link, else title and date."""
+    basis = item.get('guid') or item.get('link') or f"{item.get('title', '')}|{item.get('published', '')}"
+    return hashlib.sha1(basis.strip().encode('utf-8')).hexdigest()[:20]
+
+def _read_item(element):
+    item = {}
+    for child in element:
+        name = local_name(child.tag)
+        text = (child.text or '').strip()
+        if name in TITLE_TAGS and 'title' not in item:
+            item['title'] = text
+        elif name in LINK_TAGS and 'link' not in item:
+            # Atom links carry the URL in href; prefer rel="alternate"
+            href = child.get('href')
+            if href is None:
+                item['link'] = text
+            elif child.get('rel', 'alternate') == 'alternate':
+                item['link'] = href
+        elif name in ID_TAGS and 'guid' not in item:
+            item['guid'] = text
+        elif name in SUMMARY_TAGS and 'summary' not in item:
+            item['summary'] = text
+        elif name in DATE_TAGS and 'published' not in item:
+            item['published'] = text
+    item['id'] = item_key(item)
+    return item
+
+def parse_feed(source, max_items=None):
+    """
+    Parse an RSS 2.0, RSS 1.0 (RDF) or Atom feed from a file-like object.
+
+    The document is read incrementally and each item is discarded once
+    read, so memory stays flat however large the feed is. Parsing stops
+    after max_items items.
+
+    Returns:
+        (feed_title, items) where each item has id, title, link, guid,
+        summary and published when present
+    """
+    title = None
+    items = []
+    stack = []
+    item_depth = 0
+
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        name = local_name(element.tag)
+        if event == 'start':
+            stack.append(element)
+            if name in ITEM_TAGS:
+                item_depth += 1
+            continue
+
+        stack.pop()
+        if name in ITEM_TAGS:
+            item_depth -= 1
+            items.append(_read_item(element))
+            # Drop the parsed item from its parent so the tree never grows
+            if stack:
+                stack[-1].remove(element)
+            element.clear()
+            if max_items and len(items) >= max_items:
+                break
+        elif name == 'title' and title is None and item_depth == 0:
+            title = (element.text or '').strip()
+
+    return title, items
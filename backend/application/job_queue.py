@@ -0,0 +1,293 @@
+import backend.logger as logger
+import backend.file_handler as file_handler
+import os
+import json
+import time
+import uuid
+import threading
+from collections import deque
+
+log = logger.get_logger("job_queue")
+
+QUEUE_DIR = os.path.join("data", "queue")
+JOURNAL_FILE = os.path.join(QUEUE_DIR, "journal.jsonl")
+FINISHED_STATES = ('done', 'failed')
+
+_settings = {
+    'workers': 1,
+    'max_attempts': 3,
+    'compact_after': 1000
+}
+_condition = threading.Condition()
+_steps = {}
+_keys = {}
+_pending = deque()
+_journal = None
+_journal_lines = 0
+_workers = []
+_stop_event = threading.Event()
+_on_failure = None
+
+def configure(config):
+    queue_config = config.get('job_queue', {})
+    for key in _settings:
+        _settings[key] = int(queue_config.get(key, _settings[key]))
+
+def _append(record):
+    """
+    Append one state transition to the journal and fsync it.
+
+    Each transition is a single JSON line, so a crash can at worst leave a
+    truncated last line, which replay ignores.
+    """
+    global _journal, _journal_lines
+
+    if _journal is None:
+        file_handler.ensure_directory(QUEUE_DIR)
+        _journal = open(JOURNAL_FILE, 'a', encoding='utf-8')
+
+    record['ts'] = time.time()
+    _journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+    _journal.flush()
+    os.fsync(_journal.fileno())
+    _journal_lines += 1
+
+def _apply(record):
+    op = record.get('op')
+    step_id = record.get('step_id')
+
+    if op == 'enqueue':
+        step = {
+            'id': step_id,
+            'key': record.get('key'),
+            'process_id': record.get('process_id'),
+            'payload': record.get('payload', {}),
+            'state': 'queued',
+            'attempts': record.get('attempts', 0),
+            'enqueued_at': record.get('ts'),
+            'error': None
+        }
+        _steps[step_id] = step
+        if step['key']:
+            _keys[step['key']] = step_id
+        return
+
+    step = _steps.get(step_id)
+    if not step:
+        return
+
+    if op == 'start':
+        step['state'] = 'running'
+        step['attempts'] += 1
+    elif op == 'retry':
+        step['state'] = 'queued'
+        step['error'] = record.get('error')
+    elif op == 'complete':
+        step['state'] = 'done'
+        step['result'] = record.get('result')
+    elif op == 'fail':
+        step['state'] = 'failed'
+        step['error'] = record.get('error')
+
+def _record(record):
+    _append(record)
+    _apply(record)
+
+def enqueue(process_id, payload=None, key=None):
+    """
+    Durably enqueue a workflow step.
+
+    Steps are deduplicated by idempotency key: enqueueing a key that is
+    already known returns the existing step id.
+    """
+    with _condition:
+        if key and key in _keys:
+            return _keys[key]
+
+        step_id = str(uuid.uuid4())
+        _record({'op': 'enqueue', 'step_id': step_id, 'key': key, 'process_id': process_id, 'payload': payload or {}})
+        _pending.append(step_id)
+        _condition.notify()
+        return step_id
+
+def claim(timeout=None):
+    """Take the next queued step and mark it running, or return None on timeout."""
+    with _condition:
+        deadline = time.time() + timeout if timeout is not None else None
+        while not _pending:
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return None
+            _condition.wait(remaining)
+
+        step_id = _pending.popleft()
+        _record({'op': 'start', 'step_id': step_id})
+        return dict(_steps[step_id])
+
+def complete(step_id, result=None):
+    with _condition:
+        _record({'op': 'complete', 'step_id': step_id, 'result': result})
+        _maybe_compact()
+
+def fail(step_id, error):
+    """Requeue a failed step until it reaches max_attempts, then fail it for good."""
+    with _condition:
+        step = _steps.get(step_id)
+        if step and step['attempts'] < _settings['max_attempts']:
+            _record({'op': 'retry', 'step_id': step_id, 'error': error})
+            _pending.append(step_id)
+            _condition.notify()
+            return True
+
+        _record({'op': 'fail', 'step_id': step_id, 'error': error})
+        _maybe_compact()
+        return False
+
+def get_step(step_id):
+    with _condition:
+        step = _steps.get(step_id)
+        return dict(step) if step else None
+
+def pending_steps(process_id):
+    with _condition:
+        return [
+            dict(step) for step in _steps.values()
+            if step['process_id'] == process_id and step['state'] not in FINISHED_STATES
+        ]
+
+def recover():
+    """
+    Rebuild queue state from the journal after a restart.
+
+    Steps that were running when the server stopped are requeued (so
+    execution is at-least-once) unless they already used all their
+    attempts, in which case they are failed. Returns the failed steps.
+    """
+    global _journal_lines
+
+    failed = []
+    with _condition:
+        _steps.clear()
+        _keys.clear()
+        _pending.clear()
+        _journal_lines = 0
+
+        if os.path.exists(JOURNAL_FILE):
+            with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        _apply(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+                    _journal_lines += 1
+
+        for step in sorted(_steps.values(), key=lambda step: step['enqueued_at'] or 0):
+            if step['state'] == 'queued':
+                _pending.append(step['id'])
+            elif step['state'] == 'running':
+                if step['attempts'] < _settings['max_attempts']:
+                    _record({'op': 'retry', 'step_id': step['id'], 'error': 'Interrupted by server restart'})
+                    _pending.append(step['id'])
+                else:
+                    _record({'op': 'fail', 'step_id': step['id'], 'error': 'Interrupted by server restart'})
+                    failed.append(dict(step))
+
+        _compact()
+        _condition.notify_all()
+
+    return failed
+
+def _maybe_compact():
+    if _journal_lines >= _settings['compact_after']:
+        _compact()
+
+def _compact():
+    """Rewrite the journal with only unfinished steps, replacing it atomically."""
+    global _journal, _journal_lines
+
+    file_handler.ensure_directory(QUEUE_DIR)
+    temp_file = JOURNAL_FILE + '.tmp'
+    lines = 0
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        for step in _steps.values():
+            if step['state'] in FINISHED_STATES:
+                continue
+            f.write(json.dumps({
+                'op': 'enqueue',
+                'step_id': step['id'],
+                'key': step['key'],
+                'process_id': step['process_id'],
+                'payload': step['payload'],
+                'attempts': step['attempts'],
+                'ts': step['enqueued_at']
+            }, separators=(',', ':')) + '\n')
+            lines += 1
+        f.flush()
+        os.fsync(f.fileno())
+
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+    os.replace(temp_file, JOURNAL_FILE)
+
+    for step_id in [step_id for step_id, step in _steps.items() if step['state'] in FINISHED_STATES]:
+        step = _steps.pop(step_id)
+        if step['key']:
+            _keys.pop(step['key'], None)
+    _journal_lines = lines
+
+def _worker_loop(handler):
+    while not _stop_event.is_set():
+        step = claim(timeout=0.5)
+        if not step:
+            continue
+        try:
+            complete(step['id'], handler(step))
+        except Exception as e:
+            log.warning("Step failed", extra={"fields": {"step_id": step['id'], "process_id": step['process_id'], "error": str(e)}})
+            if not fail(step['id'], str(e)) and _on_failure:
+                _on_failure(step, str(e))
+
+def start(config, handler, on_failure=None):
+    """
+    Recover the journal and start worker threads that run handler(step).
+
+    on_failure is called for steps that fail permanently, including steps
+    that ran out of attempts across restarts.
+    """
+    global _on_failure
+
+    configure(config)
+    _on_failure = on_failure
+    _stop_event.clear()
+
+    for step in recover():
+        if _on_failure:
+            _on_failure(step, 'Interrupted by server restart')
+
+    for i in range(_settings['workers']):
+        worker = threading.Thread(target=_worker_loop, args=(handler,), name=f"job-worker-{i+1}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+def stop():
+    _stop_event.set()
+    for worker in _workers:
+        worker.join(timeout=1)
+    _workers.clear()
+
+def collect_metrics():
+    with _condition:
+        return [('job_queue_pending', 'gauge', {}, len(_pending))]
+
+def stats():
+    with _condition:
+        states = {}
+        for step in _steps.values():
+            states[step['state']] = states.get(step['state'], 0) + 1
+        return {
+            'pending': len(_pending),
+            'states': states,
+            'workers': len(_workers),
+            'journal_lines': _journal_lines
+        }
@@ -1,65 +1,112 @@
+import backend.logger as logger
 import backend.file_handler as file_handler
+import backend.application.structure_index as structure_index
+import backend.application.johto_sync as johto_sync
 import requests
 import os
 import json
 import re
 from urllib.parse import urljoin, urlparse
 
+log = logger.get_logger("johto")
+
 def handle_load_johto_data(response: dict) -> dict:
-    try:
-        johto_dir = os.path.join("data", "johto")
-        file_handler.ensure_directory(johto_dir)
+    """
+    Return the cached structure index right away.
 
-        johto_url = "https://www.johto.online/data/"
+    A background sync is started when the request asks for a refresh, or
+    when nothing has been synced yet; its progress is reported by
+    get_sync_status.
+    """
+    request = response.get('request', {})
+    
+    try:
+        structure_index.ensure_loaded()
         
-        try:
-            process_directory(johto_url, johto_dir)
-            
-        except Exception as fetch_error:
-            response['status'] = 'error'
-            response['message'] = f'Error fetching files from Johto: {str(fetch_error)}'
-            return response
+        sync_status = johto_sync.get_status()
+        if request.get('refresh') or not sync_status.get('last_sync_at'):
+            johto_sync.trigger()
+            sync_status = johto_sync.get_status()
         
-        try:
-            structures_data = collect_structures()
-            
-            file_handler.ensure_directory("data")
-            
-            structures_path = os.path.join("data", "structures.json")
-            with open(structures_path, 'w', encoding='utf-8') as f:
-                json.dump(structures_data, f, indent=4)
-                
-            print(f"Saved structures data to {structures_path}")
-            
-            response['data'] = {
-                'structures': structures_data
-            }
-            
-            response['status'] = 'success'
-            response['message'] = 'Johto data downloaded and processed successfully'
-        except Exception as process_error:
-            response['status'] = 'error'
-            response['message'] = f'Error processing Johto data: {str(process_error)}'
-            return response
-            
+        response['data'] = {
+            'users': structure_index.list_users(),
+            'index': structure_index.stats(),
+            'sync': sync_status
+        }
+        
+        response['status'] = 'success'
+        response['message'] = 'Johto structure index loaded'
         return response
         
     except Exception as e:
         response['status'] = 'error'
-        response['message'] = f'Error downloading Johto data: {str(e)}'
+        response['message'] = f'Error loading Johto data: {str(e)}'
+        return response
+
+def handle_get_sync_status(response: dict) -> dict:
+    response['status'] = 'success'
+    response['data'] = {
+        'sync': johto_sync.get_status(),
+        'index': structure_index.stats()
+    }
+    return response
+
+def handle_list_structures(response: dict) -> dict:
+    request = response.get('request', {})
+    
+    try:
+        offset = max(int(request.get('offset', 0)), 0)
+        limit = min(max(int(request.get('limit', 50)), 1), 500)
+    except (TypeError, ValueError):
+        response['status'] = 'error'
+        response['message'] = 'Invalid offset or limit parameter'
+        return response
+    
+    structure_index.ensure_loaded()
+    response['status'] = 'success'
+    response['data'] = structure_index.list_structures(
+        user_id=request.get('user_id'),
+        prefix=request.get('prefix', ''),
+        offset=offset,
+        limit=limit
+    )
+    return response
+
+def handle_get_structure(response: dict) -> dict:
+    request = response.get('request', {})
+    user_id = request.get('user_id')
+    structure_id = request.get('structure_id')
+    
+    if not user_id or not structure_id:
+        response['status'] = 'error'
+        response['message'] = 'Missing user_id or structure_id parameter'
+        return response
+    
+    structure_index.ensure_loaded()
+    structure = structure_index.get_structure(user_id, structure_id)
+    if structure is None:
+        response['status'] = 'error'
+        response['message'] = 'Structure not found'
         return response
+    
+    response['status'] = 'success'
+    response['data'] = {'structure': structure}
+    return response
 
-def process_directory(url: str, local_dir: str):
-    print(f"Processing directory: {url}")
+def process_directory(url: str, local_dir: str, progress=None):
+    log.debug("Processing directory", extra={"fields": {"url": url}})
     if not url.endswith('/'):
         url += '/'
     
     file_handler.ensure_directory(local_dir)
     
-    response = requests.get(url)
+    response = requests.get(url, timeout=30)
+    
+    if progress is not None:
+        progress['directories'] += 1
     
     if response.status_code != 200:
-        print(f"Failed to access {url}: HTTP {response.status_code}")
+        log.warning("Failed to access directory", extra={"fields": {"url": url, "status": response.status_code}})
         return
     
     try:
@@ -70,9 +117,9 @@ def process_directory(url: str, local_dir: str):
                     if item.endswith('/'):
                         sub_url = urljoin(url, item)
                         sub_dir = os.path.join(local_dir, item.rstrip('/'))
-                        process_directory(sub_url, sub_dir)
+                        process_directory(sub_url, sub_dir, progress)
                     elif item.endswith('.json'):
-                        download_file(urljoin(url, item), os.path.join(local_dir, item))
+                        download_file(urljoin(url, item), os.path.join(local_dir, item), progress)
     except json.JSONDecodeError:
         links = re.findall(r'href=[\'"]?([^\'" >]+)', response.text)
         
@@ -83,70 +130,42 @@ def process_directory(url: str, local_dir: str):
             if link.endswith('/'):
                 sub_url = urljoin(url, link)
                 sub_dir = os.path.join(local_dir, link.rstrip('/'))
-                process_directory(sub_url, sub_dir)
+                process_directory(sub_url, sub_dir, progress)
             elif link.endswith('.json'):
-                download_file(urljoin(url, link), os.path.join(local_dir, link))
+                download_file(urljoin(url, link), os.path.join(local_dir, link), progress)
     
     common_files = ['data.json', 'metadata.json', 'config.json', 'info.json']
     for filename in common_files:
         file_url = urljoin(url, filename)
         file_path = os.path.join(local_dir, filename)
-        download_file(file_url, file_path)
+        download_file(file_url, file_path, progress)
 
-def download_file(url: str, local_path: str):
+def download_file(url: str, local_path: str, progress=None):
     try:
         if not url.endswith('.json'):
             return
             
-        print(f"Downloading {url} to {local_path}")
-        response = requests.get(url)
+        log.debug("Downloading file", extra={"fields": {"url": url, "path": local_path}})
+        response = requests.get(url, timeout=30)
         
         if response.status_code == 200:
+            if progress is not None:
+                progress['files'] += 1
+            
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
             
+            # Leave unchanged files untouched so the structure index can skip them
+            if os.path.exists(local_path):
+                with open(local_path, 'r', encoding='utf-8') as f:
+                    if f.read() == response.text:
+                        return
+            
             with open(local_path, 'w', encoding='utf-8') as f:
                 f.write(response.text)
-            print(f"Downloaded {url}")
+            if progress is not None:
+                progress['changed'] += 1
+            log.debug("Downloaded file", extra={"fields": {"url": url}})
         else:
-            print(f"Failed to download {url}: HTTP {response.status_code}")
+            log.warning("Failed to download file", extra={"fields": {"url": url, "status": response.status_code}})
     except Exception as e:
-        print(f"Error downloading {url}: {str(e)}")
-
-def collect_structures() -> dict:
-    result = {}
-    johto_dir = os.path.join("data", "johto")
-    users_file_path = os.path.join(johto_dir, "users.json")
-    
-    try:
-        with open(users_file_path, 'r', encoding='utf-8') as f:
-            users_data = json.load(f)
-            
-        for user in users_data.get('users', []):
-            user_id = user.get('id')
-            username = user.get('username')
-            
-            if user_id and username:
-                user_dir = os.path.join(johto_dir, "users", user_id)
-                structures_file = os.path.join(user_dir, "saved_structures.json")
-                
-                if os.path.exists(structures_file):
-                    try:
-                        with open(structures_file, 'r', encoding='utf-8') as f:
-                            structures_data = json.load(f)
-                            # Only get the "structures" key from the saved_structures.json file
-                            user_structures = structures_data.get("structures", {})
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON from {structures_file}: {str(e)}")
-                        user_structures = {}
-                else:
-                    user_structures = {}
-                
-                result[user_id] = {
-                    'username': username,
-                    'structures': user_structures
-                }
-    
-    except Exception as e:
-        print(f"Error loading users from {users_file_path}: {str(e)}")
-    
-    return result
+        log.error("Error downloading file", extra={"fields": {"url": url, "error": str(e)}})
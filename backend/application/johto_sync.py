@@ -0,0 +1,127 @@
+import backend.logger as logger
+import backend.file_handler as file_handler
+import backend.application.johto_handler as johto_handler
+import backend.application.structure_index as structure_index
+import os
+import time
+import threading
+
+log = logger.get_logger("johto_sync")
+
+JOHTO_URL = "https://www.johto.online/data/"
+JOHTO_DIR = os.path.join("data", "johto")
+
+_settings = {
+    'url': JOHTO_URL,
+    'interval': 0
+}
+_sync_lock = threading.Lock()
+_status_lock = threading.Lock()
+_stop_event = threading.Event()
+_wake_event = threading.Event()
+_scheduler_thread = None
+
+_status = {
+    'state': 'idle',
+    'started_at': None,
+    'last_sync_at': None,
+    'last_duration': None,
+    'last_error': None,
+    'last_result': None,
+    'progress': None,
+    'interval': 0
+}
+
+def configure(config):
+    _settings['url'] = config.get('johto_url', JOHTO_URL)
+    _settings['interval'] = int(config.get('johto_sync_interval', 0) or 0)
+    with _status_lock:
+        _status['interval'] = _settings['interval']
+
+def get_status():
+    with _status_lock:
+        status = dict(_status)
+        if status['progress'] is not None:
+            status['progress'] = dict(status['progress'])
+        status['running'] = status['state'] == 'running'
+        return status
+
+def _update_status(**changes):
+    with _status_lock:
+        _status.update(changes)
+
+def run_sync():
+    """
+    Crawl Johto and refresh the structure index.
+
+    Only one sync runs at a time; a call made while another sync is in
+    flight returns False immediately.
+    """
+    if not _sync_lock.acquire(blocking=False):
+        return False
+
+    _begin_sync()
+    _sync_and_release()
+    return True
+
+def trigger():
+    """Start a sync in the background unless one is already running."""
+    if not _sync_lock.acquire(blocking=False):
+        return False
+
+    _begin_sync()
+    thread = threading.Thread(target=_sync_and_release, name="johto-sync", daemon=True)
+    thread.start()
+    return True
+
+def _begin_sync():
+    progress = {'directories': 0, 'files': 0, 'changed': 0}
+    _update_status(state='running', started_at=int(time.time()), progress=progress, last_error=None)
+
+def _sync_and_release():
+    started = time.time()
+    progress = _status['progress']
+
+    try:
+        file_handler.ensure_directory(JOHTO_DIR)
+        johto_handler.process_directory(_settings['url'], JOHTO_DIR, progress)
+        result = structure_index.refresh(JOHTO_DIR)
+        log.info("Johto sync finished", extra={"fields": result})
+        _update_status(last_result=result)
+    except Exception as e:
+        log.error("Johto sync failed", extra={"fields": {"error": str(e)}})
+        _update_status(last_error=str(e))
+    finally:
+        finished = time.time()
+        _update_status(
+            state='idle',
+            last_sync_at=int(finished),
+            last_duration=round(finished - started, 3)
+        )
+        _sync_lock.release()
+
+def _scheduler_loop():
+    while not _stop_event.is_set():
+        run_sync()
+        _wake_event.wait(_settings['interval'])
+        _wake_event.clear()
+
+def start(config):
+    """Start the periodic scheduler when johto_sync_interval is positive."""
+    global _scheduler_thread
+
+    configure(config)
+    if _settings['interval'] <= 0 or _scheduler_thread is not None:
+        return False
+
+    _stop_event.clear()
+    _scheduler_thread = threading.Thread(target=_scheduler_loop, name="johto-sync-scheduler", daemon=True)
+    _scheduler_thread.start()
+    return True
+
+def stop():
+    global _scheduler_thread
+
+    _stop_event.set()
+    _wake_event.set()
+    _scheduler_thread = None
@@ -0,0 +1,140 @@
+import backend.logger as logger
+import backend.metrics as metrics
+import backend.application.search_index as search_index
+import time
+import hashlib
+import threading
+from collections import Counter
+import numpy as np
+
+log = logger.get_logger("near_duplicates")
+
+MODES = ('off', 'flag', 'skip')
+BITS = np.arange(64, dtype=np.uint64)
+# Shorter texts give unstable fingerprints and are never matched
+MIN_TOKENS = 8
+
+_settings = {
+    'inputs': 'skip',
+    'outputs': 'flag',
+    'window': 86400,
+    'capacity': 100000,
+    'max_distance': 6
+}
+_indexes = {}
+
+class FingerprintIndex:
+    """
+    The SimHash fingerprints seen in the last window seconds, in a ring of
+    fixed capacity: the oldest entry is overwritten first, so memory is
+    bounded and entries leave in the order they expire. A lookup compares
+    against every live entry with one vectorized XOR and popcount.
+    """
+
+    def __init__(self, capacity, window, max_distance):
+        self.window = window
+        self.max_distance = max_distance
+        self.fingerprints = np.zeros(capacity, dtype=np.uint64)
+        self.scopes = np.zeros(capacity, dtype=np.int64)
+        # 0 marks an empty slot
+        self.added = np.zeros(capacity, dtype=np.float64)
+        self.keys = [None] * capacity
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def find(self, fingerprint, scope, now=None):
+        """(key, distance) of the closest live entry within max_distance bits, or None."""
+        now = now or time.time()
+        with self.lock:
+            distances = np.bitwise_count(self.fingerprints ^ np.uint64(fingerprint))
+            live = (self.added > now - self.window) & (self.scopes == scope)
+            if not live.any():
+                return None
+            distances = np.where(live, distances, 64)
+            index = int(np.argmin(distances))
+            if distances[index] > self.max_distance:
+                return None
+            return self.keys[index], int(distances[index])
+
+    def add(self, fingerprint, scope, key, now=None):
+        with self.lock:
+            index = self.position
+            self.fingerprints[index] = np.uint64(fingerprint)
+            self.scopes[index] = scope
+            self.added[index] = now or time.time()
+            self.keys[index] = key
+            self.position = (index + 1) % len(self.keys)
+
+    def size(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            return int((self.added > now - self.window).sum())
+
+def configure(config):
+    dedup_config = config.get('dedup', {})
+    for kind in ('inputs', 'outputs'):
+        mode = dedup_config.get(kind, _settings[kind])
+        _settings[kind] = mode if mode in MODES else 'off'
+    for key in ('window', 'capacity', 'max_distance'):
+        _settings[key] = int(dedup_config.get(key, _settings[key]))
+    _indexes.clear()
+
+def mode(kind):
+    return _settings[kind]
+
+def _index(kind):
+    index = _indexes.get(kind)
+    if index is None:
+        index = _indexes.setdefault(kind, FingerprintIndex(_settings['capacity'], _settings['window'], _settings['max_distance']))
+    return index
+
+def scope_key(*parts):
+    """Stable 64-bit id of a scope (user, structure, node) so the index stores no strings for it."""
+    digest = hashlib.blake2b('\x1f'.join(str(part) for part in parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+def fingerprint(text):
+    """
+    64-bit SimHash of a text over word pairs, weighted by frequency; None
+    for texts too short to compare. Small edits flip few bits.
+    """
+    tokens = search_index.tokenize(text or '')
+    if len(tokens) < MIN_TOKENS:
+        return None
+    features = Counter(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+    hashes = np.array([
+        int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        for feature in features
+    ], dtype=np.uint64)
+    weights = np.array(list(features.values()), dtype=np.float64)
+    bits = ((hashes[:, None] >> BITS) & np.uint64(1)).astype(bool)
+    votes = np.where(bits, weights[:, None], -weights[:, None]).sum(axis=0)
+    return int(np.bitwise_or.reduce(np.uint64(1) << BITS[votes > 0], initial=np.uint64(0)))
+
+def check(kind, text, scope):
+    """
+    Fingerprint text and look for a near-duplicate seen in the same scope.
+
+    Returns:
+        (fingerprint, match) where match is None or a dict with
+        duplicate_of (the key it was remembered under) and similarity
+    """
+    if _settings[kind] == 'off':
+        return None, None
+    value = fingerprint(text)
+    if value is None:
+        return None, None
+    found = _index(kind).find(value, scope)
+    if found is None:
+        return value, None
+    key, distance = found
+    metrics.inc('near_duplicates_total', kind=kind, action=_settings[kind])
+    return value, {'duplicate_of': key, 'similarity': round(1 - distance / 64, 4)}
+
+def remember(kind, value, scope, key):
+    """Remember a fingerprint returned by check under key (a process or file id)."""
+    if value is not None and _settings[kind] != 'off':
+        _index(kind).add(value, scope, key)
+
+def collect_metrics():
+    return [('near_duplicate_entries', 'gauge', {'kind': kind}, index.size()) for kind, index in list(_indexes.items())]
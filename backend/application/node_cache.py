@@ -0,0 +1,57 @@
+import json
+import hashlib
+
+CONFIG_FIELDS = ('header', 'prompt')
+# Only hashed when set, so keys of nodes without them stay the same
+OPTIONAL_FIELDS = ('method', 'threshold', 'query', 'top_k', 'model')
+
+def hash_content(content):
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def hash_node_config(node):
+    config = node.get('configuration', {}) or {}
+    canonical = {field: config.get(field, '') for field in CONFIG_FIELDS}
+    canonical.update({field: config[field] for field in OPTIONAL_FIELDS if field in config})
+    canonical['type'] = (node.get('type') or '').lower()
+    return hash_content(json.dumps(canonical, sort_keys=True, separators=(',', ':')))
+
+def latest_outputs(files):
+    """Map node id to its most recent registry entry."""
+    latest = {}
+    for file_info in files:
+        node_id = file_info.get('node_id')
+        if node_id and (node_id not in latest or file_info.get('created_at', 0) >= latest[node_id].get('created_at', 0)):
+            latest[node_id] = file_info
+    return latest
+
+def output_hash(file_info):
+    return file_info.get('content_hash') or hash_content(file_info.get('content', ''))
+
+def compute_cache_key(node, upstream_node_ids, files, input_text=''):
+    """
+    Key a node execution on its configuration and the outputs it depends on.
+
+    Upstream nodes without an output (start nodes, nodes not run yet)
+    contribute a fixed marker, so the key still changes once they produce
+    output.
+    """
+    latest = latest_outputs(files)
+    upstream = []
+    for node_id in sorted(set(upstream_node_ids or [])):
+        file_info = latest.get(node_id)
+        upstream.append([node_id, output_hash(file_info) if file_info else None])
+
+    return hash_content(json.dumps({
+        'config': hash_node_config(node),
+        'upstream': upstream,
+        'input': hash_content(input_text) if input_text else None
+    }, separators=(',', ':')))
+
+def find_cached_output(cache_key, files, file_exists):
+    """Return the newest registry entry produced under cache_key whose file still exists."""
+    for file_info in reversed(files):
+        if file_info.get('cache_key') == cache_key and file_exists(file_info.get('path')):
+            return file_info
+    return None
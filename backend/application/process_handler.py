@@ -1,12 +1,36 @@
+import backend.logger as logger
 import backend.file_handler as file_handler
 import backend.llm as llm
+import backend.llm_scheduler as llm_scheduler
+import backend.prompt_templates as prompt_templates
+import backend.event_bus as event_bus
+import backend.tracing as tracing
+import backend.application.process_registry as process_registry
+import backend.application.job_queue as job_queue
+import backend.application.execute_node as node_executor
+import backend.application.choose_next_node as choose_next_node
+import backend.application.routing as routing
+import backend.application.near_duplicates as near_duplicates
+import backend.application.similarity as similarity
+import backend.application.upload_handler as upload_handler
 
 import os
 import uuid
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 
-active_processes = {}
+log = logger.get_logger("process")
+
+_process_file_lock = process_registry.process_file_lock
+# Runs routing decisions concurrently with node generation
+_speculation_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="routing-speculation")
+
+def configure(config):
+    """Size the speculation pool so every step worker can speculate at once."""
+    global _speculation_pool
+    workers = int(config.get('job_queue', {}).get('workers', 1))
+    _speculation_pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="routing-speculation")
 
 def start_process(response):
     request = response.get('request', {})
@@ -23,6 +47,41 @@ def start_process(response):
         response['message'] = 'Missing structure_data parameter'
         return response
     
+    structure_id, compiled, start_node, error = prepare_structure(structure_data)
+    if error:
+        response['status'] = 'error'
+        response['message'] = error
+        return response
+    
+    # A single explicitly started run is only flagged, never skipped
+    options = {'id': str(uuid.uuid4()), 'auto_run': bool(request.get('auto_run')), 'input': request.get('input')}
+    scope = near_duplicates.scope_key(user_id, structure_id)
+    fingerprint, match = near_duplicates.check('inputs', node_executor.format_inputs(options['input']), scope) if options['input'] else (None, None)
+    if match:
+        options['near_duplicate_of'] = match['duplicate_of']
+    else:
+        near_duplicates.remember('inputs', fingerprint, scope, options['id'])
+    process_data = create_runs(user_id, structure_id, compiled, start_node, [options])[0]
+    
+    response['status'] = 'success'
+    response['message'] = 'Process started successfully'
+    response['data'] = {
+        'process_id': process_data['id'],
+        'current_node': start_node
+    }
+    if match:
+        response['data']['near_duplicate'] = match
+    
+    return response
+
+def prepare_structure(structure_data):
+    """
+    Store and compile a structure for new runs.
+    
+    Returns:
+        (structure_id, compiled, start_node, error) where error is a message
+        when the structure cannot be run
+    """
     structure_id = structure_data.get('id', str(uuid.uuid4()))
     process_dir = get_process_directory(structure_id)
     
@@ -33,47 +92,108 @@ def start_process(response):
     connections = extract_connections(structure_data)
     
     if not nodes:
-        response['status'] = 'error'
-        response['message'] = 'No nodes found in structure'
-        return response
+        return structure_id, None, None, 'No nodes found in structure'
         
     start_node = find_start_node(nodes)
     if not start_node:
-        response['status'] = 'error'
-        response['message'] = 'No start node found in structure'
-        return response
+        return structure_id, None, None, 'No start node found in structure'
     
-    process_id = str(uuid.uuid4())
-    process_data = {
-        'id': process_id,
-        'structure_id': structure_id,
-        'user_id': user_id,
-        'status': 'running',
-        'started_at': int(time.time()),
-        'current_node_id': start_node['id'],
-        'visited_nodes': [start_node['id']],
-        'path': [{'node_id': start_node['id'], 'timestamp': int(time.time())}],
-        'nodes': nodes,
-        'connections': connections
-    }
-    
-    active_processes[process_id] = process_data
-    
-    process_file = os.path.join(process_dir, "process.json")
-    process_records = file_handler.load_data(process_file, {})
-    process_records['runs'] = process_records.get('runs', [])
-    process_records['runs'].append(process_data)
-    process_records['last_updated'] = int(time.time())
-    file_handler.save_data(process_file, process_records)
-    
-    response['status'] = 'success'
-    response['message'] = 'Process started successfully'
-    response['data'] = {
-        'process_id': process_id,
-        'current_node': start_node
-    }
-    
-    return response
+    compiled = process_registry.compile_structure(nodes, connections)
+    process_registry.save_structure_snapshot(structure_id, compiled)
+    return structure_id, compiled, start_node, None
+
+def create_runs(user_id, structure_id, compiled, start_node, run_options):
+    """
+    Register one run per entry of run_options and persist them with a
+    single process.json write. Each entry may set id, auto_run, input,
+    batch_id and near_duplicate_of.
+    """
+    runs = []
+    for options in run_options:
+        run = {
+            'id': options.get('id') or str(uuid.uuid4()),
+            'structure_id': structure_id,
+            'user_id': user_id,
+            'status': 'running',
+            'started_at': int(time.time()),
+            'current_node_id': start_node['id'],
+            'visited_nodes': [start_node['id']],
+            'path': [{'node_id': start_node['id'], 'timestamp': int(time.time())}],
+            'auto_run': bool(options.get('auto_run'))
+        }
+        if options.get('input') is not None:
+            run['input'] = options['input']
+        if options.get('batch_id'):
+            run['batch_id'] = options['batch_id']
+        if options.get('near_duplicate_of'):
+            run['near_duplicate_of'] = options['near_duplicate_of']
+        runs.append(process_registry.register(run, compiled))
+    
+    save_new_runs(structure_id, runs)
+    return runs
+
+def save_new_runs(structure_id, runs, structure=None):
+    """
+    Append new runs to process.json in one write, then announce and queue
+    them. Runs already in the file (a replayed fork) are left out. With
+    structure, the runs are registered once they are known to be new, so
+    a replay never replaces a fork that is already running.
+    """
+    process_file = os.path.join(get_process_directory(structure_id), "process.json")
+    with _process_file_lock:
+        process_records = file_handler.load_data(process_file, {})
+        process_records['runs'] = process_records.get('runs', [])
+        known = {run.get('id') for run in process_records['runs']}
+        runs = [run for run in runs if run['id'] not in known]
+        process_records['runs'].extend(process_registry.to_record(run) for run in runs)
+        process_records['last_updated'] = int(time.time())
+        file_handler.save_data(process_file, process_records)
+    
+    if structure:
+        runs = [process_registry.register(run, structure) for run in runs]
+    
+    for run in runs:
+        event_bus.publish(run['user_id'], 'process_started', {
+            'structure_id': structure_id,
+            'current_node_id': run['current_node_id'],
+            'auto_run': run['auto_run'],
+            'batch_id': run.get('batch_id'),
+            'parent_id': run.get('parent_id')
+        }, run['id'])
+        
+        if run['auto_run']:
+            enqueue_step(run)
+    return runs
+
+def fork_runs(process, structure, groups, position):
+    """
+    Start one run per group of input items from where process stands, so
+    the nodes after a similarity node run once per group rather than once
+    per item. Fork ids derive from the step, so a replayed step does not
+    fork twice.
+    """
+    forks = []
+    for index, group in enumerate(groups, 1):
+        fork = dict(process_registry.to_record(process))
+        fork.update({
+            'id': str(uuid.uuid5(uuid.NAMESPACE_OID, f"{process['id']}:{position}:{index}")),
+            'started_at': int(time.time()),
+            'visited_nodes': list(process['visited_nodes']),
+            'path': [dict(step) for step in process['path']],
+            'input': group,
+            'parent_id': process['id']
+        })
+        fork.pop('near_duplicate_of', None)
+        forks.append(fork)
+    
+    fork_ids = [fork['id'] for fork in forks]
+    forks = save_new_runs(process['structure_id'], forks, structure)
+    if process.get('batch_id'):
+        # Imported here: batch_handler builds on this module. All ids are
+        # passed, so a replay also adds forks saved before a crash
+        import backend.application.batch_handler as batch_handler
+        batch_handler.add_runs(process['structure_id'], process['batch_id'], fork_ids)
+    return forks
 
 def execute_node(response):
     """
@@ -88,63 +208,86 @@ def execute_node(response):
         response['message'] = 'Missing process_id parameter'
         return response
     
-    if process_id not in active_processes:
+    process = process_registry.get(process_id)
+    
+    if not process:
         response['status'] = 'error'
         response['message'] = 'Process not found or no longer active'
         return response
     
-    process = active_processes[process_id]
-    
     if process.get('status') != 'running':
         response['status'] = 'error'
         response['message'] = f"Process is not running (status: {process.get('status', 'unknown')})"
         return response
     
     current_node_id = process.get('current_node_id')
-    nodes = process.get('nodes', [])
-    connections = process.get('connections', [])
+    structure = process_registry.get_structure(process)
+    output_text = node_executor.latest_output_text(process['user_id'], process['structure_id'], current_node_id)
+    
+    with tracing.trace(process_id, process['structure_id'], action='advance', node_id=current_node_id):
+        result = advance_process(process, structure, output_text)
+    
+    response['status'] = 'success'
+    response['message'] = result['message']
+    response['data'] = {
+        'status': result['status'],
+        'current_node': result['current_node'],
+        'next_node': result['next_node']
+    }
+    
+    return response
+
+def advance_process(process, structure, output_text='', speculation=None, fork_groups=None, position=None):
+    """
+    Move a running process from its current node to the next one and persist it.
+    
+    output_text is the output of the current node, which routing conditions
+    and the routing decision cache look at. speculation is a future holding
+    a routing decision made while the node was executing. A forked run is
+    started from the next node for each of fork_groups (see fork_runs)
+    before the transition is persisted, so a step replayed after a crash
+    still forks them.
+    """
+    current_node_id = process.get('current_node_id')
     
     # Check if current node is end/finish node
-    current_node = None
-    for node in nodes:
-        if node.get('id') == current_node_id:
-            current_node = node
-            node_type = node.get('type', '').lower()
-            node_name = node.get('name', '').lower()
+    current_node = structure['node_index'].get(current_node_id)
+    if current_node:
+        node_type = current_node.get('type', '').lower()
+        node_name = current_node.get('name', '').lower()
+        
+        if node_type in ['finish', 'end'] or 'finish' in node_name or 'end' in node_name:
+            process['status'] = 'completed'
+            process['completed_at'] = int(time.time())
             
-            if node_type in ['finish', 'end'] or 'finish' in node_name or 'end' in node_name:
-                process['status'] = 'completed'
-                process['completed_at'] = int(time.time())
-                
-                update_process_file(process)
-                
-                response['status'] = 'success'
-                response['message'] = 'Process completed'
-                response['data'] = {
-                    'status': 'completed',
-                    'current_node': current_node,
-                    'next_node': None
-                }
-                return response
-            break
+            update_process_file(process)
+            publish_process_event(process, 'process_completed', {'current_node_id': current_node_id})
+            
+            return {
+                'message': 'Process completed',
+                'status': 'completed',
+                'current_node': current_node,
+                'next_node': None
+            }
     
     # Find the next node
-    next_node = find_next_node(current_node_id, nodes, connections)
+    with tracing.span('route', node_id=current_node_id) as span:
+        next_node = find_next_node(current_node_id, structure, process, output_text, speculation)
+        span['attrs']['next_node_id'] = next_node.get('id') if next_node else None
     
     if not next_node:
         process['status'] = 'completed'
         process['completed_at'] = int(time.time())
         
         update_process_file(process)
+        publish_process_event(process, 'process_completed', {'current_node_id': current_node_id})
         
-        response['status'] = 'success'
-        response['message'] = 'Process completed (no next node found)'
-        response['data'] = {
+        return {
+            'message': 'Process completed (no next node found)',
             'status': 'completed',
             'current_node': current_node,
             'next_node': None
         }
-        return response
     
     # Update process with next node
     process['current_node_id'] = next_node['id']
@@ -154,17 +297,130 @@ def execute_node(response):
         'timestamp': int(time.time())
     })
     
+    if fork_groups:
+        fork_runs(process, structure, fork_groups, position)
     update_process_file(process)
+    publish_process_event(process, 'node_transition', {
+        'from_node_id': current_node_id,
+        'to_node_id': next_node['id']
+    })
     
-    response['status'] = 'success'
-    response['message'] = 'Node executed successfully'
-    response['data'] = {
+    return {
+        'message': 'Node executed successfully',
         'status': 'running',
         'current_node': current_node,
         'next_node': next_node
     }
+
+def enqueue_step(process):
+    """Queue the current node of an auto-run process for the step workers."""
+    position = len(process.get('path', []))
+    return job_queue.enqueue(
+        process['id'],
+        payload={'position': position, 'node_id': process.get('current_node_id')},
+        key=f"{process['id']}:{position}"
+    )
+
+def run_step(step):
+    """
+    Execute one queued step: generate the node output, advance the process
+    and queue the following step.
     
-    return response
+    A step may run more than once after a restart. Output registration is
+    idempotent on the step key, and a step whose transition was already
+    persisted only re-queues its successor.
+    
+    A similarity node splits its input items into groups: the run goes on
+    with the first and a forked run is started for each other group.
+    """
+    process = process_registry.get(step['process_id'])
+    if not process or process.get('status') != 'running':
+        return {'skipped': True}
+    
+    position = step['payload'].get('position')
+    if len(process.get('path', [])) > position:
+        enqueue_step(process)
+        return {'skipped': True}
+    
+    structure = process_registry.get_structure(process)
+    node = structure['node_index'].get(process.get('current_node_id'))
+    with tracing.trace(process['id'], process['structure_id'], action='step', position=position, node_id=process.get('current_node_id')):
+        speculation = start_speculation(process, structure, node)
+        output_text = ''
+        groups = None
+        if node:
+            result = node_executor.execute_node_output(
+                process['user_id'],
+                process['structure_id'],
+                node,
+                idempotency_key=step['key'],
+                upstream_node_ids=structure['incoming'].get(node.get('id'), []),
+                process_id=process['id'],
+                inputs=process.get('input'),
+                batch_id=process.get('batch_id'),
+                priority=get_priority(process)
+            )
+            output_text = (result.get('file_info') or {}).get('content', '')
+            # After a similarity node the run continues with its first group
+            groups = similarity.output_groups(node, result.get('file_info'), process.get('input'))
+            if groups:
+                process['input'] = groups[0]
+        
+        result = advance_process(process, structure, output_text, speculation, groups[1:] if groups else None, position)
+    if result['status'] == 'running':
+        enqueue_step(process)
+    
+    return {'status': result['status'], 'node_id': node.get('id') if node else None}
+
+def handle_step_failure(step, error):
+    process = process_registry.get(step['process_id'])
+    if not process or process.get('status') != 'running':
+        return
+    
+    process['status'] = 'failed'
+    process['error'] = error
+    process['completed_at'] = int(time.time())
+    update_process_file(process)
+    publish_process_event(process, 'process_error', {'error': error})
+
+def publish_process_event(process, event_type, data):
+    event_bus.publish(process.get('user_id'), event_type, {
+        'status': process.get('status'),
+        'structure_id': process.get('structure_id'),
+        **data
+    }, process.get('id'))
+
+def resume_interrupted_processes():
+    """
+    Re-queue auto-run processes that were running when the server stopped
+    and have no step left in the queue. Manually stepped runs are
+    rehydrated from process.json on their next request.
+    """
+    resumed = []
+    processes_dir = os.path.join("data", "processes")
+    if not os.path.exists(processes_dir):
+        return resumed
+    
+    for structure_id in os.listdir(processes_dir):
+        process_file = os.path.join(processes_dir, structure_id, "process.json")
+        if not os.path.exists(process_file):
+            continue
+        
+        process_records = file_handler.load_data(process_file, {})
+        for run in process_records.get('runs', []):
+            if run.get('status') != 'running' or not run.get('auto_run'):
+                continue
+            if job_queue.pending_steps(run.get('id')):
+                continue
+            
+            process = process_registry.get(run.get('id'))
+            if process:
+                enqueue_step(process)
+                resumed.append(process['id'])
+    
+    if resumed:
+        log.info("Resumed interrupted processes", extra={"fields": {"count": len(resumed)}})
+    return resumed
 
 def update_process_file(process):
     """Helper function to update the process file on disk"""
@@ -173,13 +429,16 @@ def update_process_file(process):
         process_dir = get_process_directory(structure_id)
         process_file = os.path.join(process_dir, "process.json")
         if os.path.exists(process_file):
-            process_records = file_handler.load_data(process_file, {})
-            for run in process_records.get('runs', []):
-                if run.get('id') == process.get('id'):
-                    run.update(process)
-                    break
-            process_records['last_updated'] = int(time.time())
-            file_handler.save_data(process_file, process_records)
+            with tracing.span('persist_process'), _process_file_lock:
+                process_records = file_handler.load_data(process_file, {})
+                for run in process_records.get('runs', []):
+                    if run.get('id') == process.get('id'):
+                        run.update(process_registry.to_record(process))
+                        break
+                process_records['last_updated'] = int(time.time())
+                # Written through, not behind: crash recovery resumes from this
+                # file, so it must never lag the fsynced job journal
+                file_handler.save_data(process_file, process_records)
 
 def get_process_status(request):
     response = {
@@ -193,63 +452,73 @@ def get_process_status(request):
         response['message'] = 'Missing process_id parameter'
         return response
     
-    if process_id in active_processes:
-        process = active_processes[process_id]
-        
-        current_node_id = process.get('current_node_id')
-        current_node = None
-        for node in process.get('nodes', []):
-            if node.get('id') == current_node_id:
-                current_node = node
-                break
-        
-        response['status'] = 'success'
-        response['message'] = 'Process status retrieved'
+    process = process_registry.get(process_id)
+    if not process:
+        response['message'] = 'Process not found'
+        return response
+    
+    structure = process_registry.get_structure(process)
+    
+    response['status'] = 'success'
+    response['message'] = 'Process status retrieved'
+    response['data'] = {
+        'status': process.get('status', 'unknown'),
+        'current_node': structure['node_index'].get(process.get('current_node_id')),
+        'path': process.get('path', []),
+        'error': process.get('error'),
+        'memory': process_registry.memory_usage(process_id)
+    }
+    
+    return response
+
+def get_process_trace(request, user_id):
+    """
+    Return the spans recorded for a run as Chrome trace-event JSON (open
+    it in chrome://tracing or Perfetto), with total time per span name.
+    format='spans' returns the raw span records instead.
+    """
+    response = {
+        'status': 'error',
+        'message': 'Invalid process trace request'
+    }
+    
+    process_id = request.get('process_id', '')
+    if not process_id:
+        response['message'] = 'Missing process_id parameter'
+        return response
+    structure_id = request.get('structure_id')
+    if not upload_handler.SAFE_ID.match(process_id) or (structure_id and not upload_handler.SAFE_ID.match(structure_id)):
+        response['message'] = 'Invalid process_id or structure_id'
+        return response
+    
+    # Only the run's owner may read its trace; the run also decides where it is stored
+    process = process_registry.get(process_id)
+    if not process or process.get('user_id') != user_id or (structure_id and process.get('structure_id') != structure_id):
+        response['message'] = 'Process not found'
+        return response
+    structure_id = process.get('structure_id')
+    
+    spans = tracing.load_spans(structure_id, process_id)
+    response['status'] = 'success'
+    response['message'] = f"{len(spans)} spans recorded"
+    if request.get('format') == 'spans':
+        response['data'] = {'spans': spans}
+    else:
         response['data'] = {
-            'status': process.get('status', 'unknown'),
-            'current_node': current_node,
-            'path': process.get('path', []),
-            'error': process.get('error')
+            'trace': tracing.to_chrome_trace(spans, process_id),
+            'summary': tracing.summarize(spans)
         }
-    else:
-        found = False
-        processes_dir = os.path.join("data", "processes")
-        
-        if os.path.exists(processes_dir):
-            for structure_id in os.listdir(processes_dir):
-                process_dir = os.path.join(processes_dir, structure_id)
-                if os.path.isdir(process_dir):
-                    process_file = os.path.join(process_dir, "process.json")
-                    
-                    if os.path.exists(process_file):
-                        process_records = file_handler.load_data(process_file, {})
-                        
-                        for process in process_records.get('runs', []):
-                            if process.get('id') == process_id:
-                                current_node_id = process.get('current_node_id')
-                                current_node = None
-                                for node in process.get('nodes', []):
-                                    if node.get('id') == current_node_id:
-                                        current_node = node
-                                        break
-                                
-                                response['status'] = 'success'
-                                response['message'] = 'Process status retrieved from file'
-                                response['data'] = {
-                                    'status': process.get('status', 'unknown'),
-                                    'current_node': current_node,
-                                    'path': process.get('path', []),
-                                    'error': process.get('error')
-                                }
-                                found = True
-                                break
-                
-                if found:
-                    break
-        
-        if not found:
-            response['message'] = 'Process not found'
-    
+    return response
+
+def get_process_stats(response):
+    # Totals cover everyone; run ids and queued users are the caller's own
+    user_id = response.get('userid', '')
+    response['status'] = 'success'
+    response['data'] = process_registry.stats(user_id)
+    response['data']['llm'] = llm.stats()
+    response['data']['llm_scheduler'] = llm_scheduler.stats(user_id)
+    response['data']['routing'] = routing.stats()
+    response['data']['prompts'] = prompt_templates.stats()
     return response
 
 def extract_nodes(structure_data):
@@ -295,6 +564,10 @@ def extract_connections(structure_data):
             connection['from'] = connection['source']
         if 'to' not in connection and 'target' in connection:
             connection['to'] = connection['target']
+        if 'from' not in connection and 'startNode' in connection:
+            connection['from'] = connection['startNode']
+        if 'to' not in connection and 'endNode' in connection:
+            connection['to'] = connection['endNode']
     
     return connections
 
@@ -324,23 +597,80 @@ def find_finish_node(nodes):
     
     return None
 
-def find_next_node(current_node_id, nodes, connections):
-    outgoing_connections = []
-    for connection in connections:
-        if connection.get('from') == current_node_id:
-            outgoing_connections.append(connection)
+def get_priority(process):
+    return llm_scheduler.BATCH if process.get('batch_id') else llm_scheduler.INTERACTIVE
+
+def get_candidates(current_node_id, structure):
+    return [
+        structure['node_index'][connection.get('to')]
+        for connection in structure['outgoing'].get(current_node_id, [])
+        if connection.get('to') in structure['node_index']
+    ]
+
+def routing_llm(process):
+    """Return an ask_llm callback for the routing engine on behalf of process."""
+    def ask(node, options):
+        with tracing.span('routing_llm', node_id=node.get('id'), candidates=len(options)):
+            result = choose_next_node.ask_llm(node, options, process.get('user_id'), get_priority(process))
+        return result.get('next_node_id') if isinstance(result, dict) else None
+    return ask
+
+def start_speculation(process, structure, node):
+    """
+    Start the routing decision of node in the background while it executes.
+    
+    Returns a future, or None when speculation is disabled or cannot save
+    an LLM round-trip (single candidate, default connection, conditions on
+    the output, end nodes).
+    """
+    if not node or node.get('type', '').lower() in ['start', 'finish', 'end']:
+        return None
+    
+    candidates = get_candidates(node.get('id'), structure)
+    connections = structure['outgoing'].get(node.get('id'), [])
+    if not routing.should_speculate(node, candidates, connections):
+        return None
+    
+    return _speculation_pool.submit(
+        tracing.wrap(routing.speculate), node, candidates, connections, process.get('input'), routing_llm(process)
+    )
+
+def find_next_node(current_node_id, structure, process=None, output_text='', speculation=None):
+    """
+    Choose the next node through the routing engine (connection conditions,
+    decision cache, then the LLM), falling back to a random connection when
+    no decision can be made. A speculative decision is committed when the
+    routing engine confirms it.
+    """
+    outgoing_connections = structure['outgoing'].get(current_node_id, [])
     
     if not outgoing_connections:
         return None
     
+    candidates = get_candidates(current_node_id, structure)
+    current_node = structure['node_index'].get(current_node_id, {})
+    process = process or {}
+    
+    decision = None
+    if speculation:
+        try:
+            speculative = speculation.result()
+        except Exception as e:
+            log.warning("Speculative routing failed", extra={"fields": {"node_id": current_node_id, "error": str(e)}})
+            speculative = None
+        decision = routing.confirm(speculative, current_node, candidates, outgoing_connections, output_text, process.get('input'))
+    
+    if not decision:
+        decision = routing.choose(current_node, candidates, outgoing_connections, output_text, process.get('input'), routing_llm(process))
+    if decision:
+        tracing.add_attributes(routing_source=decision['source'], speculative=bool(decision.get('speculative')))
+        return structure['node_index'].get(decision['next_node_id'])
+    
+    tracing.add_attributes(routing_source='random')
     selected_connection = random.choice(outgoing_connections)
     next_node_id = selected_connection.get('to')
     
-    for node in nodes:
-        if node.get('id') == next_node_id:
-            return node
-    
-    return None
+    return structure['node_index'].get(next_node_id)
 
 def handle_process_request(request):
     response = {
@@ -0,0 +1,268 @@
+import backend.file_handler as file_handler
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+PROCESSES_DIR = os.path.join("data", "processes")
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+RUN_FIELDS = (
+    'id', 'structure_id', 'user_id', 'status', 'started_at', 'completed_at',
+    'current_node_id', 'visited_nodes', 'path', 'error', 'structure_hash', 'auto_run',
+    'input', 'batch_id', 'near_duplicate_of', 'parent_id'
+)
+
+_settings = {
+    'max_runs': 1000,
+    'finished_ttl': 600,
+    # Running manual runs (stepped from the frontend) untouched this long are evicted too
+    'idle_ttl': 3600
+}
+_lock = threading.RLock()
+# Guards read-modify-write cycles on process.json files
+process_file_lock = threading.RLock()
+_runs = OrderedDict()
+_structures = {}
+_structure_refs = {}
+# Structure of each registered run, so rehydrating it needs no scan
+_locations = {}
+
+def configure(config):
+    registry_config = config.get('process_registry', {})
+    _settings['max_runs'] = int(registry_config.get('max_runs', _settings['max_runs']))
+    _settings['finished_ttl'] = int(registry_config.get('finished_ttl', _settings['finished_ttl']))
+    _settings['idle_ttl'] = int(registry_config.get('idle_ttl', _settings['idle_ttl']))
+
+def hash_structure(nodes, connections):
+    canonical = json.dumps({'nodes': nodes, 'connections': connections}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def compile_structure(nodes, connections, structure_hash=None):
+    """
+    Return the shared compiled form of a structure.
+
+    Runs of the same structure reference one compiled structure (nodes,
+    node lookup by id, outgoing connections and upstream node ids per node)
+    instead of each holding their own copy.
+    """
+    structure_hash = structure_hash or hash_structure(nodes, connections)
+
+    with _lock:
+        compiled = _structures.get(structure_hash)
+        if compiled:
+            return compiled
+
+        outgoing = {}
+        incoming = {}
+        for connection in connections:
+            outgoing.setdefault(connection.get('from'), []).append(connection)
+            incoming.setdefault(connection.get('to'), []).append(connection.get('from'))
+
+        compiled = {
+            'hash': structure_hash,
+            'nodes': nodes,
+            'connections': connections,
+            'node_index': {node.get('id'): node for node in nodes},
+            'outgoing': outgoing,
+            'incoming': incoming
+        }
+        _structures[structure_hash] = compiled
+        _structure_refs.setdefault(structure_hash, 0)
+        return compiled
+
+def get_structure_file(structure_id, structure_hash):
+    return os.path.join(PROCESSES_DIR, structure_id, "structures", f"{structure_hash}.json")
+
+def save_structure_snapshot(structure_id, compiled):
+    """Persist the nodes and connections of a compiled structure once per hash."""
+    structure_file = get_structure_file(structure_id, compiled['hash'])
+    if not os.path.exists(structure_file):
+        file_handler.save_data(structure_file, {
+            'nodes': compiled['nodes'],
+            'connections': compiled['connections']
+        })
+    return structure_file
+
+def to_record(run):
+    return {field: run.get(field) for field in RUN_FIELDS if field in run}
+
+def _release_structure(structure_hash):
+    _structure_refs[structure_hash] = _structure_refs.get(structure_hash, 1) - 1
+    if _structure_refs[structure_hash] <= 0:
+        _structure_refs.pop(structure_hash, None)
+        _structures.pop(structure_hash, None)
+
+def register(run, compiled):
+    """Add a run to the registry; the run keeps only a reference to compiled."""
+    run = to_record(run)
+    run['structure_hash'] = compiled['hash']
+    run['last_access'] = time.time()
+
+    with _lock:
+        _structures.setdefault(compiled['hash'], compiled)
+        _structure_refs[compiled['hash']] = _structure_refs.get(compiled['hash'], 0) + 1
+        previous = _runs.pop(run['id'], None)
+        if previous:
+            _release_structure(previous.get('structure_hash'))
+        _runs[run['id']] = run
+        _locations[run['id']] = run['structure_id']
+
+    evict(keep=run['id'])
+    return run
+
+def get_structure(run):
+    return _structures.get(run.get('structure_hash'))
+
+def get(process_id):
+    """Return the in-memory run, rehydrating it from disk if it was evicted."""
+    with _lock:
+        run = _runs.get(process_id)
+        if run:
+            run['last_access'] = time.time()
+            _runs.move_to_end(process_id)
+            return run
+
+    record = load_run_record(process_id)
+    if not record:
+        return None
+
+    compiled = _load_compiled_structure(record)
+    if not compiled:
+        return None
+
+    return register(record, compiled)
+
+def _load_compiled_structure(record):
+    structure_hash = record.get('structure_hash')
+    if structure_hash:
+        with _lock:
+            if structure_hash in _structures:
+                return _structures[structure_hash]
+        snapshot = file_handler.load_data(get_structure_file(record.get('structure_id', ''), structure_hash))
+        if snapshot:
+            return compile_structure(snapshot.get('nodes', []), snapshot.get('connections', []), structure_hash)
+
+    # Records written before the registry existed carry their own node copies
+    if 'nodes' in record:
+        return compile_structure(record.get('nodes', []), record.get('connections', []))
+    return None
+
+def load_run_record(process_id):
+    """Find a run record on disk, using the known location of a registered run before scanning."""
+    structure_ids = []
+    with _lock:
+        if process_id in _locations:
+            structure_ids.append(_locations[process_id])
+
+    if not structure_ids and os.path.exists(PROCESSES_DIR):
+        structure_ids = os.listdir(PROCESSES_DIR)
+
+    for structure_id in structure_ids:
+        process_file = os.path.join(PROCESSES_DIR, structure_id, "process.json")
+        if not os.path.exists(process_file):
+            continue
+        with process_file_lock:
+            process_records = file_handler.load_data(process_file, {})
+        for run in process_records.get('runs', []):
+            if run.get('id') == process_id:
+                return run
+    return None
+
+def evict(now=None, keep=None):
+    """
+    Drop finished runs past their TTL and running manual runs idle for
+    idle_ttl, then least recently used finished runs while the registry
+    holds more than max_runs. Evicted runs are already persisted in
+    process.json and are rehydrated by get(). Auto runs still running
+    stay, their steps hold them.
+    """
+    now = now or time.time()
+    evicted = []
+
+    with _lock:
+        for process_id, run in list(_runs.items()):
+            if process_id == keep:
+                continue
+            if run.get('status') in FINISHED_STATUSES:
+                idle_since = max(run.get('completed_at') or 0, run.get('last_access') or 0)
+                if now - idle_since >= _settings['finished_ttl']:
+                    evicted.append(process_id)
+            elif not run.get('auto_run') and now - (run.get('last_access') or 0) >= _settings['idle_ttl']:
+                evicted.append(process_id)
+
+        overflow = len(_runs) - len(evicted) - _settings['max_runs']
+        if overflow > 0:
+            for process_id, run in _runs.items():
+                if overflow <= 0:
+                    break
+                if process_id == keep or process_id in evicted or run.get('status') not in FINISHED_STATUSES:
+                    continue
+                evicted.append(process_id)
+                overflow -= 1
+
+        for process_id in evicted:
+            run = _runs.pop(process_id)
+            _locations.pop(process_id, None)
+            _release_structure(run.get('structure_hash'))
+
+    return evicted
+
+def estimate_size(value, seen=None):
+    """Approximate the deep memory footprint of a JSON-like value in bytes."""
+    seen = seen if seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item, seen) for item in value)
+    return size
+
+def memory_usage(process_id):
+    with _lock:
+        run = _runs.get(process_id)
+        if not run:
+            return None
+        compiled = _structures.get(run.get('structure_hash'))
+        return {
+            'run_bytes': estimate_size(run),
+            'shared_structure_bytes': estimate_size(compiled) if compiled else 0,
+            'structure_shared_by': _structure_refs.get(run.get('structure_hash'), 0)
+        }
+
+def collect_metrics():
+    with _lock:
+        active = sum(1 for run in _runs.values() if run.get('status') not in FINISHED_STATUSES)
+        return [
+            ('process_runs_active', 'gauge', {}, active),
+            ('process_runs_registered', 'gauge', {}, len(_runs))
+        ]
+
+def stats(user_id=None):
+    """Registry counts; the per-run list is limited to user_id's runs when given."""
+    with _lock:
+        runs = [
+            {
+                'id': process_id,
+                'status': run.get('status'),
+                'run_bytes': estimate_size(run)
+            }
+            for process_id, run in _runs.items()
+            if user_id is None or run.get('user_id') == user_id
+        ]
+        return {
+            'runs': runs,
+            'active_runs': sum(1 for run in _runs.values() if run.get('status') not in FINISHED_STATUSES),
+            'total_runs': len(_runs),
+            'compiled_structures': len(_structures),
+            'structure_bytes': sum(estimate_size(compiled) for compiled in _structures.values()),
+            'max_runs': _settings['max_runs'],
+            'finished_ttl': _settings['finished_ttl'],
+            'idle_ttl': _settings['idle_ttl']
+        }
@@ -1,12 +1,16 @@
+import backend.logger as logger
 import json
+import logging
 
-def refine_response(llm_response):
+log = logger.get_logger("refinement")
+
+def refine_response(llm_response, marker='<|im_assistant|>'):
     refinement_steps = []
     refinement_steps.append(llm_response.text)
 
     value = llm_response.text
     try:
-        value = value.split('<|im_assistant|>', 1)[1].strip()
+        value = value.split(marker, 1)[1].strip()
         if '<|im_' in value:
             value = value.split('<|im_')[0].strip()
     except Exception as e:
@@ -36,13 +40,7 @@ def refine_response(llm_response):
 
     refinement_steps.append(value)
     
-    print('-' * 20)
-    print("Refinement Steps:")
-    for step in refinement_steps:
-        print('-' * 10)
-        print('Step number:', refinement_steps.index(step) + 1)
-        print('-' * 10)
-        print(step)
-    print('-' * 20)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Refined LLM response", extra={"fields": {"steps": [str(step) for step in refinement_steps]}})
 
     return value
\ No newline at end of file
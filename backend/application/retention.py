@@ -0,0 +1,483 @@
+import backend.logger as logger
+import backend.file_handler as file_handler
+import backend.metrics as metrics
+import backend.tracing as tracing
+import backend.structure_interpreter as structure_interpreter
+import backend.application.process_registry as process_registry
+import io
+import os
+import json
+import gzip
+import time
+import uuid
+import tarfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logger.get_logger("retention")
+
+PROCESSES_DIR = process_registry.PROCESSES_DIR
+USERS_DIR = os.path.join("data", "users")
+POLICY_FILE = os.path.join("data", "retention", "policies.json")
+POLICY_FIELDS = ('keep_runs', 'max_age_days', 'max_bytes')
+ARCHIVE_EXTENSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+MAX_QUERY_LIMIT = 1000
+
+_settings = {
+    'interval': 3600,
+    'compression': 'gzip',
+    # Seconds to sleep between structures, so a pass never hogs the disk
+    'pause': 0.05,
+    'keep_runs': 500,
+    'max_age_days': 30,
+    'max_bytes': 0,
+    'old_output_days': 7
+}
+_stop_event = threading.Event()
+_thread = None
+
+def configure(config):
+    retention_config = config.get('retention', {})
+    for key in ('interval', 'keep_runs', 'max_age_days', 'max_bytes', 'old_output_days'):
+        _settings[key] = int(retention_config.get(key, _settings[key]))
+    _settings['pause'] = float(retention_config.get('pause', _settings['pause']))
+    compression = retention_config.get('compression', _settings['compression'])
+    if compression == 'zstd' and zstandard is None:
+        log.warning("zstandard is not installed, archiving with gzip")
+        compression = 'gzip'
+    _settings['compression'] = compression if compression in ARCHIVE_EXTENSIONS else 'gzip'
+
+def resolve_policy(policies, user_id, structure_id):
+    """The configured defaults, overridden by the user's policy and then the structure's."""
+    policy = {field: _settings[field] for field in POLICY_FIELDS}
+    policy.update(policies.get('users', {}).get(user_id or '', {}))
+    policy.update(policies.get('structures', {}).get(f"{user_id}/{structure_id}", {}))
+    return policy
+
+def get_archive_directory(structure_id, user_id):
+    return os.path.join(PROCESSES_DIR, structure_id, "archive", user_id or "shared")
+
+def open_archive(path, mode):
+    """Open a run archive for text reading ('r') or writing ('w'); the extension picks the codec."""
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to open {path}")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor(level=10).stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+
+def _run_time(run):
+    return run.get('completed_at') or run.get('started_at') or 0
+
+def select_runs(runs, structure_id, policies, now):
+    """
+    Split the runs of a process.json into those to keep and those to
+    archive: finished runs past each owner's keep_runs newest or older
+    than max_age_days. Unfinished runs, and finished runs of a batch that
+    still has unfinished runs, are always kept.
+    """
+    active_batches = {
+        run['batch_id'] for run in runs
+        if run.get('batch_id') and run.get('status') not in process_registry.FINISHED_STATUSES
+    }
+    finished = {}
+    for run in runs:
+        if run.get('status') in process_registry.FINISHED_STATUSES and run.get('batch_id') not in active_batches:
+            finished.setdefault(run.get('user_id'), []).append(run)
+
+    archived_ids = set()
+    for user_id, user_runs in finished.items():
+        policy = resolve_policy(policies, user_id, structure_id)
+        user_runs.sort(key=_run_time, reverse=True)
+        for position, run in enumerate(user_runs):
+            too_many = policy['keep_runs'] > 0 and position >= policy['keep_runs']
+            too_old = policy['max_age_days'] > 0 and now - _run_time(run) > policy['max_age_days'] * 86400
+            if too_many or too_old:
+                archived_ids.add(run.get('id'))
+
+    keep = [run for run in runs if run.get('id') not in archived_ids]
+    archive = [run for run in runs if run.get('id') in archived_ids]
+    return keep, archive
+
+def compact_run(structure_id, run):
+    """
+    Replace the node and connection copies of a run written before the
+    process registry existed with a reference to a shared snapshot.
+    Returns True when the run changed.
+    """
+    if 'nodes' not in run:
+        return False
+    nodes = run.pop('nodes', [])
+    connections = run.pop('connections', [])
+    structure_hash = process_registry.hash_structure(nodes, connections)
+    structure_file = process_registry.get_structure_file(structure_id, structure_hash)
+    if not os.path.exists(structure_file):
+        file_handler.save_data(structure_file, {'nodes': nodes, 'connections': connections})
+    run['structure_hash'] = structure_hash
+    return True
+
+def write_archive(structure_id, user_id, runs):
+    """
+    Write runs, each with the spans of its trace, to a new compressed
+    JSON lines archive and add it to the directory's index.
+    """
+    directory = get_archive_directory(structure_id, user_id)
+    file_handler.ensure_directory(directory)
+    name = f"runs-{int(time.time())}-{uuid.uuid4().hex[:8]}.jsonl.{ARCHIVE_EXTENSIONS[_settings['compression']]}"
+    path = os.path.join(directory, name)
+    temp_file = path + '.tmp'
+
+    raw_bytes = 0
+    with open_archive(temp_file, 'w') as f:
+        for run in runs:
+            line = json.dumps({**run, 'trace': tracing.load_spans(structure_id, run.get('id'))}, separators=(',', ':'), default=str) + '\n'
+            raw_bytes += len(line)
+            f.write(line)
+    os.replace(temp_file, path)
+
+    entry = {
+        'file': name,
+        'runs': len(runs),
+        'from': min(run.get('started_at') or 0 for run in runs),
+        'to': max(_run_time(run) for run in runs),
+        'bytes': os.path.getsize(path),
+        'raw_bytes': raw_bytes,
+        'created_at': int(time.time())
+    }
+
+    def add_entry(index):
+        index['archives'].append(entry)
+        return index
+
+    file_handler.update_data(os.path.join(directory, "index.json"), add_entry, {'archives': []})
+    return entry
+
+def archive_runs(structure_id, policies, now=None):
+    """
+    Move the runs of one structure that its owners' policies no longer
+    keep out of process.json into archives. Returns the number archived.
+    """
+    now = now or time.time()
+    process_file = os.path.join(PROCESSES_DIR, structure_id, "process.json")
+    if not os.path.exists(process_file):
+        return 0
+
+    # Choose under the lock, but compress and read traces outside it, so a
+    # large backlog does not hold up step transitions and new runs
+    with process_registry.process_file_lock:
+        runs = file_handler.load_data(process_file, {}).get('runs', [])
+    # Writes the shared structure snapshots, so compacting again below is cheap
+    compacted = sum(compact_run(structure_id, run) for run in runs)
+    _, archive = select_runs(runs, structure_id, policies, now)
+    if not archive and not compacted:
+        return 0
+
+    by_user = {}
+    for run in archive:
+        by_user.setdefault(run.get('user_id'), []).append(run)
+    # Archives are written before the runs leave process.json: a crash in
+    # between duplicates runs in the archive (queries skip repeats)
+    # rather than losing them
+    for user_id, user_runs in by_user.items():
+        write_archive(structure_id, user_id, user_runs)
+
+    archived_ids = {run.get('id') for run in archive}
+    with process_registry.process_file_lock:
+        records = file_handler.load_data(process_file, {})
+        records['runs'] = [run for run in records.get('runs', []) if run.get('id') not in archived_ids]
+        for run in records['runs']:
+            compact_run(structure_id, run)
+        records['last_updated'] = int(time.time())
+        file_handler.save_data(process_file, records)
+
+    for run in archive:
+        trace_file = tracing.get_trace_file(structure_id, run.get('id'))
+        if os.path.exists(trace_file):
+            os.remove(trace_file)
+    if archive:
+        metrics.inc('retention_runs_archived_total', len(archive))
+    return len(archive)
+
+def pack_old_outputs(user_id, structure_id, now=None):
+    """
+    Pack the files delete_all_output_files moved to old/ into one
+    compressed tarball once they are old_output_days old.
+    """
+    now = now or time.time()
+    old_dir = os.path.join(USERS_DIR, user_id, structure_id, "old")
+    if not os.path.isdir(old_dir) or _settings['old_output_days'] <= 0:
+        return 0
+
+    cutoff = now - _settings['old_output_days'] * 86400
+    names = sorted(
+        entry.name for entry in os.scandir(old_dir)
+        if entry.is_file() and not entry.name.startswith('outputs-') and entry.stat().st_mtime < cutoff
+    )
+    if not names:
+        return 0
+
+    extension = ARCHIVE_EXTENSIONS[_settings['compression']]
+    path = os.path.join(old_dir, f"outputs-{int(now)}-{uuid.uuid4().hex[:8]}.tar.{extension}")
+    temp_file = path + '.tmp'
+    try:
+        if extension == 'zst':
+            with open(temp_file, 'wb') as raw, zstandard.ZstdCompressor(level=10).stream_writer(raw) as stream:
+                with tarfile.open(fileobj=stream, mode='w|') as tar:
+                    for name in names:
+                        tar.add(os.path.join(old_dir, name), arcname=name)
+        else:
+            with tarfile.open(temp_file, 'w:gz') as tar:
+                for name in names:
+                    tar.add(os.path.join(old_dir, name), arcname=name)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    for name in names:
+        os.remove(os.path.join(old_dir, name))
+    metrics.inc('retention_files_packed_total', len(names))
+    return len(names)
+
+def enforce_budget(user_id, structure_id, max_bytes):
+    """Delete the oldest run archives and output packs until they fit in max_bytes."""
+    if max_bytes <= 0:
+        return 0
+
+    directory = get_archive_directory(structure_id, user_id)
+    index_file = os.path.join(directory, "index.json")
+    candidates = [
+        (entry['created_at'], entry['bytes'], 'runs', entry['file'])
+        for entry in (file_handler.load_data(index_file, {}) or {}).get('archives', [])
+    ]
+    old_dir = os.path.join(USERS_DIR, user_id, structure_id, "old")
+    if os.path.isdir(old_dir):
+        candidates.extend(
+            (entry.stat().st_mtime, entry.stat().st_size, 'outputs', entry.path)
+            for entry in os.scandir(old_dir) if entry.name.startswith('outputs-') and not entry.name.endswith('.tmp')
+        )
+
+    total = sum(size for _, size, _, _ in candidates)
+    deleted = 0
+    removed = set()
+    for _, size, kind, name in sorted(candidates):
+        if total <= max_bytes:
+            break
+        path = os.path.join(directory, name) if kind == 'runs' else name
+        if os.path.exists(path):
+            os.remove(path)
+        if kind == 'runs':
+            removed.add(name)
+        total -= size
+        deleted += 1
+
+    if removed:
+        def drop_entries(index):
+            index['archives'] = [entry for entry in index['archives'] if entry['file'] not in removed]
+            return index
+
+        file_handler.update_data(index_file, drop_entries, {'archives': []})
+    if deleted:
+        metrics.inc('retention_archives_deleted_total', deleted)
+        log.info("Retention budget enforced", extra={"fields": {
+            "user_id": user_id, "structure_id": structure_id, "deleted": deleted, "bytes": total
+        }})
+    return deleted
+
+def _owners(structure_id):
+    """Users with archives of the structure."""
+    archive_dir = os.path.join(PROCESSES_DIR, structure_id, "archive")
+    return os.listdir(archive_dir) if os.path.isdir(archive_dir) else []
+
+def run_pass(now=None):
+    """
+    One retention pass over every structure: archive runs, pack old
+    outputs and enforce byte budgets, pausing between structures.
+    Returns counts of what was done.
+    """
+    now = now or time.time()
+    started = time.perf_counter()
+    policies = file_handler.load_data(POLICY_FILE, {}) or {}
+    totals = {'runs_archived': 0, 'files_packed': 0, 'archives_deleted': 0}
+
+    structure_ids = os.listdir(PROCESSES_DIR) if os.path.isdir(PROCESSES_DIR) else []
+    for structure_id in structure_ids:
+        if _stop_event.is_set():
+            break
+        try:
+            totals['runs_archived'] += archive_runs(structure_id, policies, now)
+            for user_id in _owners(structure_id):
+                totals['archives_deleted'] += enforce_budget(user_id, structure_id, resolve_policy(policies, user_id, structure_id)['max_bytes'])
+        except Exception as e:
+            log.error("Retention failed for structure", extra={"fields": {"structure_id": structure_id, "error": str(e)}})
+        _stop_event.wait(_settings['pause'])
+
+    user_ids = os.listdir(USERS_DIR) if os.path.isdir(USERS_DIR) else []
+    for user_id in user_ids:
+        user_dir = os.path.join(USERS_DIR, user_id)
+        if _stop_event.is_set() or not os.path.isdir(user_dir):
+            continue
+        for structure_id in os.listdir(user_dir):
+            if not os.path.isdir(os.path.join(user_dir, structure_id, "old")):
+                continue
+            try:
+                packed = pack_old_outputs(user_id, structure_id, now)
+                totals['files_packed'] += packed
+                if packed:
+                    totals['archives_deleted'] += enforce_budget(user_id, structure_id, resolve_policy(policies, user_id, structure_id)['max_bytes'])
+            except Exception as e:
+                log.error("Packing old outputs failed", extra={"fields": {"user_id": user_id, "structure_id": structure_id, "error": str(e)}})
+            _stop_event.wait(_settings['pause'])
+
+    metrics.observe('retention_pass_seconds', time.perf_counter() - started)
+    if any(totals.values()):
+        log.info("Retention pass finished", extra={"fields": totals})
+    return totals
+
+def query_archive(user_id, structure_id, process_id=None, status=None, batch_id=None, since=None, until=None, limit=100, include_trace=False):
+    """
+    Archived runs of a user's structure, newest archive first, filtered
+    on the run fields given. Only archives whose time range overlaps
+    since/until are opened; lines are streamed, never loaded whole.
+    """
+    directory = get_archive_directory(structure_id, user_id)
+    index = file_handler.load_data(os.path.join(directory, "index.json"), {}) or {}
+    runs, seen, scanned = [], set(), 0
+    for entry in sorted(index.get('archives', []), key=lambda entry: entry['to'], reverse=True):
+        if (since and entry['to'] < since) or (until and entry['from'] > until):
+            continue
+        scanned += 1
+        with open_archive(os.path.join(directory, entry['file']), 'r') as f:
+            for line in f:
+                # Cheap text test before parsing the line
+                if process_id and process_id not in line:
+                    continue
+                run = json.loads(line)
+                if run.get('id') in seen:
+                    continue
+                if ((process_id and run.get('id') != process_id) or (status and run.get('status') != status)
+                        or (batch_id and run.get('batch_id') != batch_id)
+                        or (since and _run_time(run) < since) or (until and _run_time(run) > until)):
+                    continue
+                seen.add(run.get('id'))
+                if not include_trace:
+                    run.pop('trace', None)
+                runs.append(run)
+                if len(runs) >= limit:
+                    return runs, scanned
+    return runs, scanned
+
+def handle_get_archived_runs(response):
+    """Query the archived runs of a structure for the current user."""
+    request = response.get('request', {})
+    user_id = response.get('userid', '')
+    structure_id = request.get('structure_id')
+
+    if not structure_id:
+        response['status'] = 'error'
+        response['message'] = 'Missing structure_id parameter'
+        return response
+    if not structure_interpreter.SAFE_ID.match(str(structure_id)):
+        response['status'] = 'error'
+        response['message'] = 'Invalid structure_id'
+        return response
+
+    try:
+        limit = int(request.get('limit') or 100)
+        since = float(request['since']) if request.get('since') is not None else None
+        until = float(request['until']) if request.get('until') is not None else None
+    except (TypeError, ValueError):
+        response['status'] = 'error'
+        response['message'] = 'limit, since and until must be numbers'
+        return response
+
+    runs, scanned = query_archive(
+        user_id,
+        structure_id,
+        process_id=request.get('process_id'),
+        status=request.get('status'),
+        batch_id=request.get('batch_id'),
+        since=since,
+        until=until,
+        limit=min(max(limit, 1), MAX_QUERY_LIMIT),
+        include_trace=bool(request.get('include_trace'))
+    )
+    response['status'] = 'success'
+    response['message'] = f"{len(runs)} archived runs"
+    response['data'] = {'runs': runs, 'archives_scanned': scanned}
+    return response
+
+def handle_set_retention_policy(response):
+    """
+    Set the retention policy of the current user, or of one of their
+    structures when structure_id is given. Fields set to null fall back
+    to the wider policy.
+    """
+    request = response.get('request', {})
+    user_id = response.get('userid', '')
+    structure_id = request.get('structure_id')
+
+    changes = {}
+    for field in POLICY_FIELDS:
+        if field not in request:
+            continue
+        value = request[field]
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+            response['status'] = 'error'
+            response['message'] = f'{field} must be a non-negative integer or null'
+            return response
+        changes[field] = value
+
+    scope, key = ('structures', f"{user_id}/{structure_id}") if structure_id else ('users', user_id)
+
+    def apply(policies):
+        policy = policies.setdefault(scope, {}).setdefault(key, {})
+        for field, value in changes.items():
+            if value is None:
+                policy.pop(field, None)
+            else:
+                policy[field] = value
+        if not policy:
+            del policies[scope][key]
+        return policies
+
+    policies = file_handler.update_data(POLICY_FILE, apply, {})
+    response['status'] = 'success'
+    response['message'] = 'Retention policy updated'
+    response['data'] = {'policy': resolve_policy(policies, user_id, structure_id)}
+    return response
+
+def _loop():
+    while not _stop_event.wait(_settings['interval']):
+        try:
+            run_pass()
+        except Exception as e:
+            log.error("Retention pass failed", extra={"fields": {"error": str(e)}})
+
+def start(config):
+    """Start periodic retention passes when retention.interval is positive."""
+    global _thread
+
+    configure(config)
+    if _settings['interval'] <= 0 or _thread is not None:
+        return False
+
+    _stop_event.clear()
+    _thread = threading.Thread(target=_loop, name="retention", daemon=True)
+    _thread.start()
+    return True
+
+def stop():
+    global _thread
+
+    _stop_event.set()
+    _thread = None
@@ -0,0 +1,333 @@
+import backend.logger as logger
+import backend.application.node_cache as node_cache
+import re
+import json
+import threading
+from collections import OrderedDict
+
+log = logger.get_logger("routing")
+
+SOURCES = ('single', 'rule', 'default', 'cache', 'llm')
+
+_settings = {
+    'cache_size': 5000,
+    'speculative': True
+}
+_lock = threading.Lock()
+_decisions = OrderedDict()
+_metrics = {
+    'decisions': {source: 0 for source in SOURCES},
+    'llm_errors': 0,
+    'cache_evictions': 0,
+    'speculations': 0,
+    'speculations_committed': 0,
+    'speculations_discarded': 0
+}
+
+def configure(config):
+    routing_config = config.get('routing', {})
+    _settings['cache_size'] = int(routing_config.get('cache_size', _settings['cache_size']))
+    _settings['speculative'] = bool(routing_config.get('speculative', _settings['speculative']))
+
+def connection_target(connection):
+    return connection.get('to') or connection.get('target') or connection.get('endNode')
+
+def get_condition(connection):
+    return connection.get('condition') or (connection.get('configuration') or {}).get('condition')
+
+def build_context(output_text='', inputs=None):
+    """
+    Collect what conditions can test: the text of the upstream output and
+    the run input, plus fields of either when they are JSON objects.
+    """
+    fields = {}
+    if isinstance(inputs, dict):
+        fields['input'] = inputs
+        fields.update(inputs)
+    if isinstance(output_text, str) and output_text.strip().startswith('{'):
+        try:
+            parsed = json.loads(output_text)
+            if isinstance(parsed, dict):
+                fields.update(parsed)
+        except json.JSONDecodeError:
+            pass
+
+    text = output_text if isinstance(output_text, str) else json.dumps(output_text)
+    if inputs is not None:
+        input_text = inputs if isinstance(inputs, str) else json.dumps(inputs, sort_keys=True)
+        text = f"{text}\n{input_text}" if text else input_text
+    return {'text': text or '', 'fields': fields}
+
+def lookup_field(fields, path):
+    value = fields
+    for part in str(path).split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def evaluate_condition(condition, context):
+    """
+    Evaluate a declarative connection condition.
+
+    Supported forms:
+        {"type": "keyword", "values": [...], "match": "any" | "all", "field": optional}
+        {"type": "regex", "pattern": "...", "ignore_case": true, "field": optional}
+        {"type": "equals", "field": "a.b", "value": ...}
+        {"type": "all" | "any", "conditions": [...]}
+        {"type": "not", "condition": {...}}
+    Keyword and regex conditions test the upstream output text unless a
+    field is named. "default" conditions never match here; they are used
+    when no other connection matches.
+    """
+    if not isinstance(condition, dict):
+        return False
+
+    condition_type = condition.get('type', '').lower()
+
+    if condition_type in ('all', 'any'):
+        results = (evaluate_condition(sub, context) for sub in condition.get('conditions', []))
+        return all(results) if condition_type == 'all' else any(results)
+
+    if condition_type == 'not':
+        return not evaluate_condition(condition.get('condition'), context)
+
+    if condition_type == 'equals':
+        return lookup_field(context['fields'], condition.get('field', '')) == condition.get('value')
+
+    if 'field' in condition:
+        subject = lookup_field(context['fields'], condition['field'])
+        subject = '' if subject is None else subject if isinstance(subject, str) else json.dumps(subject)
+    else:
+        subject = context['text']
+
+    if condition_type == 'keyword':
+        values = condition.get('values') or ([condition['value']] if condition.get('value') else [])
+        if not condition.get('case_sensitive'):
+            subject = subject.lower()
+            values = [str(value).lower() for value in values]
+        found = [str(value) in subject for value in values]
+        if not found:
+            return False
+        return all(found) if condition.get('match') == 'all' else any(found)
+
+    if condition_type == 'regex':
+        flags = re.IGNORECASE if condition.get('ignore_case', True) else 0
+        try:
+            return re.search(condition.get('pattern', ''), subject, flags) is not None
+        except re.error as e:
+            log.warning("Invalid routing pattern", extra={"fields": {"pattern": condition.get('pattern'), "error": str(e)}})
+            return False
+
+    return False
+
+def match_rules(candidates, connections, context):
+    """
+    Return (next_node_id, source) decided by connection conditions, or
+    (None, None) when no connection carries a condition that decides it.
+    """
+    candidate_ids = {candidate.get('id') for candidate in candidates}
+    default_target = None
+
+    for connection in connections or []:
+        target = connection_target(connection)
+        condition = get_condition(connection)
+        if target not in candidate_ids or not condition:
+            continue
+        if str(condition.get('type', '')).lower() == 'default':
+            default_target = default_target or target
+        elif evaluate_condition(condition, context):
+            return target, 'rule'
+
+    if default_target:
+        return default_target, 'default'
+    return None, None
+
+def decision_key(node, candidates, context):
+    candidate_keys = sorted(
+        [candidate.get('id'), node_cache.hash_node_config(candidate)]
+        for candidate in candidates
+    )
+    return node_cache.hash_content(json.dumps({
+        'node': [node.get('id'), node_cache.hash_node_config(node)],
+        'candidates': candidate_keys,
+        'input': node_cache.hash_content(context['text']) if context['text'] else None
+    }, separators=(',', ':')))
+
+def _count(source):
+    with _lock:
+        _metrics['decisions'][source] += 1
+
+def choose(node, candidates, connections=None, output_text='', inputs=None, ask_llm=None):
+    """
+    Pick the next node among candidates.
+
+    Conditions on connections are tried first, then the decision cache
+    (keyed by node, candidate set and input digest), and only then
+    ask_llm(node, candidates), which returns a node id or None. LLM
+    decisions are cached only when they name one of the candidates.
+
+    Returns:
+        {'next_node_id', 'source'} or None when no decision could be made
+    """
+    if not candidates:
+        return None
+
+    if len(candidates) == 1:
+        _count('single')
+        return {'next_node_id': candidates[0].get('id'), 'source': 'single'}
+
+    context = build_context(output_text, inputs)
+    next_node_id, source = match_rules(candidates, connections, context)
+    if next_node_id:
+        _count(source)
+        return {'next_node_id': next_node_id, 'source': source}
+
+    key = decision_key(node, candidates, context)
+    with _lock:
+        if key in _decisions:
+            _decisions.move_to_end(key)
+            _metrics['decisions']['cache'] += 1
+            return {'next_node_id': _decisions[key], 'source': 'cache'}
+
+    if not ask_llm:
+        return None
+
+    next_node_id = ask_llm(node, candidates)
+    if next_node_id not in {candidate.get('id') for candidate in candidates}:
+        with _lock:
+            _metrics['llm_errors'] += 1
+        return None
+
+    with _lock:
+        _metrics['decisions']['llm'] += 1
+        _store_decision(key, next_node_id)
+        # Later speculations on the same input can use it before the output exists
+        _store_decision(speculation_key(node, candidates, inputs), next_node_id)
+
+    return {'next_node_id': next_node_id, 'source': 'llm'}
+
+def _store_decision(key, next_node_id):
+    _decisions[key] = next_node_id
+    while len(_decisions) > _settings['cache_size']:
+        _decisions.popitem(last=False)
+        _metrics['cache_evictions'] += 1
+
+def is_routing_independent(node):
+    config = node.get('configuration') or {}
+    return bool(node.get('routing_independent') or config.get('routing_independent'))
+
+def depends_on_output(condition):
+    """True when a condition may test the node output; only conditions on input.* fields do not."""
+    if not isinstance(condition, dict):
+        return False
+    condition_type = str(condition.get('type', '')).lower()
+    if condition_type == 'default':
+        return False
+    if condition_type in ('all', 'any'):
+        return any(depends_on_output(sub) for sub in condition.get('conditions', []))
+    if condition_type == 'not':
+        return depends_on_output(condition.get('condition'))
+    field = str(condition.get('field', ''))
+    return not (field == 'input' or field.startswith('input.'))
+
+def should_speculate(node, candidates, connections):
+    """
+    Speculating only pays off when the LLM may be needed: more than one
+    candidate, no default connection (which would always decide) and,
+    unless the node is routing independent, no condition that may decide
+    once the output exists.
+    """
+    if not _settings['speculative'] or len(candidates) < 2:
+        return False
+    conditions = [get_condition(connection) for connection in connections or []]
+    if any(str((condition or {}).get('type', '')).lower() == 'default' for condition in conditions):
+        return False
+    return is_routing_independent(node) or not any(depends_on_output(condition) for condition in conditions)
+
+def speculation_key(node, candidates, inputs):
+    """Decision cache key of a decision made without the node output (the LLM prompt never holds it)."""
+    return decision_key(node, candidates, build_context('', inputs))
+
+def speculate(node, candidates, connections=None, inputs=None, ask_llm=None):
+    """
+    Make a routing decision before the node output exists.
+
+    Conditions are evaluated against the run input alone, then the
+    decision cache, and only then the LLM is asked. The LLM prompt never
+    includes the node output, so its answer stays valid once the output
+    is known; confirm() decides whether it can be committed.
+    """
+    with _lock:
+        _metrics['speculations'] += 1
+
+    context = build_context('', inputs)
+    next_node_id, source = match_rules(candidates, connections, context)
+    if next_node_id:
+        return {'next_node_id': next_node_id, 'source': source}
+
+    key = speculation_key(node, candidates, inputs)
+    with _lock:
+        if key in _decisions:
+            _decisions.move_to_end(key)
+            return {'next_node_id': _decisions[key], 'source': 'cache'}
+
+    next_node_id = ask_llm(node, candidates) if ask_llm else None
+    if next_node_id not in {candidate.get('id') for candidate in candidates}:
+        return None
+    return {'next_node_id': next_node_id, 'source': 'llm'}
+
+def confirm(speculation, node, candidates, connections=None, output_text='', inputs=None):
+    """
+    Commit a speculative decision now that the node output is known.
+
+    Routing-independent nodes commit it as is. For other nodes the
+    conditions are re-evaluated on the real output (cheap, no LLM call):
+    a condition that now matches wins and the speculation is discarded.
+    Returns the decision, or None when the speculation is unusable.
+    """
+    if not speculation:
+        with _lock:
+            _metrics['speculations_discarded'] += 1
+        return None
+
+    context = build_context(output_text, inputs)
+    if not is_routing_independent(node):
+        next_node_id, source = match_rules(candidates, connections, context)
+        if next_node_id:
+            with _lock:
+                _metrics['speculations_discarded'] += 1
+                _metrics['decisions'][source] += 1
+            return {'next_node_id': next_node_id, 'source': source}
+
+    with _lock:
+        _metrics['speculations_committed'] += 1
+        _metrics['decisions'][speculation['source']] += 1
+        if speculation['source'] == 'llm':
+            _store_decision(decision_key(node, candidates, context), speculation['next_node_id'])
+            _store_decision(speculation_key(node, candidates, inputs), speculation['next_node_id'])
+
+    return {'next_node_id': speculation['next_node_id'], 'source': speculation['source'], 'speculative': True}
+
+def collect_metrics():
+    with _lock:
+        return [
+            ('routing_decisions_total', 'counter', {'source': source}, count)
+            for source, count in _metrics['decisions'].items()
+        ]
+
+def stats():
+    with _lock:
+        decisions = dict(_metrics['decisions'])
+        return {
+            'decisions': decisions,
+            'llm_calls': decisions['llm'] + _metrics['llm_errors'],
+            'llm_calls_saved': sum(count for source, count in decisions.items() if source not in ('llm', 'single')),
+            'llm_errors': _metrics['llm_errors'],
+            'cached_decisions': len(_decisions),
+            'cache_size': _settings['cache_size'],
+            'cache_evictions': _metrics['cache_evictions'],
+            'speculations': _metrics['speculations'],
+            'speculations_committed': _metrics['speculations_committed'],
+            'speculations_discarded': _metrics['speculations_discarded']
+        }
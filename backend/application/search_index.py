@@ -0,0 +1,570 @@
+import backend.logger as logger
+import backend.file_handler as file_handler
+import os
+import re
+import json
+import math
+import time
+import uuid
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+log = logger.get_logger("search_index")
+
+INDEX_DIR = os.path.join("data", "search")
+MANIFEST_FILE = os.path.join(INDEX_DIR, "manifest.json")
+BUFFER_FILE = os.path.join(INDEX_DIR, "buffer.jsonl")
+SEGMENTS_DIR = os.path.join(INDEX_DIR, "segments")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset((
+    'a an and are as at be but by for from has have in is it its of on or that the this to was were will with '
+    'ja on ei se että oli ovat kun tai mutta myös sekä'
+).split())
+SOURCES = ('document', 'feed', 'upload', 'output')
+# Owner code of documents every user may see (feed items)
+SHARED = 0
+
+_settings = {
+    'enabled': True,
+    'flush_docs': 5000,
+    'max_segments': 8,
+    'max_text_chars': 20000,
+    'snippet_chars': 300,
+    'common_ratio': 0.05
+}
+_lock = threading.Lock()
+_loaded = False
+_segments = []
+_owners = {}
+# Documents not yet in a segment, also kept in buffer.jsonl until flushed
+_buffer = []
+_buffer_postings = {}
+_buffer_file = None
+# Tombstones of removed documents: key -> [removed at (ns), ids of the
+# segments that may still hold a removed copy]. Copies added before the
+# removal time are hidden from searches and left out of flushes and merges.
+_deleted = {}
+_flushing = False
+_flusher = None
+
+def configure(config):
+    search_config = config.get('search', {})
+    _settings['enabled'] = bool(search_config.get('enabled', _settings['enabled']))
+    for key in ('flush_docs', 'max_segments', 'max_text_chars', 'snippet_chars'):
+        _settings[key] = int(search_config.get(key, _settings[key]))
+    _settings['common_ratio'] = float(search_config.get('common_ratio', _settings['common_ratio']))
+
+def start(config):
+    """Configure and open the index in the background, so the first request does not wait for it."""
+    configure(config)
+    if _settings['enabled']:
+        threading.Thread(target=load, name="search-load", daemon=True).start()
+
+def load():
+    with _lock:
+        _ensure_loaded()
+
+def max_text_chars():
+    return _settings['max_text_chars']
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if 1 < len(token) <= 40 and token not in STOPWORDS]
+
+class Segment:
+    """
+    An immutable on-disk part of the index. Postings of a term are a
+    contiguous slice of doc_ids/tfs (memory-mapped); per-document arrays
+    are small enough to keep in memory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.id = os.path.basename(directory)
+        with open(os.path.join(directory, "terms.json"), 'r', encoding='utf-8') as f:
+            self.terms = json.load(f)
+        self.doc_ids = np.load(os.path.join(directory, "doc_ids.npy"), mmap_mode='r')
+        self.tfs = np.load(os.path.join(directory, "tfs.npy"), mmap_mode='r')
+        self.lengths = np.load(os.path.join(directory, "lengths.npy")).astype(np.float32)
+        self.owners = np.load(os.path.join(directory, "owners.npy"))
+        self.sources = np.load(os.path.join(directory, "sources.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        self.size = len(self.lengths)
+        self.total_length = int(self.lengths.sum(dtype=np.float64))
+        # Held open so reads keep working after a merge removes the files;
+        # closed when the last search holding the segment lets go of it
+        self.meta = open(os.path.join(directory, "meta.jsonl"), 'rb')
+        self.meta_lock = threading.Lock()
+
+    def postings(self, term):
+        entry = self.terms.get(term)
+        if entry is None:
+            return None, None
+        start, count = entry
+        return self.doc_ids[start:start + count], self.tfs[start:start + count]
+
+    def document_keys(self):
+        """(key, added) of every document, in local id order."""
+        with self.meta_lock:
+            self.meta.seek(0)
+            return [(document.get('key'), document.get('added', 0)) for document in map(json.loads, self.meta)]
+
+    def documents(self, local_ids):
+        documents = []
+        with self.meta_lock:
+            for local_id in local_ids:
+                self.meta.seek(int(self.offsets[local_id]))
+                documents.append(json.loads(self.meta.readline()))
+        return documents
+
+def _write_arrays(directory, terms, term_ids, doc_ids, tfs, lengths, owners, sources):
+    """Write postings sorted by term (then document) and the per-document arrays."""
+    order = np.lexsort((doc_ids, term_ids))
+    counts = np.bincount(term_ids, minlength=len(terms))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    with open(os.path.join(directory, "terms.json"), 'w', encoding='utf-8') as f:
+        json.dump({term: [int(starts[index]), int(counts[index])] for index, term in enumerate(terms)}, f, separators=(',', ':'))
+    np.save(os.path.join(directory, "doc_ids.npy"), doc_ids[order].astype(np.int32))
+    np.save(os.path.join(directory, "tfs.npy"), tfs[order].astype(np.uint16))
+    np.save(os.path.join(directory, "lengths.npy"), lengths.astype(np.uint32))
+    np.save(os.path.join(directory, "owners.npy"), owners.astype(np.int32))
+    np.save(os.path.join(directory, "sources.npy"), sources.astype(np.uint8))
+
+def _new_segment_directory():
+    directory = os.path.join(SEGMENTS_DIR, f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}")
+    temporary = directory + ".tmp"
+    os.makedirs(temporary)
+    return directory, temporary
+
+def build_segment(documents, owner_codes):
+    """Write buffered documents as a new segment; returns the opened Segment."""
+    directory, temporary = _new_segment_directory()
+    vocabulary = {}
+    term_ids, doc_ids, tfs = [], [], []
+    offsets = []
+    with open(os.path.join(temporary, "meta.jsonl"), 'wb') as f:
+        for local_id, document in enumerate(documents):
+            for term, tf in document['terms'].items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(local_id)
+                tfs.append(min(tf, 65535))
+            offsets.append(f.tell())
+            f.write(json.dumps({key: value for key, value in document.items() if key != 'terms'}).encode('utf-8') + b'\n')
+
+    _write_arrays(
+        temporary,
+        list(vocabulary),
+        np.array(term_ids, dtype=np.int64),
+        np.array(doc_ids, dtype=np.int64),
+        np.array(tfs, dtype=np.int64),
+        np.array([document['length'] for document in documents]),
+        np.array([owner_codes.get(document.get('owner'), SHARED) for document in documents]),
+        np.array([SOURCES.index(document['source']) if document['source'] in SOURCES else 0 for document in documents])
+    )
+    np.save(os.path.join(temporary, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    os.replace(temporary, directory)
+    return Segment(directory)
+
+def merge_segments(segments, deleted=None):
+    """
+    Merge segments into one without re-tokenizing; postings are
+    concatenated and re-sorted by term. Documents removed in deleted
+    (see remove_documents) are left out.
+    """
+    directory, temporary = _new_segment_directory()
+    vocabulary = {}
+    term_parts, doc_parts, tf_parts, offset_parts = [], [], [], []
+    length_parts, owner_parts, source_parts = [], [], []
+    base, meta_size = 0, 0
+    with open(os.path.join(temporary, "meta.jsonl"), 'wb') as meta:
+        for segment in segments:
+            live = None
+            if deleted:
+                live = np.array([not _is_deleted(key, added, deleted) for key, added in segment.document_keys()], dtype=bool)
+                if live.all():
+                    live = None
+
+            names = list(segment.terms)
+            global_ids = np.array([vocabulary.setdefault(name, len(vocabulary)) for name in names], dtype=np.int64)
+            entries = np.array([segment.terms[name] for name in names], dtype=np.int64).reshape(-1, 2)
+            # Postings are laid out term after term in start order
+            order = np.argsort(entries[:, 0])
+            term_ids = np.repeat(global_ids[order], entries[order, 1])
+            doc_ids = np.asarray(segment.doc_ids, dtype=np.int64)
+            tfs = np.asarray(segment.tfs, dtype=np.int64)
+
+            if live is None:
+                term_parts.append(term_ids)
+                doc_parts.append(doc_ids + base)
+                tf_parts.append(tfs)
+                offset_parts.append(segment.offsets + meta_size)
+                length_parts.append(segment.lengths)
+                owner_parts.append(segment.owners)
+                source_parts.append(segment.sources)
+                with open(os.path.join(segment.directory, "meta.jsonl"), 'rb') as f:
+                    shutil.copyfileobj(f, meta)
+                base += segment.size
+            else:
+                kept = live[doc_ids]
+                new_ids = np.cumsum(live) - 1
+                term_parts.append(term_ids[kept])
+                doc_parts.append(new_ids[doc_ids[kept]] + base)
+                tf_parts.append(tfs[kept])
+                length_parts.append(segment.lengths[live])
+                owner_parts.append(segment.owners[live])
+                source_parts.append(segment.sources[live])
+                offsets = []
+                with open(os.path.join(segment.directory, "meta.jsonl"), 'rb') as f:
+                    for line, keep in zip(f, live):
+                        if keep:
+                            offsets.append(meta.tell())
+                            meta.write(line)
+                offset_parts.append(np.array(offsets, dtype=np.int64))
+                base += int(live.sum())
+            meta_size = meta.tell()
+
+    _write_arrays(
+        temporary,
+        list(vocabulary),
+        np.concatenate(term_parts),
+        np.concatenate(doc_parts),
+        np.concatenate(tf_parts),
+        np.concatenate(length_parts),
+        np.concatenate(owner_parts),
+        np.concatenate(source_parts)
+    )
+    np.save(os.path.join(temporary, "offsets.npy"), np.concatenate(offset_parts))
+    os.replace(temporary, directory)
+    return Segment(directory)
+
+def _save_manifest():
+    file_handler.save_data(MANIFEST_FILE, {
+        'segments': [segment.id for segment in _segments],
+        'owners': _owners,
+        'deleted': _deleted
+    })
+
+def _is_deleted(key, added, deleted):
+    tombstone = deleted.get(key)
+    return tombstone is not None and (added or 0) <= tombstone[0]
+
+def _index_buffered(document):
+    position = len(_buffer)
+    _buffer.append(document)
+    for term in document['terms']:
+        _buffer_postings.setdefault(term, []).append(position)
+
+def _ensure_loaded():
+    """Open the segments and replay unflushed documents. Call with _lock held."""
+    global _loaded
+
+    if _loaded:
+        return
+    _loaded = True
+    manifest = file_handler.load_data(MANIFEST_FILE, {}) or {}
+    _owners.update(manifest.get('owners', {}))
+    _deleted.update(manifest.get('deleted', {}))
+    for segment_id in manifest.get('segments', []):
+        try:
+            _segments.append(Segment(os.path.join(SEGMENTS_DIR, segment_id)))
+        except (OSError, ValueError) as e:
+            log.error("Search segment unreadable", extra={"fields": {"segment": segment_id, "error": str(e)}})
+    if os.path.exists(BUFFER_FILE):
+        with open(BUFFER_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    _index_buffered(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    log.info("Search index loaded", extra={"fields": {
+        "segments": len(_segments),
+        "documents": sum(segment.size for segment in _segments) + len(_buffer)
+    }})
+
+def make_document(key, text, user_id=None, source='document', title=None, link=None, ref=None, timestamp=None):
+    """Tokenize a document for the index; None when it has no searchable terms."""
+    text = (text or '')[:_settings['max_text_chars']]
+    terms = Counter(tokenize(f"{title or ''} {text}"))
+    if not terms:
+        return None
+    return {
+        'key': key,
+        'owner': user_id,
+        'source': source,
+        'title': title or text[:80].strip(),
+        'snippet': ' '.join(text[:_settings['snippet_chars']].split()),
+        'link': link,
+        'ref': ref,
+        'timestamp': timestamp or int(time.time()),
+        # Orders the document against removals of the same key
+        'added': time.time_ns(),
+        'length': sum(terms.values()),
+        'terms': dict(terms)
+    }
+
+def add_documents(documents):
+    """
+    Add documents made by make_document. They are searchable at once;
+    segments are written in the background every flush_docs documents.
+    """
+    global _buffer_file, _flushing, _flusher
+
+    documents = [document for document in documents if document]
+    if not _settings['enabled'] or not documents:
+        return 0
+    lines = ''.join(json.dumps(document, separators=(',', ':')) + '\n' for document in documents)
+
+    with _lock:
+        _ensure_loaded()
+        if _buffer_file is None:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            _buffer_file = open(BUFFER_FILE, 'a', encoding='utf-8')
+        _buffer_file.write(lines)
+        _buffer_file.flush()
+        for document in documents:
+            _index_buffered(document)
+        if len(_buffer) >= _settings['flush_docs'] and not _flushing:
+            _flushing = True
+            if _flusher is None:
+                _flusher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-flush")
+            _flusher.submit(flush)
+    return len(documents)
+
+def add_document(key, text, user_id=None, source='document', **fields):
+    """Index one text; user_id None makes it visible to every user."""
+    return add_documents([make_document(key, text, user_id, source, **fields)])
+
+def remove_documents(keys):
+    """
+    Remove the documents with these keys (deleted outputs) from search
+    results. Documents added with the same key afterwards stay visible.
+    Segment copies are dropped when their segment is merged.
+    """
+    keys = [key for key in keys if key]
+    if not _settings['enabled'] or not keys:
+        return 0
+    with _lock:
+        _ensure_loaded()
+        removed_at = time.time_ns()
+        segment_ids = [segment.id for segment in _segments]
+        for key in keys:
+            _deleted[key] = [removed_at, list(segment_ids)]
+        _save_manifest()
+    return len(keys)
+
+def flush():
+    """Write buffered documents to a new segment and merge segments when there are too many."""
+    global _buffer, _buffer_postings, _buffer_file, _flushing
+
+    try:
+        with _lock:
+            _ensure_loaded()
+            taken = len(_buffer)
+            started = time.time_ns()
+            documents = [document for document in _buffer if not _is_deleted(document['key'], document.get('added'), _deleted)]
+            for document in documents:
+                if document.get('owner') and document['owner'] not in _owners:
+                    _owners[document['owner']] = len(_owners) + 1
+            owner_codes = dict(_owners)
+        if not taken:
+            return False
+
+        segment = build_segment(documents, owner_codes) if documents else None
+        with _lock:
+            remaining = _buffer[taken:]
+            _buffer, _buffer_postings = [], {}
+            for document in remaining:
+                _index_buffered(document)
+            if segment:
+                _segments.append(segment)
+                # Removed while the segment was built, so it may hold a copy
+                for tombstone in _deleted.values():
+                    if tombstone[0] >= started:
+                        tombstone[1].append(segment.id)
+            _save_manifest()
+            # Rewrite the buffer file with what arrived during the flush
+            if _buffer_file:
+                _buffer_file.close()
+            with open(BUFFER_FILE, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(document, separators=(',', ':')) + '\n' for document in remaining)
+            _buffer_file = open(BUFFER_FILE, 'a', encoding='utf-8')
+        log.info("Search segment written", extra={"fields": {"documents": len(documents), "segments": len(_segments)}})
+
+        _merge_if_needed()
+        return True
+    finally:
+        with _lock:
+            _flushing = False
+
+def _merge_if_needed():
+    with _lock:
+        excess = len(_segments) - _settings['max_segments']
+        if excess <= 0:
+            return
+        # Merging the smallest segments keeps merge cost proportional to new data
+        merging = sorted(_segments, key=lambda segment: segment.size)[:max(excess + 1, 2)]
+        started = time.time_ns()
+        deleted = {key: list(tombstone) for key, tombstone in _deleted.items()}
+
+    merged = merge_segments(merging, deleted)
+    with _lock:
+        merged_ids = {segment.id for segment in merging}
+        position = min(index for index, segment in enumerate(_segments) if segment.id in merged_ids)
+        _segments[:] = [segment for segment in _segments if segment.id not in merged_ids]
+        _segments.insert(position, merged)
+        for key, tombstone in list(_deleted.items()):
+            holders = [segment_id for segment_id in tombstone[1] if segment_id not in merged_ids]
+            # Removed during the merge: the merged segment may hold a copy
+            if tombstone[0] >= started and len(holders) < len(tombstone[1]):
+                holders.append(merged.id)
+            tombstone[1] = holders
+            if not holders:
+                del _deleted[key]
+        _save_manifest()
+    # Open memory maps and meta files stay valid after the files are
+    # removed, for searches that still hold the merged segments
+    for segment in merging:
+        shutil.rmtree(segment.directory, ignore_errors=True)
+    log.info("Search segments merged", extra={"fields": {"merged": len(merging), "documents": merged.size}})
+
+def _bm25(weight, tfs, lengths, average_length):
+    return np.float32(weight) * tfs * np.float32(K1 + 1) / (tfs + np.float32(K1) * (np.float32(1 - B) + np.float32(B) * lengths / np.float32(average_length)))
+
+def _score_segment(segment, terms, idf, average_length, owner_code, allowed_sources):
+    """(local_ids, scores) of the visible documents of a segment matching any of terms."""
+    postings = [(term, *segment.postings(term)) for term in terms]
+    postings = [(term, np.asarray(term_ids), tfs) for term, term_ids, tfs in postings if term_ids is not None]
+    if not postings:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    if sum(len(term_ids) for _, term_ids, _ in postings) > segment.size // 8:
+        # Long postings: accumulate into a dense array (each term lists a document once)
+        scores = np.zeros(segment.size, dtype=np.float32)
+        for term, term_ids, tfs in postings:
+            scores[term_ids] += _bm25(idf[term], tfs.astype(np.float32), segment.lengths[term_ids], average_length)
+        visible = segment.owners == SHARED
+        if owner_code is not None:
+            visible |= segment.owners == owner_code
+        visible &= allowed_sources[segment.sources]
+        local_ids = np.flatnonzero((scores > 0) & visible)
+        return local_ids, scores[local_ids]
+
+    term_ids = np.concatenate([term_ids for _, term_ids, _ in postings])
+    weights = np.concatenate([
+        _bm25(idf[term], tfs.astype(np.float32), segment.lengths[ids], average_length) for term, ids, tfs in postings
+    ])
+    owners = segment.owners[term_ids]
+    visible = (owners == SHARED) | (owners == (owner_code if owner_code is not None else SHARED))
+    visible &= allowed_sources[segment.sources[term_ids]]
+    local_ids, inverse = np.unique(term_ids[visible], return_inverse=True)
+    return local_ids, np.bincount(inverse, weights=weights[visible]).astype(np.float32)
+
+def search(query, user_id=None, limit=10, sources=None):
+    """
+    BM25 search over the documents visible to user_id (their own and the
+    shared ones), optionally limited to some sources.
+
+    Returns:
+        List of documents (key, title, snippet, link, source, ref,
+        timestamp) with their score, best first
+    """
+    terms = list(dict.fromkeys(tokenize(query or '')))
+    if not terms or not _settings['enabled']:
+        return []
+
+    with _lock:
+        _ensure_loaded()
+        segments = list(_segments)
+        buffered = {term: [_buffer[position] for position in _buffer_postings.get(term, [])] for term in terms}
+        buffer_size = len(_buffer)
+        buffer_length = sum(document['length'] for document in _buffer)
+        owner_code = _owners.get(user_id)
+        deleted = dict(_deleted) if _deleted else None
+
+    count = sum(segment.size for segment in segments) + buffer_size
+    if not count:
+        return []
+    average_length = (sum(segment.total_length for segment in segments) + buffer_length) / count
+    frequencies = {term: sum(segment.terms.get(term, (0, 0))[1] for segment in segments) + len(buffered[term]) for term in terms}
+    idf = {term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5)) for term, frequency in frequencies.items() if frequency}
+    allowed_sources = np.zeros(len(SOURCES), dtype=bool)
+    allowed_sources[[SOURCES.index(source) for source in (sources or SOURCES) if source in SOURCES]] = True
+    # Terms in a large share of documents only add to the scores of
+    # documents the rarer terms matched, unless every term is that common
+    rare = [term for term in idf if frequencies[term] <= _settings['common_ratio'] * count] or list(idf)
+    common = [term for term in idf if term not in rare]
+
+    # Removed documents still in segments are skipped below, so take enough to fill limit
+    pool = limit + (len(deleted) if deleted else 0)
+    candidates = []
+    for segment in segments:
+        local_ids, scores = _score_segment(segment, rare, idf, average_length, owner_code, allowed_sources)
+        if not len(local_ids):
+            continue
+        for term in common:
+            term_ids, tfs = segment.postings(term)
+            if term_ids is None:
+                continue
+            # Postings are sorted by document, so matches are found by bisection
+            positions = np.minimum(np.searchsorted(term_ids, local_ids), len(term_ids) - 1)
+            matched = np.asarray(term_ids[positions]) == local_ids
+            scores[matched] += _bm25(idf[term], np.asarray(tfs[positions[matched]], dtype=np.float32), segment.lengths[local_ids[matched]], average_length)
+        top = np.argpartition(scores, -pool)[-pool:] if len(scores) > pool else np.arange(len(scores))
+        candidates.extend((float(scores[index]), segment, int(local_ids[index])) for index in top)
+
+    buffered_scores = {}
+    for term, weight in idf.items():
+        for document in buffered[term]:
+            if document.get('owner') not in (None, user_id):
+                continue
+            if sources and document['source'] not in sources:
+                continue
+            if deleted and _is_deleted(document['key'], document.get('added'), deleted):
+                continue
+            tf = document['terms'][term]
+            normalized = K1 * (1 - B + B * document['length'] / average_length)
+            entry = buffered_scores.setdefault(id(document), [0.0, document])
+            entry[0] += weight * tf * (K1 + 1) / (tf + normalized)
+    candidates.extend((score, None, document) for score, document in buffered_scores.values())
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    results = []
+    for score, segment, document in candidates:
+        if len(results) >= limit:
+            break
+        if segment is not None:
+            document = segment.documents([document])[0]
+            if deleted and _is_deleted(document.get('key'), document.get('added'), deleted):
+                continue
+        result = {key: value for key, value in document.items() if key not in ('terms', 'owner', 'length', 'added')}
+        result['score'] = round(score, 4)
+        results.append(result)
+    return results
+
+def close():
+    """Stop background flushing; unflushed documents stay in buffer.jsonl."""
+    global _buffer_file, _flusher
+
+    if _flusher is not None:
+        _flusher.shutdown(wait=True)
+        _flusher = None
+    with _lock:
+        if _buffer_file:
+            _buffer_file.close()
+            _buffer_file = None
+
+def collect_metrics():
+    with _lock:
+        return [
+            ('search_documents', 'gauge', {}, sum(segment.size for segment in _segments) + len(_buffer)),
+            ('search_segments', 'gauge', {}, len(_segments)),
+            ('search_buffered_documents', 'gauge', {}, len(_buffer)),
+            ('search_removed_documents', 'gauge', {}, len(_deleted))
+        ]
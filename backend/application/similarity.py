@@ -0,0 +1,222 @@
+import backend.metrics as metrics
+import backend.tracing as tracing
+import backend.application.search_index as search_index
+import json
+import time
+import hashlib
+import numpy as np
+
+NODE_TYPE = 'similarity'
+METHODS = ('cluster', 'rank')
+LABEL_TERMS = 3
+PREVIEW_CHARS = 100
+# Upper bound on similarity scores held at once (rows x items)
+BLOCK_CELLS = 1 << 24
+
+_settings = {
+    'dimensions': 1024,
+    'threshold': 0.5,
+    'top_k': 10,
+    'max_neighbors': 256,
+    'max_items': 50000
+}
+
+def configure(config):
+    similarity_config = config.get('similarity', {})
+    for key in ('dimensions', 'top_k', 'max_neighbors', 'max_items'):
+        _settings[key] = int(similarity_config.get(key, _settings[key]))
+    _settings['threshold'] = float(similarity_config.get('threshold', _settings['threshold']))
+
+def is_similarity_node(node):
+    return (node.get('type') or '').lower() == NODE_TYPE
+
+def input_items(inputs):
+    """The items a run's input holds: a list is many items, anything else one."""
+    if inputs is None:
+        return []
+    return list(inputs) if isinstance(inputs, list) else [inputs]
+
+def _term_hashes(terms):
+    return np.array([
+        int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+        for term in terms
+    ], dtype=np.uint64)
+
+def vectorize(texts, dimensions=None):
+    """
+    TF-IDF vectors of texts with the hashing trick: each term lands in one
+    of dimensions columns with a random sign, so no vocabulary has to be
+    kept between calls. Rows are L2-normalised, so a dot product is the
+    cosine similarity.
+
+    Returns:
+        (vectors, documents, terms, vocabulary) where vectors is a float32
+        array (len(texts), dimensions), documents/terms are the (row, term
+        id) pairs of every distinct term of each text and vocabulary is
+        (term list, idf); the last three are used for cluster labels
+    """
+    dimensions = dimensions or _settings['dimensions']
+    vocabulary = {}
+    term_ids, lengths = [], []
+    for text in texts:
+        tokens = search_index.tokenize(text or '')
+        term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+        lengths.append(len(tokens))
+
+    count = len(texts)
+    rows = np.repeat(np.arange(count, dtype=np.int64), lengths)
+    pairs, tf = np.unique(rows * max(len(vocabulary), 1) + np.array(term_ids, dtype=np.int64), return_counts=True)
+    documents, terms = np.divmod(pairs, max(len(vocabulary), 1))
+
+    df = np.bincount(terms, minlength=len(vocabulary))
+    idf = np.log((1 + count) / (1 + df)) + 1
+    hashes = _term_hashes(vocabulary)
+    columns = (hashes % np.uint64(dimensions)).astype(np.int64)
+    signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+
+    weights = (1 + np.log(tf)) * idf[terms] * signs[terms]
+    vectors = np.bincount(documents * dimensions + columns[terms], weights=weights, minlength=count * dimensions)
+    vectors = vectors.reshape(count, dimensions).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms > 0, norms, 1)
+    return vectors, documents, terms, (list(vocabulary), idf)
+
+def neighbors(vectors, threshold, max_neighbors=None):
+    """
+    For every row, the rows at least threshold similar to it (itself
+    included), most similar first and at most max_neighbors. The
+    similarity matrix is computed in blocks of rows and never held whole.
+    """
+    max_neighbors = max_neighbors or _settings['max_neighbors']
+    count = len(vectors)
+    block = max(1, min(count, BLOCK_CELLS // max(count, 1)))
+    result = []
+    for start in range(0, count, block):
+        scores = vectors[start:start + block] @ vectors.T
+        for row in scores:
+            candidates = np.flatnonzero(row >= threshold)
+            if len(candidates) > max_neighbors:
+                candidates = candidates[np.argpartition(-row[candidates], max_neighbors - 1)[:max_neighbors]]
+            result.append(candidates[np.argsort(-row[candidates], kind='stable')])
+    return result
+
+def cluster(vectors, threshold):
+    """
+    Group rows by star clustering: the row with the most neighbours above
+    threshold becomes a centre and takes all its unassigned neighbours,
+    then the next best unassigned row, and so on. Unlike linking every
+    similar pair this never chains unrelated items together through
+    intermediate ones.
+
+    Returns:
+        Clusters as arrays of row indices, centre first, largest first
+    """
+    lists = neighbors(vectors, threshold)
+    degrees = np.array([len(members) for members in lists])
+    labels = np.full(len(vectors), -1, dtype=np.int64)
+    clusters = []
+    for centre in np.argsort(-degrees, kind='stable'):
+        if labels[centre] >= 0:
+            continue
+        members = lists[centre]
+        members = members[(labels[members] < 0) & (members != centre)]
+        labels[members] = labels[centre] = len(clusters)
+        clusters.append(np.concatenate(([centre], members)))
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+def rank(vectors, query_vector=None):
+    """Row order by similarity to query_vector, or to the centroid (how typical each item is) without one."""
+    if query_vector is None:
+        query_vector = vectors.mean(axis=0)
+        norm = np.linalg.norm(query_vector)
+        query_vector = query_vector / norm if norm > 0 else query_vector
+    scores = vectors @ query_vector
+    return np.argsort(-scores, kind='stable'), scores
+
+def label_terms(clusters, documents, terms, vocabulary):
+    """The highest scoring terms (shared by most members, weighted by IDF) of each multi-item cluster."""
+    words, idf = vocabulary
+    labels = np.full(int(documents.max()) + 1 if len(documents) else 0, -1, dtype=np.int64)
+    for index, members in enumerate(clusters):
+        if len(members) > 1:
+            labels[members] = index
+    keep = labels[documents] >= 0
+    if not keep.any():
+        return {}
+
+    pairs, counts = np.unique(labels[documents[keep]] * len(words) + terms[keep], return_counts=True)
+    owners, term_ids = np.divmod(pairs, len(words))
+    order = np.lexsort((-(counts * idf[term_ids]), owners))
+    result = {}
+    for position in order:
+        top = result.setdefault(int(owners[position]), [])
+        if len(top) < LABEL_TERMS:
+            top.append(words[term_ids[position]])
+    return result
+
+def preview(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 1] + '…'
+
+def run_node(node, texts):
+    """
+    Cluster or rank texts for a similarity node without calling the LLM.
+    Returns the node output as JSON text.
+
+    Configuration: method (cluster or rank), threshold (minimum cosine
+    similarity within a cluster), query and top_k (for rank; without a
+    query the most typical items come first).
+    """
+    config = node.get('configuration', {}) or {}
+    method = config.get('method') or 'cluster'
+    if method not in METHODS:
+        raise ValueError(f"Unknown similarity method: {method}")
+    if len(texts) > _settings['max_items']:
+        raise ValueError(f"Too many items for a similarity node ({len(texts)}, maximum {_settings['max_items']})")
+
+    started = time.perf_counter()
+    with tracing.span('similarity', method=method, items=len(texts)):
+        output = {'method': method, 'items': len(texts)}
+        if method == 'rank':
+            query = config.get('query') or ''
+            vectors = vectorize([query] + texts)[0] if query else vectorize(texts)[0]
+            order, scores = rank(vectors[1:], vectors[0]) if query else rank(vectors)
+            top_k = int(config.get('top_k') or _settings['top_k'])
+            output['query'] = query
+            output['ranked'] = [
+                {'index': int(index), 'score': round(float(scores[index]), 4), 'preview': preview(texts[index])}
+                for index in order[:top_k]
+            ]
+        else:
+            threshold = float(config.get('threshold') or _settings['threshold'])
+            vectors, documents, terms, vocabulary = vectorize(texts)
+            clusters = cluster(vectors, threshold)
+            labels = label_terms(clusters, documents, terms, vocabulary)
+            output['threshold'] = threshold
+            output['clusters'] = [{
+                'size': len(members),
+                'terms': labels.get(index, []),
+                'preview': preview(texts[members[0]]),
+                'members': members.tolist()
+            } for index, members in enumerate(clusters)]
+    metrics.observe('similarity_seconds', time.perf_counter() - started, method=method)
+    return json.dumps(output, ensure_ascii=False)
+
+def output_groups(node, file_info, inputs):
+    """
+    The groups of input items a similarity node output describes: one per
+    cluster, or the single ranked selection. None for other nodes.
+    """
+    if not is_similarity_node(node) or not file_info:
+        return None
+    try:
+        output = json.loads(file_info.get('content') or '')
+    except ValueError:
+        return None
+    items = input_items(inputs)
+    if output.get('method') == 'rank':
+        groups = [[items[entry['index']] for entry in output.get('ranked', []) if entry['index'] < len(items)]]
+    else:
+        groups = [[items[index] for index in entry['members'] if index < len(items)] for entry in output.get('clusters', [])]
+    return [group for group in groups if group]
@@ -0,0 +1,214 @@
+import backend.logger as logger
+import backend.file_handler as file_handler
+import os
+import bisect
+import threading
+
+log = logger.get_logger("structure_index")
+
+JOHTO_DIR = os.path.join("data", "johto")
+
+_lock = threading.RLock()
+_entries = {}
+_users = {}
+_name_keys = []
+_loaded = False
+
+def summarize_structure(user_id, username, structure_id, structure):
+    """Build the compact summary kept in memory for one structure."""
+    if not isinstance(structure, dict):
+        structure = {}
+    inner = structure.get('structure') if isinstance(structure.get('structure'), dict) else structure
+
+    return {
+        'id': structure_id,
+        'name': structure.get('name') or structure_id.replace('.json', ''),
+        'userId': user_id,
+        'username': username,
+        'node_count': len(inner.get('nodes') or []),
+        'connection_count': len(inner.get('connections') or [])
+    }
+
+def get_structures_file(user_id, johto_dir=JOHTO_DIR):
+    return os.path.join(johto_dir, "users", user_id, "saved_structures.json")
+
+def _file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _name_key(summary):
+    return (summary['name'].lower(), summary['userId'], summary['id'])
+
+def _remove_entries(user_id):
+    user = _users.get(user_id)
+    if not user:
+        return
+    for structure_id in user['structure_ids']:
+        summary = _entries.pop((user_id, structure_id), None)
+        if summary:
+            key = _name_key(summary)
+            position = bisect.bisect_left(_name_keys, key)
+            if position < len(_name_keys) and _name_keys[position] == key:
+                _name_keys.pop(position)
+    user['structure_ids'] = []
+
+def index_user(user_id, username, johto_dir=JOHTO_DIR):
+    """
+    Index a single Johto user's saved structures.
+
+    The user's saved_structures.json is only re-read when its mtime or size
+    changed since the last call, so repeated syncs cost one stat per user.
+
+    Returns:
+        True if the user's entries changed
+    """
+    structures_file = get_structures_file(user_id, johto_dir)
+    signature = _file_signature(structures_file)
+
+    with _lock:
+        user = _users.get(user_id)
+        if user and user['signature'] == signature and user['username'] == username:
+            return False
+
+    user_structures = {}
+    if signature:
+        try:
+            data = file_handler.load_data(structures_file, {}) or {}
+            user_structures = data.get("structures", {}) or {}
+        except ValueError as e:
+            log.warning("Error decoding structures file", extra={"fields": {"path": structures_file, "error": str(e)}})
+
+    summaries = [
+        summarize_structure(user_id, username, structure_id, structure)
+        for structure_id, structure in user_structures.items()
+    ]
+
+    with _lock:
+        _remove_entries(user_id)
+        _users[user_id] = {
+            'username': username,
+            'signature': signature,
+            'structure_ids': [summary['id'] for summary in summaries]
+        }
+        for summary in summaries:
+            _entries[(user_id, summary['id'])] = summary
+            bisect.insort(_name_keys, _name_key(summary))
+
+    return True
+
+def remove_user(user_id):
+    with _lock:
+        _remove_entries(user_id)
+        _users.pop(user_id, None)
+
+def refresh(johto_dir=JOHTO_DIR):
+    """
+    Bring the index up to date with the synced Johto directory.
+
+    Returns:
+        Dictionary with the number of users seen and users re-indexed
+    """
+    users_file = os.path.join(johto_dir, "users.json")
+    users_data = file_handler.load_data(users_file, {}) or {}
+
+    seen = set()
+    updated = 0
+    for user in users_data.get('users', []):
+        user_id = user.get('id')
+        username = user.get('username')
+        if not user_id or not username:
+            continue
+        seen.add(user_id)
+        if index_user(user_id, username, johto_dir):
+            updated += 1
+
+    global _loaded
+    with _lock:
+        stale = [user_id for user_id in _users if user_id not in seen]
+        _loaded = True
+    for user_id in stale:
+        remove_user(user_id)
+
+    return {'users': len(seen), 'updated': updated, 'removed': len(stale)}
+
+def ensure_loaded(johto_dir=JOHTO_DIR):
+    """Build the index from previously synced files if nothing has been indexed yet."""
+    if not _loaded:
+        refresh(johto_dir)
+
+def list_users():
+    with _lock:
+        users = [
+            {
+                'userId': user_id,
+                'username': user['username'],
+                'structure_count': len(user['structure_ids'])
+            }
+            for user_id, user in _users.items()
+        ]
+    users.sort(key=lambda user: (-user['structure_count'], user['username'].lower()))
+    return users
+
+def list_structures(user_id=None, prefix='', offset=0, limit=50):
+    """
+    Return one page of structure summaries ordered by name.
+
+    Args:
+        user_id: Only include structures of this Johto user
+        prefix: Case-insensitive structure name prefix
+        offset: Index of the first summary to return
+        limit: Maximum number of summaries to return
+    """
+    prefix = (prefix or '').lower()
+
+    with _lock:
+        if user_id:
+            user = _users.get(user_id)
+            candidates = [_entries[(user_id, structure_id)] for structure_id in user['structure_ids']] if user else []
+            candidates = [summary for summary in candidates if summary['name'].lower().startswith(prefix)]
+            candidates.sort(key=_name_key)
+        else:
+            start = bisect.bisect_left(_name_keys, (prefix,))
+            candidates = []
+            for key in _name_keys[start:]:
+                if not key[0].startswith(prefix):
+                    break
+                candidates.append(_entries[(key[1], key[2])])
+
+    return {
+        'items': [dict(summary) for summary in candidates[offset:offset + limit]],
+        'total': len(candidates),
+        'offset': offset,
+        'limit': limit
+    }
+
+def get_summary(user_id, structure_id):
+    with _lock:
+        summary = _entries.get((user_id, structure_id))
+        return dict(summary) if summary else None
+
+def get_structure(user_id, structure_id, johto_dir=JOHTO_DIR):
+    """Load a single full structure from disk, or None if it is not indexed."""
+    summary = get_summary(user_id, structure_id)
+    if not summary:
+        return None
+
+    data = file_handler.load_data(get_structures_file(user_id, johto_dir), {}) or {}
+    structure = (data.get("structures") or {}).get(structure_id)
+    if structure is None:
+        return None
+
+    return {
+        'id': structure_id,
+        'name': summary['name'],
+        'userId': user_id,
+        'username': summary['username'],
+        **structure
+    }
+
+def stats():
+    with _lock:
+        return {'users': len(_users), 'structures': len(_entries)}
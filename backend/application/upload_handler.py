@@ -0,0 +1,294 @@
+import backend.logger as logger
+import backend.metrics as metrics
+import backend.structure_interpreter as structure_interpreter
+import backend.application.search_index as search_index
+import os
+import re
+import time
+import uuid
+import hashlib
+from email.message import Message
+
+log = logger.get_logger("uploads")
+
+MAX_HEADER_BYTES = 16384
+SAFE_ID = structure_interpreter.SAFE_ID
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv', '.json', '.html', '.htm', '.xml')
+
+_settings = {
+    'max_upload_size': 268435456,
+    'chunk_size': 65536,
+    'preview_bytes': 2048
+}
+
+class UploadError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def configure(config):
+    _settings['max_upload_size'] = int(config.get('max_upload_size', _settings['max_upload_size']))
+
+def max_upload_size():
+    return _settings['max_upload_size']
+
+class LimitedReader:
+    """Body of a request with a Content-Length; never reads past it."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size):
+        if self.remaining <= 0:
+            return b''
+        data = self.stream.read(min(size, self.remaining))
+        if not data:
+            raise UploadError(400, 'Request body ended early')
+        self.remaining -= len(data)
+        return data
+
+class ChunkedReader:
+    """Decodes a Transfer-Encoding: chunked body, failing once it grows past limit."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.total = 0
+        self.chunk_left = 0
+        self.finished = False
+
+    def read(self, size):
+        if self.finished:
+            return b''
+        if self.chunk_left == 0:
+            line = self.stream.readline(1024)
+            try:
+                self.chunk_left = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise UploadError(400, 'Malformed chunked body')
+            if self.chunk_left == 0:
+                # Skip trailers up to the blank line
+                while self.stream.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                self.finished = True
+                return b''
+            self.total += self.chunk_left
+            if self.total > self.limit:
+                raise UploadError(413, f"Upload exceeds {self.limit} bytes")
+
+        data = self.stream.read(min(size, self.chunk_left))
+        if not data:
+            raise UploadError(400, 'Request body ended early')
+        self.chunk_left -= len(data)
+        if self.chunk_left == 0:
+            self.stream.readline(1024)
+        return data
+
+class MultipartReader:
+    """
+    Streaming multipart/form-data parser. Call next_part() for the headers
+    of each part and read() for its content until it returns b''. Holds
+    at most about two chunks of the body in memory.
+    """
+
+    def __init__(self, stream, boundary, chunk_size):
+        self.stream = stream
+        self.delimiter = b'\r\n--' + boundary
+        # The first boundary has no preceding line break
+        self.buffer = bytearray(b'\r\n')
+        self.chunk_size = chunk_size
+
+    def _fill(self):
+        data = self.stream.read(self.chunk_size)
+        if not data:
+            raise UploadError(400, 'Multipart body ended early')
+        self.buffer += data
+
+    def read(self, size):
+        while True:
+            index = self.buffer.find(self.delimiter)
+            # Without a delimiter, keep back what could be the start of one
+            available = index if index >= 0 else len(self.buffer) - len(self.delimiter) + 1
+            if available > 0:
+                count = min(size, available)
+                data = bytes(self.buffer[:count])
+                del self.buffer[:count]
+                return data
+            if index == 0:
+                return b''
+            self._fill()
+
+    def next_part(self):
+        """Skip the rest of the current part; return the next part's headers, or None after the last."""
+        while self.read(self.chunk_size):
+            pass
+        while len(self.buffer) < len(self.delimiter) + 2:
+            self._fill()
+        del self.buffer[:len(self.delimiter)]
+        if self.buffer[:2] == b'--':
+            return None
+
+        while (end := self.buffer.find(b'\r\n\r\n')) < 0:
+            if len(self.buffer) > MAX_HEADER_BYTES:
+                raise UploadError(400, 'Multipart headers too large')
+            self._fill()
+        block = bytes(self.buffer[:end]).decode('utf-8', 'replace')
+        del self.buffer[:end + 4]
+
+        headers = Message()
+        for line in block.split('\r\n'):
+            name, separator, value = line.partition(':')
+            if separator:
+                headers[name.strip()] = value.strip()
+        return headers
+
+def safe_file_name(name):
+    name = os.path.basename((name or '').replace('\\', '/')).strip()
+    name = re.sub(r'[^\w.\- ]', '_', name)[:128].strip('. ')
+    return name or 'upload'
+
+def get_upload_directory(user_id, target, kind):
+    if kind == 'job':
+        return os.path.join(structure_interpreter.get_job_directory(user_id, target), "uploads")
+    return os.path.join("data", "users", user_id, target, "uploads")
+
+def store_stream(source, directory, name, content_type):
+    """
+    Copy one file from source into directory chunk by chunk, hashing as
+    it goes. Returns the input record; a partial file is removed on error.
+    """
+    upload_id = uuid.uuid4().hex[:16]
+    file_name = safe_file_name(name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{upload_id}_{file_name}")
+    partial_path = path + ".part"
+
+    digest = hashlib.sha256()
+    size = 0
+    preview = b''
+    try:
+        with open(partial_path, 'wb') as f:
+            while True:
+                chunk = source.read(_settings['chunk_size'])
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+                if len(preview) < _settings['preview_bytes']:
+                    preview += chunk[:_settings['preview_bytes'] - len(preview)]
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    metrics.observe('upload_bytes', size)
+    return {
+        'type': 'file',
+        'upload_id': upload_id,
+        'name': file_name,
+        'content_type': content_type,
+        'size': size,
+        'sha256': digest.hexdigest(),
+        'path': path,
+        # Text preview for the inputs list; the file itself stays on disk
+        'content': preview.decode('utf-8', 'replace'),
+        'timestamp': int(time.time())
+    }
+
+def index_uploads(user_id, records):
+    """Add the text files among the uploads to the search corpus."""
+    documents = []
+    for record in records:
+        if not (record['content_type'].startswith('text/') or record['name'].lower().endswith(TEXT_EXTENSIONS)):
+            continue
+        with open(record['path'], 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read(search_index.max_text_chars())
+        documents.append(search_index.make_document(
+            f"upload:{record['upload_id']}", text, user_id, 'upload', title=record['name'], ref=record['path'], timestamp=record['timestamp']
+        ))
+    search_index.add_documents(documents)
+
+def open_body(headers):
+    """A reader over the request body, rejecting oversize bodies before reading them."""
+    limit = _settings['max_upload_size']
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        return None, limit
+    if headers.get('Content-Length') is None:
+        raise UploadError(411, 'Content-Length or chunked transfer encoding is required')
+    try:
+        length = int(headers['Content-Length'])
+    except ValueError:
+        raise UploadError(400, 'Invalid Content-Length')
+    if length > limit:
+        raise UploadError(413, f"Upload exceeds {limit} bytes")
+    return length, limit
+
+def handle_upload(user_id, query, headers, stream):
+    """
+    Stream an upload into the job's (job_id) or structure's (structure_id)
+    input area and add it to their inputs.
+
+    The body is either the raw file (name in the "name" query parameter
+    or the X-File-Name header) or multipart/form-data with one or more
+    file parts. Raises UploadError with the HTTP status on failure.
+    """
+    if query.get('job_id'):
+        target, kind = query['job_id'], 'job'
+    else:
+        target, kind = query.get('structure_id'), 'structure'
+    if not target or not SAFE_ID.match(target):
+        raise UploadError(400, 'A job_id or structure_id is required')
+    if kind == 'job' and not os.path.isdir(structure_interpreter.get_job_directory(user_id, target)):
+        raise UploadError(404, 'Job not found')
+
+    length, limit = open_body(headers)
+    body = ChunkedReader(stream, limit) if length is None else LimitedReader(stream, length)
+    directory = get_upload_directory(user_id, target, kind)
+
+    content_type = Message()
+    content_type['Content-Type'] = headers.get('Content-Type', 'application/octet-stream')
+    records = []
+    try:
+        if content_type.get_content_type() == 'multipart/form-data':
+            boundary = content_type.get_param('boundary')
+            if not boundary:
+                raise UploadError(400, 'Multipart boundary missing')
+            parts = MultipartReader(body, boundary.encode('latin-1'), _settings['chunk_size'])
+            while (part := parts.next_part()) is not None:
+                # Form fields without a file name are skipped
+                if part.get_filename() is not None:
+                    records.append(store_stream(parts, directory, part.get_filename(), part.get_content_type()))
+            # Drain the epilogue so the connection can be reused
+            while body.read(_settings['chunk_size']):
+                pass
+        else:
+            name = query.get('name') or headers.get('X-File-Name')
+            records.append(store_stream(body, directory, name, content_type.get_content_type()))
+    except BaseException:
+        for record in records:
+            os.remove(record['path'])
+        raise
+
+    if not records:
+        raise UploadError(400, 'No file in upload')
+
+    index_uploads(user_id, records)
+    if kind == 'job':
+        structure_interpreter.add_job_inputs(user_id, target, records)
+    else:
+        structure_interpreter.add_structure_inputs(user_id, target, records)
+
+    log.info("Stored upload", extra={"fields": {
+        "user_id": user_id,
+        "target": target,
+        "files": len(records),
+        "bytes": sum(record['size'] for record in records)
+    }})
+    return {
+        'status': 'success',
+        'message': f"Uploaded {len(records)} file{'s' if len(records) != 1 else ''}",
+        'data': {'uploads': [{key: record[key] for key in ('upload_id', 'name', 'size', 'sha256')} for record in records]}
+    }
@@ -0,0 +1,123 @@
+import backend.logger as logger
+import backend.structure_interpreter as structure_interpreter
+import backend.application.search_index as search_index
+import time
+
+log = logger.get_logger("web_search")
+
+_settings = {
+    'provider': 'local',
+    'limit': 10
+}
+_provider = None
+
+class SearchProvider:
+    """
+    A search backend for the search_web action. search() returns result
+    dicts with title, summary, link and source, best first; the keys match
+    what execute_node.format_inputs reads, so results can be passed as
+    node inputs unchanged.
+    """
+
+    name = None
+
+    def search(self, query, user_id, limit):
+        raise NotImplementedError
+
+class LocalCorpusProvider(SearchProvider):
+    """Searches ingested feed items, uploads and earlier outputs (search_index)."""
+
+    name = 'local'
+
+    def search(self, query, user_id, limit):
+        return [{
+            'title': document.get('title'),
+            'summary': document.get('snippet'),
+            'link': document.get('link'),
+            'source': document.get('source'),
+            'ref': document.get('ref'),
+            'timestamp': document.get('timestamp'),
+            'score': document.get('score')
+        } for document in search_index.search(query, user_id, limit)]
+
+PROVIDERS = {
+    LocalCorpusProvider.name: LocalCorpusProvider
+}
+
+def register_provider(provider_class):
+    PROVIDERS[provider_class.name] = provider_class
+
+def configure(config):
+    global _provider
+
+    search_config = config.get('search', {})
+    _settings['limit'] = int(search_config.get('limit', _settings['limit']))
+    name = search_config.get('provider', _settings['provider'])
+    if name not in PROVIDERS:
+        log.warning("Unknown search provider, using local", extra={"fields": {"provider": name}})
+        name = 'local'
+    _settings['provider'] = name
+    _provider = PROVIDERS[name]()
+
+def get_provider():
+    global _provider
+
+    if _provider is None:
+        _provider = PROVIDERS[_settings['provider']]()
+    return _provider
+
+def handle_search_web(response):
+    """
+    Search the configured provider and attach the results as an input of
+    the job (job_id) or structure (structure_data) the request names.
+    """
+    request = response.get('request', {})
+    user_id = response.get('userid', '')
+    query = (request.get('query') or '').strip()
+
+    if not user_id:
+        response['status'] = 'error'
+        response['message'] = 'User not authenticated'
+        return response
+
+    if not query:
+        response['status'] = 'error'
+        response['message'] = 'Search query is required'
+        return response
+
+    job_id = request.get('job_id')
+    structure_id = (request.get('structure_data') or {}).get('id')
+    target = job_id or structure_id
+    if target and not structure_interpreter.SAFE_ID.match(str(target)):
+        response['status'] = 'error'
+        response['message'] = 'Invalid job_id or structure id'
+        return response
+
+    try:
+        limit = int(request.get('limit') or _settings['limit'])
+    except (TypeError, ValueError):
+        response['status'] = 'error'
+        response['message'] = 'limit must be a number'
+        return response
+    limit = min(max(limit, 1), 100)
+    provider = get_provider()
+    started = time.perf_counter()
+    results = provider.search(query, user_id, limit)
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    search_input = {
+        'type': 'web_search',
+        'query': query,
+        'provider': provider.name,
+        'results': results,
+        'timestamp': int(time.time())
+    }
+    if job_id:
+        structure_interpreter.add_job_inputs(user_id, job_id, [search_input])
+    elif structure_id:
+        structure_interpreter.add_structure_inputs(user_id, structure_id, [search_input])
+
+    response['status'] = 'success'
+    response['message'] = f"{len(results)} results for {query}"
+    response['data'] = {'query': query, 'results': results, 'took_ms': took_ms}
+    return response
@@ -1,7 +1,11 @@
 import backend.application.johto_handler as johto_handler
 import backend.application.process_handler as process_handler
+import backend.application.batch_handler as batch_handler
 import backend.application.choose_next_node as choose_next_node
 import backend.application.execute_node as execute_node
+import backend.application.feed_ingest as feed_ingest
+import backend.application.web_search as web_search
+import backend.application.retention as retention
 
 def handle_application_actions(request: dict) -> dict:
     if 'action' not in request['request']:
@@ -20,12 +24,45 @@ def handle_application_actions(request: dict) -> dict:
     if action == 'load_johto_data':
         return johto_handler.handle_load_johto_data(request)
     
+    if action == 'get_sync_status':
+        return johto_handler.handle_get_sync_status(request)
+    
+    if action == 'list_structures':
+        return johto_handler.handle_list_structures(request)
+    
+    if action == 'get_structure':
+        return johto_handler.handle_get_structure(request)
+    
     if action == 'start_process':
         return process_handler.start_process(request)
     
+    if action == 'start_batch':
+        return batch_handler.start_batch(request)
+    
+    if action == 'get_batch_status':
+        return batch_handler.get_batch_status(request)
+    
     if action == 'get_process_status':
         return process_handler.get_process_status(request['request'])
     
+    if action == 'get_process_trace':
+        return process_handler.get_process_trace(request['request'], user_id)
+    
+    if action == 'get_process_stats':
+        return process_handler.get_process_stats(request)
+    
+    if action == 'search_web':
+        return web_search.handle_search_web(request)
+    
+    if action == 'read_rss':
+        return feed_ingest.handle_read_rss(request)
+    
+    if action == 'get_archived_runs':
+        return retention.handle_get_archived_runs(request)
+    
+    if action == 'set_retention_policy':
+        return retention.handle_set_retention_policy(request)
+    
     if action == 'choose_next_node':
         return choose_next_node.handle_choose_next_node(request)
     
@@ -39,7 +76,7 @@ def handle_application_actions(request: dict) -> dict:
             request['message'] = 'Missing structure_id parameter'
             return request
             
-        files = execute_node.get_output_files(user_id, structure_id)
+        files = execute_node.get_output_files(user_id, structure_id, request['request'].get('batch_id'))
         request['status'] = 'success'
         request['data'] = {'files': files}
         return request
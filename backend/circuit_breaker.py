@@ -0,0 +1,92 @@
+import time
+import threading
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream is unhealthy.
+
+    After failure_threshold consecutive failures the breaker opens and
+    rejects calls for reset_timeout seconds. It then lets a limited number
+    of probe calls through (half-open): a successful probe closes it again,
+    a failed one reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._probes = 0
+        self._rejected = 0
+        self._last_error = None
+
+    def is_open(self):
+        """
+        True while calls are rejected and no probe is due yet. Unlike
+        allow(), this only reads the state: it reserves no probe and
+        counts no rejection (see record_rejection).
+        """
+        with self._lock:
+            return self._state == OPEN and time.time() - self._opened_at < self.reset_timeout
+
+    def record_rejection(self):
+        """Count a call turned away because this breaker is open."""
+        with self._lock:
+            self._rejected += 1
+
+    def allow(self):
+        """Return True when a call may go through, reserving a probe when half-open."""
+        with self._lock:
+            if self._state == OPEN:
+                if time.time() - self._opened_at < self.reset_timeout:
+                    self._rejected += 1
+                    return False
+                self._state = HALF_OPEN
+                self._probes = 0
+
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self._rejected += 1
+                    return False
+                self._probes += 1
+
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error else None
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.time()
+                self._probes = 0
+
+    def retry_after(self):
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(self.reset_timeout - (time.time() - self._opened_at), 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'rejected': self._rejected,
+                'last_error': self._last_error
+            }
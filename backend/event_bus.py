@@ -0,0 +1,77 @@
+import time
+import threading
+from collections import deque
+
+BUFFER_SIZE = 500
+
+_condition = threading.Condition()
+_buffers = {}
+_dropped = {}
+_last_id = 0
+
+def publish(user_id, event_type, data, process_id=None):
+    """
+    Record an event for a user and wake up every waiting subscriber.
+
+    Event ids increase monotonically across all users, so a client can
+    resume with the last id it received.
+    """
+    global _last_id
+
+    if not user_id:
+        return None
+
+    with _condition:
+        _last_id += 1
+        event = {
+            'id': _last_id,
+            'type': event_type,
+            'process_id': process_id,
+            'timestamp': time.time(),
+            'data': data
+        }
+        buffer = _buffers.setdefault(user_id, deque(maxlen=BUFFER_SIZE))
+        if len(buffer) == buffer.maxlen:
+            _dropped[user_id] = buffer[0]['id']
+        buffer.append(event)
+        _condition.notify_all()
+        return event['id']
+
+def _collect(user_id, last_event_id, process_id):
+    # Replay only from inside the buffer's window: an id older than the
+    # last dropped event, or newer than any issued (the server restarted),
+    # means the client has to refetch instead
+    if last_event_id > _last_id or 0 < last_event_id < _dropped.get(user_id, 0):
+        return [], True
+
+    buffer = _buffers.get(user_id)
+    if not buffer:
+        return [], False
+
+    events = [
+        event for event in buffer
+        if event['id'] > last_event_id and (not process_id or event['process_id'] == process_id)
+    ]
+    return events, False
+
+def wait_for_events(user_id, last_event_id=0, timeout=15, process_id=None):
+    """
+    Return events newer than last_event_id, waiting up to timeout seconds.
+
+    Returns:
+        (events, missed) where missed is True, with no events, when
+        last_event_id is outside the buffer's window and the client
+        should resync
+    """
+    deadline = time.time() + timeout
+    with _condition:
+        while True:
+            events, missed = _collect(user_id, last_event_id, process_id)
+            remaining = deadline - time.time()
+            if events or missed or remaining <= 0:
+                return events, missed
+            _condition.wait(remaining)
+
+def latest_event_id():
+    with _condition:
+        return _last_id
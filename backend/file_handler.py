@@ -1,28 +1,209 @@
+import backend.logger as logger
+import backend.metrics as metrics
 import os
 import json
 import time
+import atexit
+import hashlib
+import threading
 from pathlib import Path
+from contextlib import contextmanager
+import portalocker
+
+log = logger.get_logger("file_handler")
+
+LOCK_DIR = os.path.join("data", ".locks")
+# Files share this many locks; a lock covers every file that hashes to it
+LOCK_STRIPES = 64
+FSYNC_POLICIES = ('always', 'never')
+
+_settings = {
+    'fsync': 'never',
+    'write_behind_delay': 1.0
+}
+_stripe_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+_lock_files = {}
+_held = threading.local()
+# Write-behind: absolute path -> (JSON text, monotonic time it is due)
+_pending = {}
+_pending_changed = threading.Condition()
+_flusher = None
+
+def configure(config):
+    storage_config = config.get('storage', {})
+    policy = storage_config.get('fsync', _settings['fsync'])
+    _settings['fsync'] = policy if policy in FSYNC_POLICIES else 'always'
+    _settings['write_behind_delay'] = float(storage_config.get('write_behind_delay', _settings['write_behind_delay']))
 
 # File operations
 def ensure_directory(directory_path):
     Path(directory_path).mkdir(parents=True, exist_ok=True)
     return True
 
-def load_data(file_path, default=None):
-    if not os.path.exists(file_path):
-        return default
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def _stripe(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=4).digest(), 'little') % LOCK_STRIPES
 
-def save_data(file_path, data):
+def _lock_file(stripe):
+    lock_path = os.path.abspath(os.path.join(LOCK_DIR, f"{stripe}.lock"))
+    handle = _lock_files.get(lock_path)
+    if handle is None:
+        ensure_directory(os.path.dirname(lock_path))
+        handle = _lock_files[lock_path] = open(lock_path, 'a')
+    return handle
+
+@contextmanager
+def locked(file_path):
+    """
+    Hold the lock of file_path against other threads and, through a lock
+    file in data/.locks, other processes. Reentrant within a thread, so a
+    save_data inside the block does not wait on itself.
+    """
+    stripe = _stripe(os.path.abspath(file_path))
+    depths = _held.__dict__.setdefault('depths', {})
+    with _stripe_locks[stripe]:
+        if depths.get(stripe):
+            depths[stripe] += 1
+            try:
+                yield
+            finally:
+                depths[stripe] -= 1
+            return
+
+        handle = _lock_file(stripe)
+        portalocker.lock(handle, portalocker.LockFlags.EXCLUSIVE)
+        depths[stripe] = 1
+        try:
+            yield
+        finally:
+            depths[stripe] = 0
+            portalocker.unlock(handle)
+
+def _fsync_directory(directory):
+    if os.name != 'posix':
+        return
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+def _write_file(file_path, text):
+    """Replace file_path with text atomically: readers see the old or the new file, never a partial one."""
     directory = os.path.dirname(file_path)
     if directory:
         ensure_directory(directory)
-            
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+    temp_file = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(text)
+            if _settings['fsync'] == 'always':
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_file, file_path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    if _settings['fsync'] == 'always':
+        _fsync_directory(directory or '.')
+
+def load_data(file_path, default=None):
+    with _pending_changed:
+        pending = _pending.get(os.path.abspath(file_path))
+    if pending is not None:
+        return json.loads(pending[0])
+    if not os.path.exists(file_path):
+        return default
+    with metrics.timer('file_io_seconds', op='load'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+def save_data(file_path, data, write_behind=False):
+    """
+    Save data as JSON, replacing the file atomically under its lock.
+
+    With write_behind the write is buffered for up to
+    storage.write_behind_delay seconds and repeated saves of the file in
+    that time are coalesced into one. load_data sees buffered data at
+    once; other processes only after the flush.
+    """
+    with metrics.timer('file_io_seconds', op='save'):
+        text = json.dumps(data, indent=2)
+        if write_behind and _settings['write_behind_delay'] > 0:
+            _queue_write(file_path, text)
+        else:
+            with locked(file_path):
+                # Superseded by this write
+                with _pending_changed:
+                    _pending.pop(os.path.abspath(file_path), None)
+                _write_file(file_path, text)
+    if metrics.sampled():
+        metrics.observe('file_io_bytes', len(text), op='save')
     return True
 
+def update_data(file_path, update, default=None):
+    """
+    Read-modify-write file_path under its lock, so concurrent updates
+    from other threads or processes are not lost. update receives the
+    loaded data (or default) and returns the data to save, or None to
+    leave the file unchanged. Returns what was saved, or None.
+    """
+    with locked(file_path):
+        data = update(load_data(file_path, default))
+        if data is not None:
+            save_data(file_path, data)
+        return data
+
+def _queue_write(file_path, text):
+    global _flusher
+
+    key = os.path.abspath(file_path)
+    with _pending_changed:
+        if key in _pending:
+            metrics.inc('file_writes_coalesced_total')
+            _pending[key] = (text, _pending[key][1])
+        else:
+            _pending[key] = (text, time.monotonic() + _settings['write_behind_delay'])
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="write-behind", daemon=True)
+            _flusher.start()
+        _pending_changed.notify()
+
+def _flush_file(key):
+    with locked(key):
+        with _pending_changed:
+            pending = _pending.pop(key, None)
+        if pending is not None:
+            with metrics.timer('file_io_seconds', op='flush'):
+                _write_file(key, pending[0])
+
+def _flush_loop():
+    while True:
+        with _pending_changed:
+            while not _pending:
+                _pending_changed.wait()
+            now = time.monotonic()
+            due = [key for key, (_, due_at) in _pending.items() if due_at <= now]
+            if not due:
+                _pending_changed.wait(min(due_at for _, due_at in _pending.values()) - now)
+                continue
+        for key in due:
+            try:
+                _flush_file(key)
+            except OSError as e:
+                # Dropped rather than retried forever; the next save rewrites the file
+                metrics.inc('file_write_errors_total')
+                log.error("Write-behind flush failed", extra={"fields": {"path": key, "error": str(e)}})
+
+def flush():
+    """Write every buffered file now (on shutdown)."""
+    with _pending_changed:
+        keys = list(_pending)
+    for key in keys:
+        _flush_file(key)
+
+atexit.register(flush)
+
 # User data operations
 def get_user_data_file_path(user_id, base_path="data/users"):
     return os.path.join(base_path, user_id, "data.json")
@@ -34,12 +215,12 @@ def load_user_data(user_id, base_path="data/users"):
     user_data_path = os.path.join(user_dir, "data.json")
     return load_data(user_data_path, default={})
 
-def save_user_data(user_id, user_data, base_path="data/users"):
+def save_user_data(user_id, user_data, base_path="data/users", write_behind=False):
     user_dir = os.path.join(base_path, user_id)
     ensure_directory(user_dir)
     
     user_data_path = os.path.join(user_dir, "data.json")
-    return save_data(user_data_path, user_data)
+    return save_data(user_data_path, user_data, write_behind=write_behind)
 
 def is_user_id_valid(user_id, user_data_path):
     """Check if a user ID exists in the users database."""
@@ -69,9 +250,11 @@ def create_user_data_directory(user_id, username, email):
     return save_user_data(user_id, user_data)
 
 def update_last_login(user_id):
-    user_data = load_user_data(user_id)
-    user_data["last_login"] = int(time.time())
-    return save_user_data(user_id, user_data)
+    # Written behind: a burst of logins costs one rewrite
+    with locked(get_user_data_file_path(user_id)):
+        user_data = load_user_data(user_id)
+        user_data["last_login"] = int(time.time())
+        return save_user_data(user_id, user_data, write_behind=True)
 
 def get_user_settings(user_id):
     user_data = load_user_data(user_id)
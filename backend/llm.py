@@ -1,6 +1,142 @@
+import backend.llm_scheduler as llm_scheduler
+import backend.llm_router as llm_router
+import backend.metrics as metrics
+import backend.tracing as tracing
+import time
+import threading
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def generate_llm_response(prompt, max_length=500, temperature=1.0, top_k=50, top_p=0.9, repetition_penalty=1.0):  
+LATENCY_SAMPLES = 200
+DEFAULT_URL = "https://www.northbeach.fi/dolphin"
+
+_settings = {
+    'connect_timeout': 5,
+    'read_timeout': 120,
+    'hedge': {
+        'enabled': True,
+        # Used until enough latencies were observed to compute the quantile
+        'initial_delay': 10,
+        'quantile': 0.95,
+        'min_samples': 20
+    }
+}
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+_lock = threading.Lock()
+_stats = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'failures': 0}
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-request")
+llm_router.configure({'url': DEFAULT_URL})
+
+class UpstreamError(Exception):
+    """A failure that counts against an endpoint's circuit breaker (connection, timeout, 5xx)."""
+
+def configure(config):
+    global _pool
+
+    llm_config = {'url': DEFAULT_URL, **config.get('llm', {})}
+    llm_router.configure(llm_config)
+    # Without an explicit cap, every endpoint slot can be used at once
+    llm_scheduler.configure(config, default_concurrency=llm_router.total_capacity())
+
+    for key in ('connect_timeout', 'read_timeout'):
+        _settings[key] = llm_config.get(key, _settings[key])
+    _settings['hedge'].update(llm_config.get('hedge', {}))
+
+    # Every slot can have its primary and its hedge in flight
+    concurrency = llm_scheduler.stats()['concurrency']
+    _pool = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix="llm-request")
+
+def hedge_delay():
+    """Seconds to wait for the first request before sending a hedge: the observed latency quantile."""
+    hedge = _settings['hedge']
+    with _lock:
+        samples = sorted(_latencies)
+    if len(samples) < hedge['min_samples']:
+        return hedge['initial_delay']
+    return samples[min(int(len(samples) * hedge['quantile']), len(samples) - 1)]
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+def _post(endpoint, payload):
+    with tracing.span('llm.http', endpoint=endpoint.name) as span:
+        response = _request(endpoint, payload)
+        span['attrs']['status_code'] = response.status_code
+        span['attrs']['response_bytes'] = len(response.content)
+        return response
+
+def _request(endpoint, payload):
+    started = time.time()
+    try:
+        response = requests.post(
+            endpoint.url,
+            json=payload,
+            headers={"Accept": "application/json"},
+            timeout=(_settings['connect_timeout'], _settings['read_timeout'])
+        )
+        if response.status_code >= 500:
+            raise UpstreamError(f"HTTP Error: {response.status_code} {response.reason} from {endpoint.name}")
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        error = UpstreamError(f"Could not connect to the LLM server {endpoint.name}: {e}")
+        llm_router.release(endpoint, error=error)
+        raise error
+    except UpstreamError as e:
+        llm_router.release(endpoint, error=e)
+        raise
+    except Exception as e:
+        # Any other failure must still return the slot and probe it holds
+        llm_router.release(endpoint, error=e)
+        raise
+
+    latency = time.time() - started
+    llm_router.release(endpoint, latency=latency)
+    if metrics.sampled():
+        metrics.observe('llm_endpoint_seconds', latency, endpoint=endpoint.name)
+    with _lock:
+        _latencies.append(latency)
+    return response
+
+def _send(endpoint, payload, model=None):
+    """
+    Send the request, hedging it with a second identical request when the
+    first is slower than hedge_delay(). The hedge goes to another endpoint
+    when one has capacity. The first successful answer wins; the slower
+    request finishes in the background and is ignored.
+    """
+    primary = _pool.submit(tracing.wrap(_post), endpoint, payload)
+    if not _settings['hedge']['enabled']:
+        return primary.result()
+
+    done, _ = wait([primary], timeout=hedge_delay())
+    if done:
+        return primary.result()
+
+    hedge_endpoint = llm_router.acquire(model, exclude=(endpoint,), timeout=0) or llm_router.acquire(model, timeout=0)
+    if not hedge_endpoint:
+        return primary.result()
+
+    _count('hedges')
+    tracing.add_attributes(hedged=True, hedge_endpoint=hedge_endpoint.name)
+    hedge = _pool.submit(tracing.wrap(_post), hedge_endpoint, payload)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except UpstreamError as e:
+                error = e
+                continue
+            if future is hedge:
+                _count('hedge_wins')
+                tracing.add_attributes(hedge_won=True)
+            return response
+    raise error
+
+def generate_llm_response(prompt, max_length=500, temperature=1.0, top_k=50, top_p=0.9, repetition_penalty=1.0, user_id=None, priority=llm_scheduler.INTERACTIVE, model=None):
     payload = {
         "prompt": prompt,
         "max_length": max_length,
@@ -10,29 +146,70 @@ def generate_llm_response(prompt, max_length=500, temperature=1.0, top_k=50, top
         "repetition_penalty": repetition_penalty,
         "stream": False
     }
-    url = "https://www.northbeach.fi/dolphin"
+    if model:
+        payload["model"] = model
+
+    timer = metrics.timer('llm_request_seconds', priority=priority)
+    with timer, tracing.span('llm', model=model, priority=priority, prompt_bytes=len(prompt)) as span:
+        response = _generate(payload, model, user_id, priority)
+        outcome = 'error' if isinstance(response, dict) else 'ok'
+        span['attrs']['outcome'] = outcome
+        if timer is not metrics.null_timer:
+            timer.labels['outcome'] = outcome
+        return response
+
+def _generate(payload, model, user_id, priority):
+    if not llm_router.available(model):
+        return circuit_open_error(model)
 
     try:
-        response = requests.post(
-            url,
-            json=payload,
-            headers={"Accept": "application/json"}
-        )
-        
+        _count('requests')
+        with llm_scheduler.slot(user_id, priority) as waited:
+            # Picked once a slot is free; reserves the probe of a half-open endpoint
+            endpoint = llm_router.acquire(model)
+            if not endpoint:
+                return circuit_open_error(model)
+            tracing.add_attributes(queue_wait_ms=round(waited * 1000, 3), endpoint=endpoint.name)
+            try:
+                response = _send(endpoint, payload, model)
+            except Exception:
+                _count('failures')
+                raise
+
         response.raise_for_status()
         return response
 
-    except requests.exceptions.ConnectionError:
-        return {"status": "error", "message": "Could not connect to the LLM server"}
+    except llm_scheduler.SchedulerBusy as e:
+        return {"status": "error", "message": f"LLM busy: {e}", "busy": True}
+    except UpstreamError as e:
+        return {"status": "error", "message": str(e)}
     except requests.exceptions.HTTPError as e:
         return {"status": "error", "message": f"HTTP Error: {e}"}
     except Exception as e:
         return {"status": "error", "message": f"Error: {e}"}
-    
+
+def circuit_open_error(model=None):
+    return {
+        "status": "error",
+        "message": f"LLM server unavailable, retrying in {llm_router.retry_after(model):.1f}s",
+        "circuit_open": True
+    }
+
+def stats():
+    with _lock:
+        samples = len(_latencies)
+        counts = dict(_stats)
+    return {
+        **counts,
+        'latency_samples': samples,
+        'hedge_delay': round(hedge_delay(), 4),
+        'router': llm_router.stats()
+    }
+
 # create a test response to test the LLM
 # use main function to test the LLM
 
 if __name__ == "__main__":
     request = "Tell me a joke about a cat."
     response = generate_llm_response(request)
-    print(response.text)
\ No newline at end of file
+    print(response.text)
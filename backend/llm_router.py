@@ -0,0 +1,213 @@
+import backend.logger as logger
+from backend.circuit_breaker import CircuitBreaker
+import time
+import threading
+import requests
+
+log = logger.get_logger("llm_router")
+
+EWMA_ALPHA = 0.2
+STRATEGIES = ('ewma', 'least_outstanding')
+
+class Endpoint:
+    """One model server with its own concurrency cap, latency estimate and breaker."""
+
+    def __init__(self, config, breaker_config):
+        self.url = config['url']
+        self.name = config.get('name', self.url)
+        self.models = list(config.get('models', []))
+        self.max_concurrency = max(int(config.get('max_concurrency', 4)), 1)
+        self.health_url = config.get('health_url')
+        self.breaker = CircuitBreaker(self.name, **breaker_config)
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.requests = 0
+        self.failures = 0
+
+    def serves(self, model):
+        return not model or not self.models or model in self.models
+
+    def has_capacity(self):
+        return self.outstanding < self.max_concurrency
+
+    def score(self, strategy):
+        if strategy == 'least_outstanding':
+            return (self.outstanding / self.max_concurrency, self.ewma_latency or 0)
+        # Expected wait: the latency estimate scaled by the queue it would join
+        latency = self.ewma_latency if self.ewma_latency is not None else 0
+        return (latency * (self.outstanding + 1) / self.max_concurrency, self.outstanding)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'models': self.models,
+            'max_concurrency': self.max_concurrency,
+            'outstanding': self.outstanding,
+            'ewma_latency': round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+            'circuit_breaker': self.breaker.stats()
+        }
+
+_settings = {
+    'strategy': 'ewma',
+    'acquire_timeout': 30,
+    'health_interval': 30
+}
+_condition = threading.Condition()
+_endpoints = []
+_stop_event = threading.Event()
+_health_thread = None
+
+def configure(llm_config):
+    """
+    Build the endpoint list from the "llm" config section: either an
+    "endpoints" list or the single "url".
+    """
+    breaker_config = llm_config.get('circuit_breaker', {})
+    breaker_settings = {
+        'failure_threshold': int(breaker_config.get('failure_threshold', 5)),
+        'reset_timeout': float(breaker_config.get('reset_timeout', 30)),
+        'half_open_probes': int(breaker_config.get('half_open_probes', 1))
+    }
+    endpoint_configs = llm_config.get('endpoints') or [{'url': llm_config.get('url'), 'name': 'default'}]
+
+    strategy = llm_config.get('balancing', _settings['strategy'])
+    with _condition:
+        _settings['strategy'] = strategy if strategy in STRATEGIES else 'ewma'
+        _settings['acquire_timeout'] = float(llm_config.get('acquire_timeout', _settings['acquire_timeout']))
+        _settings['health_interval'] = float(llm_config.get('health_interval', _settings['health_interval']))
+        _endpoints[:] = [Endpoint(endpoint, breaker_settings) for endpoint in endpoint_configs if endpoint.get('url')]
+
+def total_capacity():
+    with _condition:
+        return sum(endpoint.max_concurrency for endpoint in _endpoints)
+
+def available(model=None):
+    """
+    True when at least one endpoint serving model is not failing fast.
+    Otherwise the request is rejected, which counts against every breaker.
+    """
+    with _condition:
+        candidates = [endpoint for endpoint in _endpoints if endpoint.serves(model)]
+    if any(not endpoint.breaker.is_open() for endpoint in candidates):
+        return True
+    for endpoint in candidates:
+        endpoint.breaker.record_rejection()
+    return False
+
+def retry_after(model=None):
+    with _condition:
+        candidates = [endpoint for endpoint in _endpoints if endpoint.serves(model)]
+    return min((endpoint.breaker.retry_after() for endpoint in candidates), default=0)
+
+def _pick(model, exclude):
+    candidates = [
+        endpoint for endpoint in _endpoints
+        if endpoint.serves(model) and endpoint not in exclude and endpoint.has_capacity()
+    ]
+    # Nodes asking for a model nobody lists fall back to any endpoint
+    if model and not any(endpoint.serves(model) and endpoint.models for endpoint in _endpoints):
+        candidates = [endpoint for endpoint in _endpoints if endpoint not in exclude and endpoint.has_capacity()]
+
+    for endpoint in sorted(candidates, key=lambda endpoint: endpoint.score(_settings['strategy'])):
+        if endpoint.breaker.allow():
+            return endpoint
+    return None
+
+def acquire(model=None, exclude=(), timeout=None):
+    """
+    Reserve the best endpoint for a request: healthy, serving model, below
+    its concurrency cap, and lowest by the balancing strategy. Waits for
+    capacity up to timeout seconds; returns None when none becomes free.
+    """
+    timeout = _settings['acquire_timeout'] if timeout is None else timeout
+    deadline = time.time() + timeout
+    with _condition:
+        while True:
+            endpoint = _pick(model, exclude)
+            if endpoint:
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+                return endpoint
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            _condition.wait(min(remaining, 1.0))
+
+def release(endpoint, latency=None, error=None):
+    with _condition:
+        endpoint.outstanding = max(endpoint.outstanding - 1, 0)
+        if error is None:
+            if latency is not None:
+                endpoint.ewma_latency = latency if endpoint.ewma_latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * endpoint.ewma_latency
+                )
+        else:
+            endpoint.failures += 1
+        _condition.notify_all()
+
+    if error is None:
+        endpoint.breaker.record_success()
+    else:
+        endpoint.breaker.record_failure(error)
+
+def check_health():
+    """Probe endpoints that have a health_url and feed the result to their breakers."""
+    with _condition:
+        endpoints = [endpoint for endpoint in _endpoints if endpoint.health_url]
+
+    for endpoint in endpoints:
+        try:
+            response = requests.get(endpoint.health_url, timeout=5)
+            healthy = response.status_code < 500
+        except requests.exceptions.RequestException:
+            healthy = False
+
+        if healthy:
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure('Health check failed')
+
+    with _condition:
+        _condition.notify_all()
+
+def _health_loop():
+    while not _stop_event.wait(_settings['health_interval']):
+        try:
+            check_health()
+        except Exception as e:
+            log.error("LLM endpoint health check failed", extra={"fields": {"error": str(e)}})
+
+def start():
+    global _health_thread
+
+    with _condition:
+        if not any(endpoint.health_url for endpoint in _endpoints):
+            return
+    _stop_event.clear()
+    _health_thread = threading.Thread(target=_health_loop, name="llm-health", daemon=True)
+    _health_thread.start()
+
+def stop():
+    _stop_event.set()
+    if _health_thread:
+        _health_thread.join(timeout=1)
+
+def collect_metrics():
+    samples = []
+    with _condition:
+        for endpoint in _endpoints:
+            labels = {'endpoint': endpoint.name}
+            samples.append(('llm_endpoint_outstanding', 'gauge', labels, endpoint.outstanding))
+            samples.append(('llm_endpoint_open', 'gauge', labels, 0 if endpoint.breaker.stats()['state'] == 'closed' else 1))
+            samples.append(('llm_endpoint_failures_total', 'counter', labels, endpoint.failures))
+    return samples
+
+def stats():
+    with _condition:
+        return {
+            'strategy': _settings['strategy'],
+            'endpoints': [endpoint.stats() for endpoint in _endpoints]
+        }
@@ -0,0 +1,210 @@
+import backend.metrics as metrics
+import time
+import threading
+from contextlib import contextmanager
+from collections import deque
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)
+WAIT_SAMPLES = 200
+
+class SchedulerBusy(Exception):
+    """Raised when a priority class queue is full or a wait times out."""
+
+_settings = {
+    'concurrency': 4,
+    # Slots batch work may never take, so interactive calls rarely wait
+    'interactive_reserve': 1,
+    'max_queue': 100,
+    'max_wait': 120,
+    'weights': {}
+}
+_condition = threading.Condition()
+_in_use = 0
+_seq = 0
+_queues = {priority: {} for priority in PRIORITIES}
+# Kept only for users with queued or in-flight requests
+_virtual_time = {priority: {} for priority in PRIORITIES}
+_in_flight = {priority: {} for priority in PRIORITIES}
+_waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+_served = {priority: 0 for priority in PRIORITIES}
+_rejected = {priority: 0 for priority in PRIORITIES}
+
+def configure(config, default_concurrency=None):
+    scheduler_config = config.get('llm_scheduler', {})
+    with _condition:
+        concurrency = scheduler_config.get('concurrency', default_concurrency or _settings['concurrency'])
+        _settings['concurrency'] = max(1, int(concurrency))
+        _settings['interactive_reserve'] = min(
+            int(scheduler_config.get('interactive_reserve', _settings['interactive_reserve'])),
+            _settings['concurrency'] - 1
+        )
+        _settings['max_queue'] = int(scheduler_config.get('max_queue', _settings['max_queue']))
+        _settings['max_wait'] = float(scheduler_config.get('max_wait', _settings['max_wait']))
+        _settings['weights'] = dict(scheduler_config.get('weights', {}))
+        _dispatch()
+
+def _weight(user_id):
+    return max(float(_settings['weights'].get(user_id, 1)), 0.01)
+
+def _queue_depth(priority):
+    return sum(len(tickets) for tickets in _queues[priority].values())
+
+def _forget_if_idle(priority, user_id):
+    """Drop the virtual time of a user with nothing queued or in flight; they rejoin at the current minimum."""
+    if user_id not in _queues[priority] and not _in_flight[priority].get(user_id):
+        _in_flight[priority].pop(user_id, None)
+        _virtual_time[priority].pop(user_id, None)
+
+def _next_ticket(priority):
+    """
+    Pick the head ticket of the user with the lowest virtual time.
+
+    Each grant advances the user's virtual time by 1 / weight, so over time
+    users receive slots in proportion to their weights regardless of how
+    many requests each one queues.
+    """
+    queues = _queues[priority]
+    if not queues:
+        return None
+
+    virtual_time = _virtual_time[priority]
+    user_id = min(queues, key=lambda user_id: (virtual_time.get(user_id, 0), queues[user_id][0]['seq']))
+    ticket = queues[user_id].popleft()
+    if not queues[user_id]:
+        del queues[user_id]
+    virtual_time[user_id] = virtual_time.get(user_id, 0) + 1 / _weight(user_id)
+    return ticket
+
+def _dispatch():
+    global _in_use
+
+    while _in_use < _settings['concurrency']:
+        ticket = _next_ticket(INTERACTIVE)
+        if not ticket and _in_use < _settings['concurrency'] - _settings['interactive_reserve']:
+            ticket = _next_ticket(BATCH)
+        if not ticket:
+            break
+        ticket['granted'] = True
+        in_flight = _in_flight[ticket['priority']]
+        in_flight[ticket['user_id']] = in_flight.get(ticket['user_id'], 0) + 1
+        _in_use += 1
+    _condition.notify_all()
+
+def acquire(user_id=None, priority=INTERACTIVE, timeout=None):
+    """
+    Wait for an LLM slot.
+
+    Raises SchedulerBusy when the priority class already has max_queue
+    waiting requests or when no slot is granted within timeout seconds
+    (max_wait by default), so callers can back off instead of piling up.
+    Returns the time spent waiting in seconds.
+    """
+    global _seq
+
+    priority = priority if priority in PRIORITIES else INTERACTIVE
+    user_id = user_id or ''
+    timeout = _settings['max_wait'] if timeout is None else timeout
+
+    with _condition:
+        if _queue_depth(priority) >= _settings['max_queue']:
+            _rejected[priority] += 1
+            raise SchedulerBusy(f"LLM queue for {priority} requests is full")
+
+        # A user returning after being idle starts at the current minimum,
+        # so idle time cannot be banked as credit
+        virtual_time = _virtual_time[priority]
+        active = [virtual_time.get(uid, 0) for uid in _queues[priority]]
+        if user_id not in _queues[priority] and active:
+            virtual_time[user_id] = max(virtual_time.get(user_id, 0), min(active))
+
+        _seq += 1
+        ticket = {'seq': _seq, 'user_id': user_id, 'priority': priority, 'granted': False, 'queued_at': time.time()}
+        _queues[priority].setdefault(user_id, deque()).append(ticket)
+        _dispatch()
+
+        deadline = ticket['queued_at'] + timeout
+        while not ticket['granted']:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                tickets = _queues[priority].get(user_id)
+                if tickets and ticket in tickets:
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del _queues[priority][user_id]
+                _forget_if_idle(priority, user_id)
+                _rejected[priority] += 1
+                raise SchedulerBusy(f"Timed out waiting {timeout:g}s for an LLM slot")
+            _condition.wait(remaining)
+
+        waited = time.time() - ticket['queued_at']
+        _waits[priority].append(waited)
+        metrics.observe('llm_queue_wait_seconds', waited, priority=priority)
+        _served[priority] += 1
+        return waited
+
+def release(user_id=None, priority=INTERACTIVE):
+    """Return the slot acquire() granted for user_id and priority."""
+    global _in_use
+
+    priority = priority if priority in PRIORITIES else INTERACTIVE
+    user_id = user_id or ''
+    with _condition:
+        _in_use = max(_in_use - 1, 0)
+        in_flight = _in_flight[priority]
+        if in_flight.get(user_id):
+            in_flight[user_id] -= 1
+        _forget_if_idle(priority, user_id)
+        _dispatch()
+
+@contextmanager
+def slot(user_id=None, priority=INTERACTIVE, timeout=None):
+    """Hold one LLM slot for the duration of the with block; yields the seconds waited."""
+    waited = acquire(user_id, priority, timeout)
+    try:
+        yield waited
+    finally:
+        release(user_id, priority)
+
+def _wait_summary(samples):
+    if not samples:
+        return {'count': 0, 'avg': 0, 'p95': 0, 'max': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'avg': round(sum(ordered) / len(ordered), 4),
+        'p95': round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 4),
+        'max': round(ordered[-1], 4)
+    }
+
+def collect_metrics():
+    with _condition:
+        samples = [('llm_slots_in_use', 'gauge', {}, _in_use), ('llm_slots', 'gauge', {}, _settings['concurrency'])]
+        for priority in PRIORITIES:
+            samples.append(('llm_queue_depth', 'gauge', {'priority': priority}, _queue_depth(priority)))
+            samples.append(('llm_requests_rejected_total', 'counter', {'priority': priority}, _rejected[priority]))
+        return samples
+
+def stats(user_id=None):
+    """Scheduler state; waiting_users only lists user_id when given."""
+    with _condition:
+        return {
+            'concurrency': _settings['concurrency'],
+            'interactive_reserve': _settings['interactive_reserve'],
+            'in_use': _in_use,
+            'max_queue': _settings['max_queue'],
+            'classes': {
+                priority: {
+                    'queue_depth': _queue_depth(priority),
+                    'waiting_users': {
+                        waiting_user: len(tickets) for waiting_user, tickets in _queues[priority].items()
+                        if user_id is None or waiting_user == user_id
+                    },
+                    'served': _served[priority],
+                    'rejected': _rejected[priority],
+                    'wait_seconds': _wait_summary(_waits[priority])
+                }
+                for priority in PRIORITIES
+            }
+        }
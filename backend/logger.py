@@ -0,0 +1,46 @@
+import sys
+import json
+import time
+import logging
+
+LOGGER_NAME = "newsroom"
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including extra fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as key=value pairs."""
+
+    def format(self, record):
+        fields = getattr(record, 'fields', {}) or {}
+        suffix = ''.join(f" {key}={value}" for key, value in fields.items())
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} {record.name}: {record.getMessage()}{suffix}"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+def configure(config):
+    """Set up the application logger from the "logging" config section."""
+    log_config = config.get('logging', {})
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(StructuredFormatter() if log_config.get('format', 'text') == 'json' else TextFormatter())
+
+    root = logging.getLogger(LOGGER_NAME)
+    root.handlers[:] = [handler]
+    root.setLevel(str(log_config.get('level', 'info')).upper())
+    root.propagate = False
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
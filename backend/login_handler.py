@@ -44,7 +44,7 @@ def handle_login(response, cookie, user_data_path):
             
             file_handler.update_last_login(user_id)
             
-            auto_job_id = structure_interpreter.create_job_from_saved_structures(user_id)
+            auto_job_scheduled = structure_interpreter.schedule_job_from_saved_structures(user_id)
             
             response["status"] = "success"
             response["message"] = "Login successful"
@@ -57,9 +57,8 @@ def handle_login(response, cookie, user_data_path):
                 }
             }
             
-            if auto_job_id:
-                response["data"]["auto_job_created"] = True
-                response["data"]["auto_job_id"] = auto_job_id
+            if auto_job_scheduled:
+                response["data"]["auto_job_scheduled"] = True
             
             response["set-cookie"] = cookie["userid"].OutputString()
             break
@@ -82,31 +81,28 @@ def handle_register(response, cookie, user_data_path):
     password = request["data"]["password"]
     
     username = email.split('@')[0]
-    
-    users = file_handler.load_data(user_data_path)
-    if not users:
-        users = {}
-    
-    for user_data in users.values():
-        if user_data.get("email") == email:
-            response["status"] = "error"
-            response["message"] = "Email already registered"
-            return response
-    
     user_id = str(uuid.uuid4())
-    users[user_id] = {
-        "username": username,
-        "email": email,
-        "password": password,
-        "created_at": int(time.time())
-    }
     
-    if not file_handler.create_user_data_directory(user_id, username, email):
+    def add_user(users):
+        # Checked under the file lock, so two registrations cannot both pass
+        users = users or {}
+        for user_data in users.values():
+            if user_data.get("email") == email:
+                return None
+        users[user_id] = {
+            "username": username,
+            "email": email,
+            "password": password,
+            "created_at": int(time.time())
+        }
+        return users
+    
+    if file_handler.update_data(user_data_path, add_user, {}) is None:
         response["status"] = "error"
-        response["message"] = "Failed to create user data"
+        response["message"] = "Email already registered"
         return response
     
-    if file_handler.save_data(user_data_path, users):
+    if file_handler.create_user_data_directory(user_id, username, email):
         cookie["userid"] = user_id
         cookie["userid"]["path"] = "/"
         cookie["userid"]["max-age"] = 86400
@@ -125,7 +121,7 @@ def handle_register(response, cookie, user_data_path):
         response["set-cookie"] = cookie["userid"].OutputString()
     else:
         response["status"] = "error"
-        response["message"] = "Failed to register user"
+        response["message"] = "Failed to create user data"
     
     return response
 
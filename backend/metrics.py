@@ -0,0 +1,179 @@
+import time
+import random
+import bisect
+import threading
+from contextlib import nullcontext
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_settings = {
+    'enabled': True,
+    'sample_rate': 1.0
+}
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {}
+_collectors = []
+# Returned by timer() for unsampled calls; compare with `is` to skip extra work
+null_timer = nullcontext()
+
+def configure(config):
+    metrics_config = config.get('metrics', {})
+    _settings['enabled'] = bool(metrics_config.get('enabled', _settings['enabled']))
+    _settings['sample_rate'] = float(metrics_config.get('sample_rate', _settings['sample_rate']))
+
+def enabled():
+    return _settings['enabled']
+
+def describe(name, text, buckets=None):
+    """Set the help text (and histogram buckets) of a metric."""
+    _help[name] = (text, tuple(buckets) if buckets else DEFAULT_BUCKETS)
+
+def sampled():
+    if not _settings['enabled']:
+        return False
+    rate = _settings['sample_rate']
+    return rate >= 1 or random.random() < rate
+
+def _key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+def inc(name, value=1, **labels):
+    if not _settings['enabled']:
+        return
+    key = _key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+def observe(name, value, **labels):
+    """Record a value in a histogram. Callers decide on sampling (see sampled())."""
+    if not _settings['enabled']:
+        return
+    buckets = _help.get(name, (None, DEFAULT_BUCKETS))[1]
+    key = _key(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'started')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.labels['error'] = exc_type.__name__
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+def timer(name, **labels):
+    """
+    Time a block into a histogram: `with metrics.timer('x_seconds', action=a):`.
+
+    Returns a shared no-op context when metrics are disabled or the call
+    is not sampled, so the hot path pays for one check.
+    """
+    if not sampled():
+        return null_timer
+    return _Timer(name, labels)
+
+def register_collector(collector):
+    """
+    Register a function called at scrape time that returns
+    (name, type, labels, value) tuples, for gauges read from other modules.
+    """
+    _collectors.append(collector)
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = []
+    for label, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{label}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        histograms = {
+            name: {key: {**histogram, 'counts': list(histogram['counts'])} for key, histogram in series.items()}
+            for name, series in _histograms.items()
+        }
+
+    for name in sorted(counters):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name][0]}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in counters[name].items():
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+    for name in sorted(histograms):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name][0]}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in histograms[name].items():
+            cumulative = 0
+            for bound, count in zip(list(histogram['buckets']) + [float('inf')], histogram['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+
+    gauges = {}
+    for collector in _collectors:
+        try:
+            for name, metric_type, labels, value in collector():
+                gauges.setdefault((name, metric_type), []).append((labels, value))
+        except Exception as e:
+            lines.append(f"# collector {getattr(collector, '__name__', 'unknown')} failed: {str(e)}")
+    for (name, metric_type), samples in sorted(gauges.items()):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name][0]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(_key(labels))} {_format_value(value)}")
+
+    return '\n'.join(lines) + '\n'
+
+describe('http_request_seconds', 'Time spent handling POST requests, by action')
+describe('http_request_bytes', 'Size of POST request bodies, by action', SIZE_BUCKETS)
+describe('http_response_bytes', 'Size of JSON responses, by action', SIZE_BUCKETS)
+describe('llm_request_seconds', 'Wall time of LLM calls including queueing, by outcome')
+describe('llm_endpoint_seconds', 'Latency of successful HTTP calls to each LLM endpoint')
+describe('llm_queue_wait_seconds', 'Time spent waiting for an LLM slot, by priority')
+describe('file_io_seconds', 'Time spent loading and saving JSON files, by operation')
+describe('file_io_bytes', 'Size of JSON files saved', SIZE_BUCKETS)
+describe('file_writes_coalesced_total', 'Buffered JSON saves replaced by a later save before being written')
+describe('file_write_errors_total', 'Buffered JSON saves that failed to flush')
+describe('feed_fetch_seconds', 'Time to download and parse one feed')
+describe('upload_bytes', 'Size of uploaded files', SIZE_BUCKETS + (16777216, 67108864, 268435456))
+describe('http_rejected_total', 'Requests refused before their body was read, by reason')
+describe('near_duplicates_total', 'Near-duplicate inputs and outputs found, by kind and action')
+describe('similarity_seconds', 'Time to cluster or rank the items of a similarity node, by method')
+describe('retention_pass_seconds', 'Duration of a retention pass over all structures', (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+describe('retention_runs_archived_total', 'Finished runs moved from process.json to compressed archives')
+describe('retention_files_packed_total', 'Files in old/ output directories packed into tarballs')
+describe('retention_archives_deleted_total', 'Run archives and output packs deleted to stay within max_bytes')
@@ -0,0 +1,224 @@
+import re
+import math
+import json
+import threading
+
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# Chat formats by name: how system/user turns are wrapped, and the marker
+# after which the model's answer starts in the echoed response
+CHAT_FORMATS = {
+    'im': {
+        'system': '<|im_system|>\n{text}\n<|im_end|>\n',
+        'user': '<|im_user|>\n{text}\n<|im_end|>\n',
+        'assistant': '<|im_assistant|>\n'
+    },
+    'chatml': {
+        'system': '<|im_start|>system\n{text}<|im_end|>\n',
+        'user': '<|im_start|>user\n{text}<|im_end|>\n',
+        'assistant': '<|im_start|>assistant\n'
+    },
+    'plain': {
+        'system': '{text}\n\n',
+        'user': '{text}\n\n',
+        'assistant': 'Answer:\n'
+    }
+}
+
+TEMPLATES = {
+    'generate_file': {
+        'system': 'You are a helpful assistant that generates file content based on instructions.',
+        'user': '''Generate content for a file based on the following information:
+
+Header: {{header}}
+Instructions: {{instructions}}
+{{input_section}}
+Your task is to generate appropriate content for a file based on this information.
+Keep the content concise and focused on the requirements in the instructions.'''
+    },
+    'choose_next_node': {
+        'system': 'You are a helpful assistant.',
+        'user': '''This is the current node:
+{{node}}.
+
+These are the possible next nodes:
+{{candidates}}.
+
+Choose the next node based on the current node and the possible next nodes.
+
+Provide the next node id in the following format:
+{"next_node_id": <next_node_id>}
+
+Task: Return only one message that includes a valid JSON object with the next_node_id.'''
+    }
+}
+
+_settings = {
+    'format': 'im',
+    'model_formats': {},
+    'max_prompt_tokens': 3000
+}
+_lock = threading.Lock()
+_compiled = {}
+_metrics = {}
+
+def configure(config):
+    prompt_config = config.get('prompts', {})
+    _settings['format'] = prompt_config.get('format', _settings['format'])
+    _settings['model_formats'] = dict(prompt_config.get('model_formats', {}))
+    _settings['max_prompt_tokens'] = int(prompt_config.get('max_prompt_tokens', _settings['max_prompt_tokens']))
+    with _lock:
+        _compiled.clear()
+
+def compile_template(text):
+    """Split a template into literal parts and placeholder names once."""
+    parts = []
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        parts.append((text[position:match.start()], match.group(1)))
+        position = match.end()
+    parts.append((text[position:], None))
+    return parts
+
+def format_value(value):
+    if isinstance(value, list):
+        return format_candidates(value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def fill(parts, values):
+    return ''.join(literal + (format_value(values.get(name, '')) if name else '') for literal, name in parts)
+
+def get_format(model=None):
+    name = _settings['model_formats'].get(model, _settings['format']) if model else _settings['format']
+    return name if name in CHAT_FORMATS else 'im'
+
+def assistant_marker(model=None):
+    return CHAT_FORMATS[get_format(model)]['assistant'].strip()
+
+def get_template(name, model=None):
+    """Return the compiled template for name in the chat format of model, compiling it on first use."""
+    chat_format = get_format(model)
+    key = (name, chat_format)
+    with _lock:
+        compiled = _compiled.get(key)
+    if compiled:
+        return compiled
+
+    template = TEMPLATES[name]
+    wrappers = CHAT_FORMATS[chat_format]
+    text = (
+        wrappers['system'].format(text=template['system']) +
+        wrappers['user'].format(text=template['user']) +
+        wrappers['assistant']
+    )
+    compiled = compile_template(text)
+    with _lock:
+        _compiled[key] = compiled
+    return compiled
+
+def estimate_tokens(text):
+    """Rough token count: about four characters per token for English text."""
+    return math.ceil(len(text) / 4) if text else 0
+
+def trim_to_tokens(text, budget):
+    """
+    Shorten text to about budget tokens, keeping whole sentences where
+    possible and marking the cut with an ellipsis.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    limit = max(budget * 4, 0)
+    if limit == 0:
+        return ''
+    cut = text[:limit]
+    sentence_end = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '), cut.rfind('\n'))
+    if sentence_end > limit // 2:
+        cut = cut[:sentence_end + 1]
+    return cut.rstrip() + ' …'
+
+def fit_candidates(candidates, budget):
+    """
+    Trim candidate prompts so all candidates fit in budget tokens.
+
+    Ids and headers are always kept. Prompt text shares what is left;
+    short prompts keep their full text and the space they leave over is
+    shared among the longer ones.
+    """
+    overhead = sum(estimate_tokens(json.dumps({'id': c['id'], 'header': c['header'], 'prompt': ''})) for c in candidates)
+    remaining = max(budget - overhead, 0)
+
+    by_length = sorted(range(len(candidates)), key=lambda i: estimate_tokens(candidates[i]['prompt']))
+    trimmed = [dict(candidate) for candidate in candidates]
+    for position, index in enumerate(by_length):
+        share = remaining // (len(by_length) - position)
+        prompt = candidates[index]['prompt']
+        trimmed[index]['prompt'] = trim_to_tokens(prompt, share)
+        remaining -= estimate_tokens(trimmed[index]['prompt'])
+    return trimmed
+
+def format_candidates(candidates):
+    """Render candidates as a compact JSON array with one candidate per line."""
+    return '[\n' + ',\n'.join(json.dumps(candidate, ensure_ascii=False) for candidate in candidates) + '\n]'
+
+def render(name, model=None, budget_field=None, **values):
+    """
+    Render a template, keeping it within max_prompt_tokens.
+
+    Lists (candidate nodes) are rendered one item per line and dicts as
+    compact JSON. When the prompt is over budget, budget_field is fit into
+    whatever the rest of the prompt leaves: candidate lists with
+    fit_candidates, text with trim_to_tokens. Prompt token counts are
+    recorded per template.
+    """
+    parts = get_template(name, model)
+    prompt = fill(parts, values)
+    tokens = estimate_tokens(prompt)
+    trimmed = False
+
+    if budget_field and tokens > _settings['max_prompt_tokens']:
+        without = estimate_tokens(fill(parts, {**values, budget_field: ''}))
+        available = max(_settings['max_prompt_tokens'] - without, 0)
+        value = values.get(budget_field, '')
+        if isinstance(value, list):
+            values[budget_field] = fit_candidates(value, available)
+        else:
+            values[budget_field] = trim_to_tokens(str(value), available)
+        prompt = fill(parts, values)
+        tokens = estimate_tokens(prompt)
+        trimmed = True
+
+    record(name, tokens, trimmed)
+    return prompt
+
+def record(name, tokens, trimmed=False):
+    with _lock:
+        metrics = _metrics.setdefault(name, {'calls': 0, 'prompt_tokens': 0, 'max_prompt_tokens': 0, 'trimmed': 0})
+        metrics['calls'] += 1
+        metrics['prompt_tokens'] += tokens
+        metrics['max_prompt_tokens'] = max(metrics['max_prompt_tokens'], tokens)
+        if trimmed:
+            metrics['trimmed'] += 1
+
+def collect_metrics():
+    samples = []
+    with _lock:
+        for name, metrics in _metrics.items():
+            samples.append(('prompt_tokens_total', 'counter', {'template': name}, metrics['prompt_tokens']))
+            samples.append(('prompt_calls_total', 'counter', {'template': name}, metrics['calls']))
+            samples.append(('prompt_trimmed_total', 'counter', {'template': name}, metrics['trimmed']))
+    return samples
+
+def stats():
+    with _lock:
+        return {
+            'max_prompt_tokens': _settings['max_prompt_tokens'],
+            'templates': {
+                name: {
+                    **metrics,
+                    'avg_prompt_tokens': round(metrics['prompt_tokens'] / metrics['calls'], 1) if metrics['calls'] else 0
+                }
+                for name, metrics in _metrics.items()
+            }
+        }
@@ -1,10 +1,16 @@
 import http.server
 import json
+import time
 from http.cookies import SimpleCookie
+from urllib.parse import urlparse, parse_qs
+import backend.event_bus as event_bus
+import backend.metrics as metrics
+import backend.traffic_capture as traffic_capture
 import backend.file_handler as file_handler
 import backend.html_constructor as html_constructor
 import backend.login_handler as login_handler
 import backend.application_handler as application_handler
+import backend.application.upload_handler as upload_handler
 
 def create_request_handler(server, config):
     class RequestHandler(http.server.SimpleHTTPRequestHandler):
@@ -20,7 +26,30 @@ def create_request_handler(server, config):
             self.send_header('Access-Control-Allow-Headers', 'Content-Type')
             self.end_headers()
             
+        def send_response(self, code, message=None):
+            self.status_code = code
+            super().send_response(code, message)
+        
         def do_GET(self):
+            if urlparse(self.path).path == '/events':
+                self.handle_events()
+                return
+            started = time.perf_counter()
+            self.dispatch_get()
+            if traffic_capture.enabled():
+                cookie = SimpleCookie(self.headers.get('Cookie'))
+                traffic_capture.record(
+                    cookie['userid'].value if 'userid' in cookie else self.client_address[0],
+                    'GET',
+                    self.path,
+                    duration=time.perf_counter() - started,
+                    status=getattr(self, 'status_code', None)
+                )
+        
+        def dispatch_get(self):
+            if urlparse(self.path).path == '/metrics':
+                self.send_metrics_response()
+                return
             if self.path == '/':
                 response = html_constructor.generate_html(self.config)
                 self.send_html_response(response)
@@ -32,8 +61,43 @@ def create_request_handler(server, config):
             return
         
         def do_POST(self):
+            if urlparse(self.path).path == '/upload':
+                self.handle_upload()
+                return
+            rejection = self.check_request_size()
+            if rejection:
+                self.send_error_response(*rejection)
+                return
+            started = time.perf_counter()
+            timer = metrics.timer('http_request_seconds')
+            with timer:
+                request, response, cookie = self.dispatch_post()
+                # Some actions answer with a new dict, so the action comes from the request
+                action = request.get("action", "none")
+                if timer is not metrics.null_timer:
+                    timer.labels['action'] = action
+                body = self.send_json_response(response, cookie)
+                if timer is not metrics.null_timer:
+                    metrics.observe('http_request_bytes', int(self.headers.get('Content-Length') or 0), action=action)
+                    metrics.observe('http_response_bytes', body, action=action)
+            if traffic_capture.enabled():
+                traffic_capture.record(
+                    response.get("userid") or self.client_address[0],
+                    'POST',
+                    self.path,
+                    action,
+                    request,
+                    int(self.headers.get('Content-Length') or 0),
+                    body,
+                    time.perf_counter() - started,
+                    response.get("status")
+                )
+            return
+        
+        def dispatch_post(self):
             response = {}
-            response["request"] = self.load_request_dictionary()
+            request = self.load_request_dictionary()
+            response["request"] = request
             cookie = SimpleCookie(self.headers.get('Cookie'))
 
             if 'userid' in cookie and file_handler.is_user_id_valid(cookie['userid'].value, config["user_data_path"]):
@@ -47,8 +111,118 @@ def create_request_handler(server, config):
                 else:
                     response = application_handler.handle_application_actions(response)
                     
-            self.send_json_response(response, cookie)
-            return
+            return request, response, cookie
+        
+        def check_request_size(self):
+            """(status, message) when a JSON body must be refused before it is read."""
+            if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+                return 411, 'Content-Length is required'
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                return 400, 'Invalid Content-Length'
+            limit = self.config.get('max_request_size')
+            if limit and length > limit:
+                return 413, f"Request body exceeds {limit} bytes; use /upload for files"
+            return None
+
+        def handle_upload(self):
+            """Stream a file upload to disk (see upload_handler.handle_upload)."""
+            started = time.perf_counter()
+            user_id = self.get_authenticated_user_id()
+            if not user_id:
+                self.send_error_response(401, 'Not authenticated')
+                return
+            query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            try:
+                response = upload_handler.handle_upload(user_id, query, self.headers, self.rfile)
+                body = self.send_json_response(response, {})
+            except upload_handler.UploadError as e:
+                body = self.send_error_response(e.status, str(e))
+                response = {'status': 'error'}
+            metrics.observe('http_request_seconds', time.perf_counter() - started, action='upload')
+            if traffic_capture.enabled():
+                traffic_capture.record(
+                    user_id,
+                    'POST',
+                    self.path,
+                    'upload',
+                    request_bytes=int(self.headers.get('Content-Length') or 0),
+                    response_bytes=body,
+                    duration=time.perf_counter() - started,
+                    status=response.get('status')
+                )
+
+        def get_authenticated_user_id(self):
+            cookie = SimpleCookie(self.headers.get('Cookie'))
+            if 'userid' in cookie and file_handler.is_user_id_valid(cookie['userid'].value, config["user_data_path"]):
+                return cookie['userid'].value
+            return None
+        
+        def handle_events(self):
+            """
+            Stream process events to the client as Server-Sent Events.
+            
+            Query parameters: process_id limits the stream to one process,
+            last_event_id (or the Last-Event-ID header) resumes after a
+            reconnect, and mode=poll answers once as JSON (long-poll).
+            Without an id (or with 0) only new events are sent; an id
+            outside the buffer's window gets a resync event instead.
+            """
+            user_id = self.get_authenticated_user_id()
+            if not user_id:
+                self.send_error(401, "Not authenticated")
+                return
+            
+            query = parse_qs(urlparse(self.path).query)
+            process_id = query.get('process_id', [None])[0]
+            try:
+                last_event_id = int(self.headers.get('Last-Event-ID') or query.get('last_event_id', ['0'])[0])
+            except ValueError:
+                last_event_id = 0
+            if last_event_id <= 0:
+                last_event_id = event_bus.latest_event_id()
+            heartbeat = self.config.get('events_heartbeat', 15)
+            
+            if query.get('mode', [''])[0] == 'poll':
+                events, missed = event_bus.wait_for_events(user_id, last_event_id, heartbeat, process_id)
+                if missed:
+                    last_event_id = event_bus.latest_event_id()
+                self.send_json_response({
+                    'status': 'success',
+                    'data': {
+                        'events': events,
+                        'missed': missed,
+                        'last_event_id': events[-1]['id'] if events else last_event_id
+                    }
+                }, {})
+                return
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_cors_headers()
+            self.end_headers()
+            
+            try:
+                while not server.shutdown_flag.is_set():
+                    events, missed = event_bus.wait_for_events(user_id, last_event_id, heartbeat, process_id)
+                    
+                    if missed:
+                        last_event_id = event_bus.latest_event_id()
+                        self.wfile.write(f"id: {last_event_id}\nevent: resync\ndata: {{}}\n\n".encode('utf-8'))
+                    
+                    for event in events:
+                        last_event_id = event['id']
+                        self.wfile.write(
+                            f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+                        )
+                    
+                    if not events and not missed:
+                        self.wfile.write(b": heartbeat\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
         
         def load_request_dictionary(self):
             content_length = int(self.headers['Content-Length'])
@@ -64,16 +238,40 @@ def create_request_handler(server, config):
             else:
                 self.send_header('Access-Control-Allow-Origin', '*')
             
-        def send_json_response(self, response_data, cookie):
-            self.send_response(200)
+        def send_error_response(self, status, message):
+            """
+            Answer with a JSON error. The body may be unread, so the
+            connection is closed rather than reused.
+            """
+            self.close_connection = True
+            if status == 413:
+                metrics.inc('http_rejected_total', reason='too_large')
+            return self.send_json_response({'status': 'error', 'message': message}, {}, status)
+
+        def send_json_response(self, response_data, cookie, status=200):
+            self.send_response(status)
             self.send_header('Content-type', 'application/json')
             if 'userid' in cookie:
                 cookie["userid"]["secure"] = True
                 cookie["userid"]["httponly"] = True
                 self.send_header('Set-Cookie', cookie["userid"].OutputString())
+            body = json.dumps(response_data).encode('utf-8')
+            self.send_header('Content-Length', str(len(body)))
             self.send_cors_headers()
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
+            self.wfile.write(body)
+            return len(body)
+        
+        def send_metrics_response(self):
+            if not metrics.enabled():
+                self.send_error(404, "Metrics disabled")
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
 
         def send_html_response(self, html_content):
             self.send_response(200)
@@ -1,29 +1,89 @@
 import socketserver
 import threading
 import backend.request_handler as request_handler
+import backend.logger as logger
+import backend.file_handler as file_handler
+import backend.metrics as metrics
+import backend.tracing as tracing
+import backend.traffic_capture as traffic_capture
+import backend.llm as llm
+import backend.llm_scheduler as llm_scheduler
+import backend.llm_router as llm_router
+import backend.prompt_templates as prompt_templates
+import backend.application.johto_sync as johto_sync
+import backend.application.feed_ingest as feed_ingest
+import backend.application.upload_handler as upload_handler
+import backend.application.search_index as search_index
+import backend.application.web_search as web_search
+import backend.application.near_duplicates as near_duplicates
+import backend.application.similarity as similarity
+import backend.application.retention as retention
+import backend.application.process_registry as process_registry
+import backend.application.process_handler as process_handler
+import backend.application.job_queue as job_queue
+import backend.application.routing as routing
+
+class ThreadingHTTPServer(socketserver.ThreadingTCPServer):
+    # Set on the class so they apply before the socket is bound
+    allow_reuse_address = True
+    daemon_threads = True
 
 class ApplicationServer:
     def __init__(self, config):
         self.config = config
         self.shutdown_flag = threading.Event()
         server_address = (self.config['host'], self.config['port'])
-        self.httpd = socketserver.TCPServer(
+        self.httpd = ThreadingHTTPServer(
             server_address, 
             request_handler.create_request_handler(self, config)
             )
-        self.httpd.allow_reuse_address = True
     
     def run(self):
         print("AI Processor Agent server")
         print(f"Started at http://localhost:{self.config['port']}")
         print("Press Ctrl+C to stop the server")
         
+        logger.configure(self.config)
+        metrics.configure(self.config)
+        file_handler.configure(self.config)
+        tracing.configure(self.config)
+        traffic_capture.configure(self.config)
+        for collector in (llm_scheduler.collect_metrics, llm_router.collect_metrics, job_queue.collect_metrics,
+                          process_registry.collect_metrics, routing.collect_metrics, prompt_templates.collect_metrics,
+                          feed_ingest.collect_metrics, search_index.collect_metrics, near_duplicates.collect_metrics):
+            metrics.register_collector(collector)
+        
+        llm.configure(self.config)
+        llm_router.start()
+        prompt_templates.configure(self.config)
+        process_registry.configure(self.config)
+        routing.configure(self.config)
+        process_handler.configure(self.config)
+        upload_handler.configure(self.config)
+        search_index.start(self.config)
+        web_search.configure(self.config)
+        near_duplicates.configure(self.config)
+        similarity.configure(self.config)
+        job_queue.start(self.config, process_handler.run_step, process_handler.handle_step_failure)
+        process_handler.resume_interrupted_processes()
+        johto_sync.start(self.config)
+        feed_ingest.start(self.config)
+        retention.start(self.config)
+        
         try:
             self.httpd.serve_forever(poll_interval=0.1)
         except KeyboardInterrupt:
             print("\nShutting down server...")
         finally:
             self.shutdown_flag.set()
+            johto_sync.stop()
+            feed_ingest.stop()
+            retention.stop()
+            llm_router.stop()
+            job_queue.stop()
+            search_index.close()
+            traffic_capture.close()
+            file_handler.flush()
             self.httpd.server_close()
             print("Server stopped")
 
@@ -1,10 +1,29 @@
+import backend.logger as logger
 import os
 import json
 import time
+import re
+import hashlib
+import threading
 from uuid import uuid4
 from backend.file_handler import load_user_data, get_user_data_file_path, ensure_directory, save_data, load_data
+
+log = logger.get_logger("structure_interpreter")
+
+# Job and structure ids become path components under data/users/<user_id>/.
+# Johto structure ids are file names such as foo.json, so any single path
+# component is accepted except . and .., separators and control characters.
+SAFE_ID = re.compile(r'^(?!\.{1,2}\Z)[^/\\\x00-\x1f]{1,255}\Z')
+
+_pending_users = set()
+_pending_lock = threading.Lock()
+_inputs_lock = threading.Lock()
+
+def get_job_directory(user_id, job_id):
+    return os.path.join("data", "users", user_id, "jobs", job_id)
+
 def create_job(user_id, job_id, job_data):
-    job_dir = os.path.join("data", "users", user_id, "jobs", job_id)
+    job_dir = get_job_directory(user_id, job_id)
     ensure_directory(job_dir)
     job_data_path = os.path.join(job_dir, "data.json")
     save_data(job_data_path, job_data)
@@ -22,7 +41,44 @@ def load_structures(file_path):
         return None, None
     return structures.get("nodes", []), structures.get("connections", [])
 
-def create_workflow_job(user_id, nodes, connections, job_name="Automated Workflow"):
+def compute_structure_hash(nodes, connections):
+    canonical = json.dumps({"nodes": nodes, "connections": connections}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def find_job_by_hash(user_data, structure_hash):
+    for job in user_data.get("jobs", []):
+        if job.get("structure_hash") == structure_hash:
+            return job.get("id")
+    return None
+
+def plan_steps(nodes):
+    """Describe the job steps without touching the filesystem."""
+    steps = []
+    for i, node in enumerate(nodes):
+        node_id = node.get("id")
+        if not node_id:
+            continue
+
+        steps.append({
+            "node_id": node_id,
+            "type": node.get("type", "process"),
+            "name": node.get("name", f"Step {i+1}"),
+            "data": node.get("data", {}),
+            "position": i + 1,
+            "folder": f"step_{i+1}_{node.get('type', 'process')}"
+        })
+    return steps
+
+def plan_connections(connections):
+    planned = []
+    for conn in connections:
+        source = conn.get("source")
+        target = conn.get("target")
+        if source and target:
+            planned.append({"source": source, "target": target})
+    return planned
+
+def create_workflow_job(user_id, nodes, connections, job_name="Automated Workflow", structure_hash=None):
     job_id = str(uuid4())
     timestamp = time.time()
 
@@ -34,7 +90,8 @@ def create_workflow_job(user_id, nodes, connections, job_name="Automated Workflo
         "inputs": [],
         "outputs": [],
         "conversation": [],
-        "auto_generated": True
+        "auto_generated": True,
+        "structure_hash": structure_hash
     }
 
     user_data = load_user_data(user_id)
@@ -44,74 +101,48 @@ def create_workflow_job(user_id, nodes, connections, job_name="Automated Workflo
     user_data["jobs"].append(new_job)
     user_data_path = get_user_data_file_path(user_id)
     save_data(user_data_path, user_data)
-    create_job(user_id, job_id, new_job)
+
+    job_data = dict(new_job)
+    job_data["steps"] = plan_steps(nodes)
+    job_data["connections"] = plan_connections(connections)
+    create_job(user_id, job_id, job_data)
     return job_id
 
-def create_step_folders(user_id, job_id, nodes):
-    job_folder = os.path.join("data", "users", user_id, "jobs", job_id)
-    node_steps = {}
-    
-    for i, node in enumerate(nodes):
-        node_id = node.get("id")
-        if not node_id:
-            continue
-        
-        step_name = f"step_{i+1}_{node.get('type', 'process')}"
-        step_folder = os.path.join(job_folder, step_name)
-        os.makedirs(step_folder, exist_ok=True)
-        
-        step_data = {
-            "node_id": node_id,
-            "type": node.get("type", "process"),
-            "name": node.get("name", f"Step {i+1}"),
-            "data": node.get("data", {}),
-            "position": i + 1
-        }
-        
-        step_file = os.path.join(step_folder, "data.json")
-        with open(step_file, "w") as f:
-            json.dump(step_data, f, indent=4)
-        
-        node_steps[node_id] = {
-            "folder": step_folder,
-            "name": step_name,
-            "data": step_data
-        }
-    
-    return node_steps
-
-def connect_steps(connections, node_steps):
-    for conn in connections:
-        source = conn.get("source")
-        target = conn.get("target")
-        
-        if not source or not target or source not in node_steps or target not in node_steps:
-            continue
-            
-        source_step = node_steps[source]
-        target_step = node_steps[target]
-        
-        input_data = {
-            "source_node": source,
-            "source_step": source_step["name"],
-            "content_path": os.path.join(source_step["folder"], "output.json"),
-            "auto_connected": True
-        }
-        
-        input_file = os.path.join(target_step["folder"], "input.json")
-        with open(input_file, "w") as f:
-            json.dump(input_data, f, indent=4)
-    
+def add_job_inputs(user_id, job_id, inputs):
+    """Append input records (feed items, uploads) to a job. Returns False if the job does not exist."""
+    if not SAFE_ID.match(job_id or ''):
+        return False
+    job_data_path = os.path.join(get_job_directory(user_id, job_id), "data.json")
+    with _inputs_lock:
+        job_data = load_data(job_data_path)
+        if job_data is None:
+            return False
+        job_data.setdefault("inputs", []).extend(inputs)
+        save_data(job_data_path, job_data)
     return True
 
-def update_job_data(user_id, job_id, node_steps):
-    job_data_path = os.path.join("data", "users", user_id, "jobs", job_id, "data.json")
-    job_data = load_data(job_data_path) or {}
-    job_data["steps"] = [node_steps[node_id]["data"] for node_id in node_steps]
-    save_data(job_data_path, job_data)
+def get_structure_inputs_file(user_id, structure_id):
+    return os.path.join("data", "users", user_id, structure_id, "inputs.json")
+
+def add_structure_inputs(user_id, structure_id, inputs):
+    """Append input records to a structure's inputs.json. Returns False for an invalid structure id."""
+    if not SAFE_ID.match(structure_id or ''):
+        return False
+    inputs_file = get_structure_inputs_file(user_id, structure_id)
+    with _inputs_lock:
+        data = load_data(inputs_file, {"inputs": []})
+        data["inputs"].extend(inputs)
+        save_data(inputs_file, data)
     return True
 
 def create_job_from_saved_structures(user_id, job_name="Automated Workflow"):
+    """
+    Return the job for the user's saved structures, creating it if needed.
+
+    Jobs are keyed on the structure content hash, so calling this again for
+    an unchanged structure performs no writes. Step folders are not created
+    here; see materialize_step.
+    """
     structures_path = check_for_saved_structures(user_id)
     if not structures_path:
         return None
@@ -120,11 +151,78 @@ def create_job_from_saved_structures(user_id, job_name="Automated Workflow"):
     if not nodes or not connections:
         return None
 
-    job_id = create_workflow_job(user_id, nodes, connections, job_name)
-    if not job_id:
+    structure_hash = compute_structure_hash(nodes, connections)
+    existing_job_id = find_job_by_hash(load_user_data(user_id), structure_hash)
+    if existing_job_id:
+        return existing_job_id
+
+    return create_workflow_job(user_id, nodes, connections, job_name, structure_hash)
+
+def schedule_job_from_saved_structures(user_id, job_name="Automated Workflow"):
+    """
+    Create the user's saved-structure job in the background, once per user
+    at a time. Returns True when the user has saved structures, so a job
+    is (being) created; users without them cost a stat and no thread.
+    """
+    if not check_for_saved_structures(user_id):
+        return False
+
+    with _pending_lock:
+        if user_id in _pending_users:
+            return True
+        _pending_users.add(user_id)
+
+    def run():
+        try:
+            create_job_from_saved_structures(user_id, job_name)
+        except Exception:
+            log.exception("Error creating job from saved structures", extra={"fields": {"user_id": user_id}})
+        finally:
+            with _pending_lock:
+                _pending_users.discard(user_id)
+
+    threading.Thread(target=run, name=f"job-materializer-{user_id}", daemon=True).start()
+    return True
+
+def materialize_step(user_id, job_id, node_id):
+    """
+    Create the folder, data.json and input.json of a single step.
+
+    Called when the step actually runs. Returns the step folder path, or
+    None for an invalid job id or if the job has no step for node_id.
+    """
+    if not SAFE_ID.match(job_id or ''):
+        return None
+    job_dir = get_job_directory(user_id, job_id)
+    job_data = load_data(os.path.join(job_dir, "data.json")) or {}
+    steps = {step["node_id"]: step for step in job_data.get("steps", [])}
+
+    step = steps.get(node_id)
+    if not step:
         return None
 
-    node_steps = create_step_folders(user_id, job_id, nodes)
-    connect_steps(user_id, job_id, connections, node_steps)
-    update_job_data(user_id, job_id, node_steps)
-    return job_id
\ No newline at end of file
+    step_folder = os.path.join(job_dir, step["folder"])
+    step_file = os.path.join(step_folder, "data.json")
+    if os.path.exists(step_file):
+        return step_folder
+
+    ensure_directory(step_folder)
+
+    inputs = []
+    for conn in job_data.get("connections", []):
+        source_step = steps.get(conn["source"])
+        if conn["target"] != node_id or not source_step:
+            continue
+        inputs.append({
+            "source_node": conn["source"],
+            "source_step": source_step["folder"],
+            "content_path": os.path.join(job_dir, source_step["folder"], "output.json"),
+            "auto_connected": True
+        })
+
+    if inputs:
+        save_data(os.path.join(step_folder, "input.json"), inputs)
+
+    step_data = {key: value for key, value in step.items() if key != "folder"}
+    save_data(step_file, step_data)
+    return step_folder
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+PROCESSES_DIR = os.path.join("data", "processes")
+
+_settings = {
+    'enabled': True
+}
+# (trace, open span) of the code currently running, if it is traced
+_current = contextvars.ContextVar('trace_context', default=None)
+_file_lock = threading.Lock()
+
+class _NullSpan(dict):
+    """Span stand-in outside of a trace; attributes set on it are dropped."""
+
+    def __setitem__(self, key, value):
+        pass
+
+_null_span = _NullSpan(attrs=_NullSpan())
+
+def configure(config):
+    _settings['enabled'] = bool(config.get('tracing', {}).get('enabled', _settings['enabled']))
+
+def get_trace_file(structure_id, process_id):
+    return os.path.join(PROCESSES_DIR, structure_id, "traces", f"{process_id}.jsonl")
+
+@contextmanager
+def trace(process_id, structure_id, **attrs):
+    """
+    Collect spans for one unit of work on a run (a step, a manual advance)
+    and append them to the run's trace file when the block exits.
+    """
+    if not _settings['enabled'] or not process_id or not structure_id:
+        yield None
+        return
+
+    current = {
+        'process_id': process_id,
+        'structure_id': structure_id,
+        'spans': [],
+        'lock': threading.Lock()
+    }
+    token = _current.set((current, None))
+    try:
+        with span('run_segment', **attrs):
+            yield current
+    finally:
+        _current.reset(token)
+        _flush(current)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block as a span of the current trace.
+
+    Yields the span dict, so callers can add attributes after the fact
+    (span['attrs']['cache_hit'] = True). Outside of a trace this is a
+    cheap no-op.
+    """
+    context = _current.get()
+    if context is None:
+        yield _null_span
+        return
+
+    current, parent = context
+    record = {
+        'id': uuid.uuid4().hex[:16],
+        'parent_id': parent['id'] if parent else None,
+        'name': name,
+        'thread': threading.current_thread().name,
+        'start_ns': time.monotonic_ns(),
+        'wall_start_ns': time.time_ns(),
+        'end_ns': None,
+        'attrs': dict(attrs)
+    }
+    token = _current.set((current, record))
+    try:
+        yield record
+    except Exception as e:
+        record['attrs']['error'] = str(e)
+        raise
+    finally:
+        record['end_ns'] = time.monotonic_ns()
+        _current.reset(token)
+        with current['lock']:
+            current['spans'].append(record)
+
+def add_attributes(**attrs):
+    """Set attributes on the innermost open span, if any."""
+    context = _current.get()
+    if context is None or context[1] is None:
+        return
+    context[1]['attrs'].update(attrs)
+
+def wrap(function):
+    """Carry the current trace into work handed to another thread (executors)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
+
+def _flush(current):
+    with current['lock']:
+        spans = list(current['spans'])
+        current['spans'].clear()
+    if not spans:
+        return
+
+    trace_file = get_trace_file(current['structure_id'], current['process_id'])
+    with _file_lock:
+        os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+        with open(trace_file, 'a', encoding='utf-8') as f:
+            for record in sorted(spans, key=lambda record: record['start_ns']):
+                f.write(json.dumps(record, default=str) + '\n')
+
+def load_spans(structure_id, process_id):
+    trace_file = get_trace_file(structure_id, process_id)
+    if not os.path.exists(trace_file):
+        return []
+    spans = []
+    with _file_lock:
+        with open(trace_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return spans
+
+def to_chrome_trace(spans, process_id=None):
+    """
+    Convert spans to Chrome trace-event JSON (complete "X" events), which
+    chrome://tracing and Perfetto render as a flame chart per thread.
+
+    Monotonic clocks are not comparable between processes, so events are
+    placed on the wall clock of their start and keep their monotonic
+    duration.
+    """
+    threads = {}
+    events = []
+    for record in spans:
+        if record.get('end_ns') is None:
+            continue
+        tid = threads.setdefault(record.get('thread', 'main'), len(threads) + 1)
+        events.append({
+            'name': record['name'],
+            'cat': record['name'].split('.')[0],
+            'ph': 'X',
+            'ts': record['wall_start_ns'] / 1000,
+            'dur': (record['end_ns'] - record['start_ns']) / 1000,
+            'pid': 1,
+            'tid': tid,
+            'args': {**record.get('attrs', {}), 'span_id': record['id'], 'parent_id': record.get('parent_id')}
+        })
+
+    for name, tid in threads.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+    events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 0, 'args': {'name': f"run {process_id}" if process_id else 'run'}})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def summarize(spans):
+    """Total time per span name in milliseconds, to see where a run spent its time."""
+    totals = {}
+    for record in spans:
+        if record.get('end_ns') is None:
+            continue
+        entry = totals.setdefault(record['name'], {'count': 0, 'total_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += (record['end_ns'] - record['start_ns']) / 1e6
+    for entry in totals.values():
+        entry['total_ms'] = round(entry['total_ms'], 3)
+    return totals
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+# Request fields copied into captured records. Everything else (passwords,
+# structure contents, inputs, outputs) is reduced to the request size.
+CAPTURED_FIELDS = ('structure_id', 'process_id', 'batch_id', 'file_id', 'processing_type', 'auto_run', 'format', 'force')
+
+_settings = {
+    'enabled': False,
+    'path': os.path.join("data", "capture", "requests.jsonl"),
+    'sample_rate': 1.0
+}
+_lock = threading.Lock()
+_file = None
+
+def configure(config):
+    """Read the "capture" config section; capture is off unless enabled."""
+    global _file
+
+    capture_config = config.get('capture', {})
+    with _lock:
+        if _file:
+            _file.close()
+            _file = None
+        _settings['enabled'] = bool(capture_config.get('enabled', False))
+        _settings['path'] = capture_config.get('path', _settings['path'])
+        _settings['sample_rate'] = float(capture_config.get('sample_rate', _settings['sample_rate']))
+
+def enabled():
+    return _settings['enabled']
+
+def session_key(value):
+    """Stable pseudonym for a user id or client address, so sessions can be told apart without storing it."""
+    return hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:16] if value else None
+
+def count_nodes(structure_data):
+    structure = structure_data.get('structure')
+    nodes = (structure if isinstance(structure, dict) else structure_data).get('nodes', [])
+    return len(nodes) if isinstance(nodes, (list, dict)) else 0
+
+def sanitize(request):
+    """Keep identifiers and flags; reduce structures and batch inputs to their sizes."""
+    fields = {key: request[key] for key in CAPTURED_FIELDS if key in request and isinstance(request[key], (str, int, float, bool))}
+    if isinstance(request.get('structure_data'), dict):
+        fields['structure_nodes'] = count_nodes(request['structure_data'])
+    if isinstance(request.get('inputs'), list):
+        fields['inputs'] = len(request['inputs'])
+    return fields
+
+def record(session, method, path, action=None, request=None, request_bytes=0, response_bytes=0, duration=0.0, status=None):
+    """
+    Append one request to the capture file: when it started, who sent it
+    (pseudonymized), what it asked for, how large it was and how long it
+    took. Called after the response is sent.
+    """
+    global _file
+
+    if not _settings['enabled']:
+        return
+    if _settings['sample_rate'] < 1 and random.random() >= _settings['sample_rate']:
+        return
+
+    entry = {
+        'ts': round(time.time() - duration, 3),
+        'session': session_key(session),
+        'method': method,
+        'path': path.split('?', 1)[0],
+        'action': action,
+        'fields': sanitize(request or {}),
+        'request_bytes': request_bytes,
+        'response_bytes': response_bytes,
+        'duration_ms': round(duration * 1000, 3),
+        'status': status
+    }
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+
+    with _lock:
+        if _file is None:
+            directory = os.path.dirname(_settings['path'])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _file = open(_settings['path'], 'a', encoding='utf-8')
+        _file.write(line)
+        _file.flush()
+
+def close():
+    global _file
+
+    with _lock:
+        if _file:
+            _file.close()
+            _file = None
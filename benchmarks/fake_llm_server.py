@@ -0,0 +1,308 @@
+"""
+Fake LLM Server
+
+A local stand-in for the Dolphin LLM endpoint with injectable latency and
+failures, used to exercise hedging, the circuit breaker and load balancing
+without a model server.
+
+Responses echo the prompt followed by a short completion, in the same
+format as the real server. Routing prompts (asking for next_node_id) get
+a JSON answer naming the first candidate node.
+
+Latency distributions:
+    fixed:SECONDS
+    uniform:LOW,HIGH
+    lognormal:MEDIAN,SIGMA
+    Add --tail-probability and --tail-latency for occasional slow requests.
+
+The latency is the time to the first token. With --token-rate the
+completion (padded to --completion-tokens words) is generated at that many
+tokens per second; requests with "stream": true receive it in chunks as
+it is generated.
+
+Failures (--error-rate) take the form given by --error-mode:
+    status   HTTP 503
+    timeout  hang for --hang-seconds before answering 503
+    reset    close the connection without answering
+    garbage  HTTP 200 with a body that is not a completion
+
+Usage:
+    python -m benchmarks.fake_llm_server [--port PORT] [--latency SPEC]
+        [--tail-probability P] [--tail-latency SECONDS] [--error-rate P]
+        [--error-mode MODE] [--token-rate TOKENS_PER_SECOND]
+        [--completion-tokens N]
+
+Settings can be changed while running by posting JSON to /control, e.g.
+    {"down": true} to make every request fail with 503
+    {"latency": "fixed:2.0", "error_rate": 0.5, "error_mode": "reset"}
+
+Example:
+    python -m benchmarks.fake_llm_server --port 9100 --latency lognormal:0.3,0.4 --tail-probability 0.05 --tail-latency 3
+"""
+
+import re
+import json
+import math
+import time
+import random
+import argparse
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ERROR_MODES = ('status', 'timeout', 'reset', 'garbage')
+
+def parse_latency(spec):
+    """Turn a latency spec into a function returning a delay in seconds."""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class FakeLLM:
+    def __init__(self, latency='fixed:0.1', tail_probability=0.0, tail_latency=0.0, error_rate=0.0,
+                 error_mode='status', hang_seconds=30.0, token_rate=0.0, completion_tokens=0):
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'streamed': 0, 'tokens': 0, 'in_flight': 0, 'max_in_flight': 0}
+        self.configure(
+            latency=latency,
+            tail_probability=tail_probability,
+            tail_latency=tail_latency,
+            error_rate=error_rate,
+            error_mode=error_mode,
+            hang_seconds=hang_seconds,
+            token_rate=token_rate,
+            completion_tokens=completion_tokens,
+            down=False
+        )
+
+    def configure(self, **settings):
+        with self.lock:
+            if 'latency' in settings:
+                self.latency_spec = settings['latency']
+                self.latency = parse_latency(settings['latency'])
+            for key in ('tail_probability', 'tail_latency', 'error_rate', 'hang_seconds', 'token_rate'):
+                if key in settings:
+                    setattr(self, key, float(settings[key]))
+            if 'completion_tokens' in settings:
+                self.completion_tokens = int(settings['completion_tokens'])
+            if 'error_mode' in settings:
+                if settings['error_mode'] not in ERROR_MODES:
+                    raise ValueError(f"Unknown error mode: {settings['error_mode']}")
+                self.error_mode = settings['error_mode']
+            if 'down' in settings:
+                self.down = bool(settings['down'])
+
+    def settings(self):
+        with self.lock:
+            return {
+                'latency': self.latency_spec,
+                'tail_probability': self.tail_probability,
+                'tail_latency': self.tail_latency,
+                'error_rate': self.error_rate,
+                'error_mode': self.error_mode,
+                'hang_seconds': self.hang_seconds,
+                'token_rate': self.token_rate,
+                'completion_tokens': self.completion_tokens,
+                'down': self.down
+            }
+
+    def delay(self):
+        with self.lock:
+            if self.tail_probability and random.random() < self.tail_probability:
+                return self.tail_latency
+            return self.latency()
+
+    def should_fail(self):
+        with self.lock:
+            return self.down or random.random() < self.error_rate
+
+    def complete(self, prompt):
+        match = re.search(r'possible next nodes:\s*(\[.*?\])', prompt, re.DOTALL)
+        if match and 'next_node_id' in prompt:
+            try:
+                candidates = json.loads(match.group(1))
+                return json.dumps({'next_node_id': candidates[0].get('id') if candidates else None})
+            except json.JSONDecodeError:
+                pass
+        words = len(prompt.split())
+        text = f"Fake completion for a prompt of {words} words."
+        padding = self.completion_tokens - len(text.split())
+        if padding > 0:
+            text += ' ' + ' '.join(f"word{i}" for i in range(padding))
+        return text
+
+    def token_delay(self):
+        with self.lock:
+            return 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+def create_handler(fake):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with fake.lock:
+                stats = dict(fake.stats)
+            self.send_json(200, {**stats, **fake.settings()})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                self.send_json(400, {'error': 'Invalid JSON'})
+                return
+
+            if self.path == '/control':
+                try:
+                    fake.configure(**payload)
+                except ValueError as e:
+                    self.send_json(400, {'error': str(e)})
+                    return
+                self.send_json(200, {'status': 'ok'})
+                return
+
+            with fake.lock:
+                fake.stats['requests'] += 1
+                fake.stats['in_flight'] += 1
+                fake.stats['max_in_flight'] = max(fake.stats['max_in_flight'], fake.stats['in_flight'])
+            try:
+                time.sleep(fake.delay())
+                if fake.should_fail():
+                    fake.count('errors')
+                    self.fail()
+                    return
+
+                prompt = payload.get('prompt', '')
+                tokens = fake.complete(prompt).split(' ')
+                fake.count('tokens', len(tokens))
+                if payload.get('stream'):
+                    fake.count('streamed')
+                    self.stream(prompt, tokens)
+                    return
+
+                time.sleep(fake.token_delay() * len(tokens))
+                # The real server echoes the prompt, which ends with the assistant marker
+                text = f"{prompt}{' '.join(tokens)}\n<|im_end|>"
+                body = text.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                with fake.lock:
+                    fake.stats['in_flight'] -= 1
+
+        def fail(self):
+            settings = fake.settings()
+            mode = settings['error_mode']
+            if mode == 'reset':
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            if mode == 'garbage':
+                body = b'\x00<html>upstream proxy error</html>'
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if mode == 'timeout':
+                time.sleep(settings['hang_seconds'])
+            self.send_json(503, {'error': 'Fake upstream failure'})
+
+        def write_chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def stream(self, prompt, tokens):
+            """Send the echoed prompt, then one chunk per token at the token rate."""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.write_chunk(prompt)
+            delay = fake.token_delay()
+            for index, token in enumerate(tokens):
+                time.sleep(delay)
+                self.write_chunk(token if index == 0 else ' ' + token)
+            self.write_chunk("\n<|im_end|>")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return FakeLLMHandler
+
+def start_server(port=0, host='127.0.0.1', **settings):
+    """Start a fake LLM server in a background thread; returns (server, fake)."""
+    fake = FakeLLM(**settings)
+    server = ThreadingHTTPServer((host, port), create_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run a fake LLM server with injectable latency.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=str, default='fixed:0.1',
+                        help='Latency distribution (fixed:S, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA)')
+    parser.add_argument('--tail-probability', type=float, default=0.0,
+                        help='Probability that a request takes --tail-latency instead')
+    parser.add_argument('--tail-latency', type=float, default=0.0,
+                        help='Latency of tail requests in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Probability that a request fails')
+    parser.add_argument('--error-mode', type=str, default='status', choices=ERROR_MODES,
+                        help='How failing requests fail')
+    parser.add_argument('--hang-seconds', type=float, default=30.0,
+                        help='How long timeout failures hang before answering')
+    parser.add_argument('--token-rate', type=float, default=0.0,
+                        help='Completion tokens generated per second (0 answers at once)')
+    parser.add_argument('--completion-tokens', type=int, default=0,
+                        help='Pad completions to this many tokens')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    server, fake = start_server(
+        args.port,
+        args.host,
+        latency=args.latency,
+        tail_probability=args.tail_probability,
+        tail_latency=args.tail_latency,
+        error_rate=args.error_rate,
+        error_mode=args.error_mode,
+        hang_seconds=args.hang_seconds,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens
+    )
+    print(f"Fake LLM server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,150 @@
+"""
+Feed Fixture Server
+
+Serves synthetic RSS 2.0 and Atom feeds for testing and benchmarking the
+feed ingestion in backend/application/feed_ingest.py without network
+access.
+
+Feeds live at /feeds/<index>.xml (RSS) and /feeds/<index>.atom (Atom).
+Each has --items items; every --new-every seconds one new item is
+published at the top, so polls see a steady trickle of new items. Feeds
+carry ETag and Last-Modified headers and answer conditional requests
+with 304 Not Modified while nothing changed.
+
+Usage:
+    python -m benchmarks.feed_fixture_server [--port PORT] [--items N]
+        [--new-every SECONDS] [--latency SECONDS]
+
+Example:
+    python -m benchmarks.feed_fixture_server --port 9200 --items 500 --new-every 60
+"""
+
+import time
+import argparse
+import threading
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FeedFixtures:
+    def __init__(self, items=50, new_every=0.0, latency=0.0):
+        self.items = items
+        self.new_every = new_every
+        self.latency = latency
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'bytes': 0}
+
+    def generation(self):
+        """Number of items published since start; changes the feed content."""
+        if self.new_every <= 0:
+            return 0
+        return int((time.time() - self.started) / self.new_every)
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def render(self, feed, atom, generation):
+        """Yield the feed document in pieces, newest item first."""
+        newest = self.items + generation
+        updated = formatdate(self.started + generation * self.new_every, usegmt=True)
+        if atom:
+            yield (f'<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+                   f'<title>Fixture feed {feed}</title><updated>{updated}</updated>')
+        else:
+            yield (f'<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>'
+                   f'<title>Fixture feed {feed}</title><link>http://fixtures.test/{feed}</link>')
+
+        for number in range(newest, newest - self.items, -1):
+            title = escape(f"Story {number} from feed {feed}")
+            link = f"http://fixtures.test/{feed}/stories/{number}"
+            summary = escape(f"Summary of story {number} & what happened next. " * 4)
+            if atom:
+                yield (f'<entry><title>{title}</title><link rel="alternate" href="{link}"/>'
+                       f'<id>urn:fixture:{feed}:{number}</id><updated>{updated}</updated>'
+                       f'<summary>{summary}</summary></entry>')
+            else:
+                yield (f'<item><title>{title}</title><link>{link}</link>'
+                       f'<guid isPermaLink="false">fixture-{feed}-{number}</guid>'
+                       f'<pubDate>{updated}</pubDate><description>{summary}</description></item>')
+
+        yield '</feed>' if atom else '</channel></rss>'
+
+def create_handler(fixtures):
+    class FeedHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            fixtures.count('requests')
+            path = self.path.split('?', 1)[0]
+            name = path.rsplit('/', 1)[-1]
+            feed, _, extension = name.partition('.')
+            if not path.startswith('/feeds/') or extension not in ('xml', 'atom'):
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if fixtures.latency:
+                time.sleep(fixtures.latency)
+
+            generation = fixtures.generation()
+            etag = f'"{feed}-{extension}-{generation}"'
+            last_modified = formatdate(fixtures.started + generation * fixtures.new_every, usegmt=True)
+            if self.headers.get('If-None-Match') == etag or (
+                    not self.headers.get('If-None-Match') and self.headers.get('If-Modified-Since') == last_modified):
+                fixtures.count('not_modified')
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            body = ''.join(fixtures.render(feed, extension == 'atom', generation)).encode('utf-8')
+            fixtures.count('bytes', len(body))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/atom+xml' if extension == 'atom' else 'application/rss+xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return FeedHandler
+
+class FixtureHTTPServer(ThreadingHTTPServer):
+    # Pollers open many connections at once; the default backlog of 5 drops some
+    request_queue_size = 128
+
+def start_server(port=0, host='127.0.0.1', **settings):
+    """Start a feed fixture server in a background thread; returns (server, fixtures)."""
+    fixtures = FeedFixtures(**settings)
+    server = FixtureHTTPServer((host, port), create_handler(fixtures))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fixtures
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Serve synthetic RSS and Atom feeds.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--items', type=int, default=50, help='Items per feed')
+    parser.add_argument('--new-every', type=float, default=0.0, help='Publish a new item every N seconds')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay before answering, in seconds')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    server, _ = start_server(args.port, args.host, items=args.items, new_every=args.new_every, latency=args.latency)
+    print(f"Serving feeds at http://{args.host}:{server.server_address[1]}/feeds/<n>.xml")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
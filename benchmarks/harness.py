@@ -0,0 +1,170 @@
+"""
+Benchmark Harness
+
+Shared pieces of the benchmark scenarios: an isolated workspace with the
+application server running against the fake LLM server, HTTP helpers, and
+latency statistics.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = min(max(int(round(q * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+def summarize(latencies, errors=0, elapsed=None):
+    """Latency statistics in milliseconds, plus throughput when elapsed is known."""
+    ordered = sorted(latencies)
+    count = len(ordered) + errors
+    result = {
+        'count': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0
+    }
+    if elapsed:
+        result['throughput'] = round(count / elapsed, 3)
+    return result
+
+def measure(function, iterations, concurrency=1):
+    """
+    Call function(index) iterations times on concurrency threads and
+    summarize the latencies. A call that raises or returns False counts
+    as an error.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def call(index):
+        started = time.perf_counter()
+        try:
+            ok = function(index) is not False
+        except Exception:
+            ok = False
+        latency = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(latency)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for index in range(iterations):
+            call(index)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(call, range(iterations)))
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+class Workspace:
+    """
+    A temporary data/ directory with the application server running on a
+    free port. The backend resolves data/ against the working directory,
+    so the process works inside the workspace until it is closed. Only one
+    workspace can be open at a time.
+    """
+
+    def __init__(self, llm_url, config_overrides=None):
+        self.llm_url = llm_url
+        self.config_overrides = config_overrides or {}
+        self.directory = None
+        self.previous_directory = None
+        self.server = None
+        self.thread = None
+        self.url = None
+
+    def build_config(self):
+        with open(os.path.join(REPO_ROOT, 'data', 'config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        config.update({
+            'host': '127.0.0.1',
+            'port': 0,
+            'johto_sync_interval': 0,
+            'feeds': {**config.get('feeds', {}), 'poll_interval': 0},
+            'retention': {**config.get('retention', {}), 'interval': 0},
+            'logging': {'level': 'warning', 'format': 'text'}
+        })
+        config['llm'] = {
+            **config.get('llm', {}),
+            'endpoints': [{'name': 'fake', 'url': self.llm_url, 'max_concurrency': 8, 'models': []}],
+            'health_interval': 3600
+        }
+        for key, value in self.config_overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key] = {**config[key], **value}
+            else:
+                config[key] = value
+        return config
+
+    def __enter__(self):
+        from backend.server import ApplicationServer
+
+        self.directory = tempfile.mkdtemp(prefix='newsroom-bench-')
+        os.makedirs(os.path.join(self.directory, 'data', 'users'))
+        os.symlink(os.path.join(REPO_ROOT, 'frontend'), os.path.join(self.directory, 'frontend'))
+        config = self.build_config()
+        with open(os.path.join(self.directory, 'data', 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.server = ApplicationServer(config)
+        self.url = f"http://127.0.0.1:{self.server.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.run, name="bench-server", daemon=True)
+        self.thread.start()
+        self.wait_until_ready()
+        return self
+
+    def wait_until_ready(self, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                requests.get(self.url + '/', timeout=1)
+                return
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.05)
+        raise RuntimeError("Application server did not start")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.httpd.shutdown()
+        self.thread.join(timeout=10)
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return False
+
+    def post(self, session, action, **fields):
+        """POST an action and return the decoded response; raises on HTTP errors."""
+        response = session.post(self.url + '/', json={'action': action, **fields}, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def register(self, email, password='benchmark-password-1!'):
+        """Register a user and return a session logged in as them."""
+        session = requests.Session()
+        result = self.post(session, 'register', data={'email': email, 'password': password})
+        if result.get('status') != 'success':
+            raise RuntimeError(f"Registration failed: {result.get('message')}")
+        # The server marks the cookie secure, which requests would not send over http
+        session.cookies.set('userid', result['userid'])
+        return session, result['userid']
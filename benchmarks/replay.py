@@ -0,0 +1,254 @@
+"""
+Traffic Replay
+
+Re-issues requests captured by the server (the "capture" section of
+data/config.json) against a running server and reports throughput, error
+rates and latency percentiles per action.
+
+Captured records hold the action, a few identifiers and the request size,
+not the request body. Replayed requests carry the same action and
+identifiers, padded to the captured size; structures are replaced by
+linear structures with the captured node count and batch inputs by
+placeholder texts. Every captured session is played by a synthetic
+account registered on the target, so replay against a copy of the data
+directory, never against production.
+
+Pacing:
+    closed loop (default)  sessions keep their captured think times, divided
+                           by --speed; a session waits for each response
+                           before sending its next request
+    --open-loop            requests arrive on schedule whether or not
+                           earlier ones finished: at their captured times
+                           divided by --speed, or at a fixed --rate per second.
+                           Latency is measured from the scheduled arrival,
+                           so queueing in the client counts against the server.
+
+Usage:
+    python -m benchmarks.replay CAPTURE_FILE --url http://127.0.0.1:8001
+        [--speed N] [--open-loop] [--rate REQUESTS_PER_SECOND]
+        [--concurrency N] [--limit N] [--output report.json]
+
+Example:
+    python -m benchmarks.replay data/capture/requests.jsonl --url http://127.0.0.1:8001 --speed 10 --concurrency 32
+"""
+
+import sys
+import json
+import time
+import uuid
+import heapq
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmarks.harness import summarize
+from benchmarks.scenarios import build_structure
+
+PASSWORD = 'replay-password-1!'
+
+def load_capture(path, limit=None):
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    records.sort(key=lambda record: record.get('ts', 0))
+    return records[:limit] if limit else records
+
+class Replayer:
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.accounts = {}
+        self.results = {}
+
+    def account(self, session):
+        """The synthetic account and HTTP session standing in for a captured session."""
+        with self.lock:
+            account = self.accounts.get(session)
+            if account is None:
+                account = self.accounts[session] = {
+                    'email': f"replay-{uuid.uuid4().hex[:12]}@newsroom.test",
+                    'http': requests.Session(),
+                    'lock': threading.Lock(),
+                    'registered': False
+                }
+        with account['lock']:
+            if not account['registered']:
+                response = account['http'].post(self.url + '/', json={
+                    'action': 'register',
+                    'data': {'email': account['email'], 'password': PASSWORD}
+                }, timeout=self.timeout)
+                user_id = response.json().get('userid')
+                if not user_id:
+                    raise ValueError(f"Could not register {account['email']}")
+                # The server marks the cookie secure, which requests would not send over http
+                account['http'].cookies.set('userid', user_id)
+                account['registered'] = True
+        return account
+
+    def build_body(self, record, account):
+        fields = dict(record.get('fields', {}))
+        body = {'action': record['action']}
+        if 'structure_nodes' in fields:
+            # Start and finish are part of the captured node count
+            body['structure_data'] = build_structure('linear', max(fields.pop('structure_nodes') - 2, 1))
+        if 'inputs' in fields:
+            body['inputs'] = [f"Replayed input {index}" for index in range(fields.pop('inputs'))]
+        body.update(fields)
+        if record['action'] in ('login', 'register'):
+            body = {'action': 'login', 'data': {'email': account['email'], 'password': PASSWORD}}
+        size = len(json.dumps(body))
+        if record.get('request_bytes', 0) > size + 16:
+            body['_padding'] = 'x' * (record['request_bytes'] - size - 16)
+        return body
+
+    def issue(self, record, scheduled=None):
+        """Send one captured request; latency counts from scheduled when given."""
+        started = time.perf_counter() if scheduled is None else scheduled
+        action = record.get('action') or f"GET {record.get('path', '/')}"
+        ok, app_error = False, False
+        try:
+            account = self.account(record.get('session') or 'anonymous')
+            if record.get('path') == '/upload':
+                # Uploads are replayed as a file of the captured size in a scratch structure
+                response = account['http'].post(
+                    self.url + '/upload?structure_id=replay-uploads&name=replay.bin',
+                    data=b'x' * record.get('request_bytes', 0),
+                    headers={'Content-Type': 'application/octet-stream'},
+                    timeout=self.timeout
+                )
+                ok = response.status_code < 400 or response.status_code == record.get('status')
+            elif record.get('method') == 'GET':
+                response = account['http'].get(self.url + record.get('path', '/'), timeout=self.timeout)
+                ok = response.status_code < 400 or response.status_code == record.get('status')
+            else:
+                response = account['http'].post(self.url + record.get('path', '/'), json=self.build_body(record, account), timeout=self.timeout)
+                ok = response.status_code < 400
+                if ok:
+                    app_error = response.json().get('status') == 'error'
+        except (requests.exceptions.RequestException, ValueError):
+            ok = False
+        latency = time.perf_counter() - started
+
+        with self.lock:
+            entry = self.results.setdefault(action, {'latencies': [], 'errors': 0, 'app_errors': 0, 'captured_ms': []})
+            if ok:
+                entry['latencies'].append(latency)
+            else:
+                entry['errors'] += 1
+            if app_error:
+                entry['app_errors'] += 1
+            if record.get('duration_ms') is not None:
+                entry['captured_ms'].append(record['duration_ms'])
+
+    def replay_closed(self, records, speed=1.0, concurrency=8):
+        """Play each session in order with its think times; up to concurrency sessions at once."""
+        sessions = {}
+        for record in records:
+            sessions.setdefault(record.get('session') or 'anonymous', []).append(record)
+        first_ts = records[0].get('ts', 0) if records else 0
+        replay_start = time.perf_counter()
+
+        def play(session_records):
+            for record in session_records:
+                delay = (record.get('ts', first_ts) - first_ts) / speed - (time.perf_counter() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+                self.issue(record)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(play, sessions.values()))
+
+    def replay_open(self, records, speed=1.0, rate=None, concurrency=32):
+        """Issue requests at their arrival times regardless of completions."""
+        first_ts = records[0].get('ts', 0) if records else 0
+        schedule = []
+        for index, record in enumerate(records):
+            offset = index / rate if rate else (record.get('ts', first_ts) - first_ts) / speed
+            heapq.heappush(schedule, (offset, index, record))
+
+        replay_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while schedule:
+                offset, _, record = heapq.heappop(schedule)
+                scheduled = replay_start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.issue, record, scheduled)
+
+    def report(self, elapsed):
+        actions = {}
+        total_latencies, total_errors, total_app_errors = [], 0, 0
+        with self.lock:
+            for action, entry in sorted(self.results.items()):
+                summary = summarize(entry['latencies'], entry['errors'], elapsed)
+                summary['app_errors'] = entry['app_errors']
+                if entry['captured_ms']:
+                    captured = sorted(entry['captured_ms'])
+                    summary['captured_p50_ms'] = captured[len(captured) // 2]
+                actions[action] = summary
+                total_latencies.extend(entry['latencies'])
+                total_errors += entry['errors']
+                total_app_errors += entry['app_errors']
+        total = summarize(total_latencies, total_errors, elapsed)
+        total['app_errors'] = total_app_errors
+        return {'elapsed_s': round(elapsed, 3), 'total': total, 'actions': actions}
+
+def print_report(report):
+    print(f"Replayed in {report['elapsed_s']}s")
+    rows = [('total', report['total'])] + list(report['actions'].items())
+    for action, summary in rows:
+        print(f"  {action:<28} count={summary['count']} throughput={summary.get('throughput', 0)}/s "
+              f"errors={summary['errors']} app_errors={summary['app_errors']} "
+              f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Replay captured traffic against a running server.')
+    parser.add_argument('capture', type=str, help='Capture file (JSON lines)')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8001')
+    parser.add_argument('--speed', type=float, default=1.0, help='Divide captured gaps by this factor')
+    parser.add_argument('--open-loop', action='store_true', help='Do not wait for responses before sending')
+    parser.add_argument('--rate', type=float, help='Open loop: fixed arrivals per second instead of captured times')
+    parser.add_argument('--concurrency', type=int, default=8, help='Sessions (closed loop) or workers (open loop)')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', type=str, help='Write the report as JSON to this file')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        print("No captured requests to replay", file=sys.stderr)
+        return 1
+
+    replayer = Replayer(args.url, args.timeout)
+    started = time.perf_counter()
+    if args.open_loop or args.rate:
+        replayer.replay_open(records, args.speed, args.rate, args.concurrency)
+    else:
+        replayer.replay_closed(records, args.speed, args.concurrency)
+    report = replayer.report(time.perf_counter() - started)
+    report['options'] = {
+        'capture': args.capture,
+        'url': args.url,
+        'speed': args.speed,
+        'open_loop': bool(args.open_loop or args.rate),
+        'rate': args.rate,
+        'concurrency': args.concurrency,
+        'requests': len(records)
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print_report(report)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Benchmark Runner
+
+Runs the benchmark scenarios against a local application server backed by
+the fake LLM server, writes the results as JSON and compares them with a
+baseline from an earlier run.
+
+Scenarios:
+    login           concurrent logins against a large users.json
+    output_files    get_output_files on a large file registry
+    structure_runs  auto-run linear, LLM-routed and rule-routed structures
+    refine          refine_response on echoed completions with noise
+    static_assets   index page plus every frontend asset
+    feeds           read_rss, then cold and conditional polls of many fixture feeds
+    search          search_web over a large synthetic corpus
+    similarity      cluster and rank wire-style items locally
+    resilience      hedging and the circuit breaker against /control settings
+
+Usage:
+    python -m benchmarks.run [--scenarios NAME ...] [--quick]
+        [--output results.json] [--baseline baseline.json] [--threshold 0.15]
+        [--latency SPEC] [--token-rate N] [--error-rate P] [--error-mode MODE]
+
+A metric regresses when it is worse than the baseline by more than the
+threshold (relative; error rates by more than the threshold in absolute
+terms). The exit status is 1 when any metric regressed, so the runner
+can gate a review.
+
+Example:
+    python -m benchmarks.run --quick --output before.json
+    python -m benchmarks.run --quick --baseline before.json --output after.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from benchmarks.harness import REPO_ROOT, Workspace
+from benchmarks.fake_llm_server import start_server, ERROR_MODES
+from benchmarks.scenarios import SCENARIOS
+
+# Compared metrics and whether larger values are better
+COMPARED = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'throughput': True,
+    'error_rate': False
+}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_scenarios(names, quick=False, llm_settings=None):
+    server, fake = start_server(**(llm_settings or {}))
+    results = {}
+    try:
+        with Workspace(f"http://127.0.0.1:{server.server_address[1]}/") as workspace:
+            for name in names:
+                function, params, quick_params = SCENARIOS[name]
+                params = quick_params if quick else params
+                print(f"Running {name} {params}", file=sys.stderr)
+                started = time.perf_counter()
+                try:
+                    metrics = function(workspace, **params)
+                    error = None
+                except Exception as e:
+                    metrics, error = {}, f"{type(e).__name__}: {e}"
+                results[name] = {
+                    'params': {key: list(value) if isinstance(value, tuple) else value for key, value in params.items()},
+                    'elapsed_s': round(time.perf_counter() - started, 3),
+                    'metrics': metrics
+                }
+                if error:
+                    results[name]['error'] = error
+                    print(f"  failed: {error}", file=sys.stderr)
+    finally:
+        server.shutdown()
+    return results, dict(fake.stats)
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of comparisons for metrics present in both runs, each
+    with the relative change and whether it is a regression.
+    """
+    comparisons = []
+    for scenario, entry in results['scenarios'].items():
+        base_entry = baseline.get('scenarios', {}).get(scenario)
+        if not base_entry or base_entry.get('params') != entry.get('params'):
+            continue
+        for measurement, values in entry['metrics'].items():
+            base_values = base_entry['metrics'].get(measurement, {})
+            for metric, higher_is_better in COMPARED.items():
+                if metric not in values or metric not in base_values:
+                    continue
+                current, previous = values[metric], base_values[metric]
+                if metric == 'error_rate':
+                    change = current - previous
+                    regressed = change > threshold
+                else:
+                    change = (current - previous) / previous if previous else 0.0
+                    regressed = (-change if higher_is_better else change) > threshold
+                comparisons.append({
+                    'scenario': scenario,
+                    'measurement': measurement,
+                    'metric': metric,
+                    'baseline': previous,
+                    'current': current,
+                    'change': round(change, 4),
+                    'regressed': regressed
+                })
+    return comparisons
+
+def print_report(results, comparisons):
+    for scenario, entry in results['scenarios'].items():
+        print(f"{scenario} ({entry['elapsed_s']}s)")
+        if entry.get('error'):
+            print(f"  error: {entry['error']}")
+        for measurement, values in entry['metrics'].items():
+            summary = ' '.join(f"{key}={values[key]}" for key in ('count', 'p50_ms', 'p95_ms', 'throughput', 'error_rate') if key in values)
+            print(f"  {measurement}: {summary}")
+
+    if comparisons:
+        print("\nCompared with baseline:")
+        for comparison in comparisons:
+            marker = 'REGRESSED' if comparison['regressed'] else 'ok'
+            print(f"  {marker:<9} {comparison['scenario']}/{comparison['measurement']} {comparison['metric']}: "
+                  f"{comparison['baseline']} -> {comparison['current']} ({comparison['change']:+.1%})")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run the benchmark scenarios against a fake LLM server.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--quick', action='store_true', help='Use small parameters for a fast smoke run')
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', type=str, help='Results file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative change counted as a regression')
+    parser.add_argument('--latency', type=str, default='fixed:0.02', help='Fake LLM latency distribution')
+    parser.add_argument('--token-rate', type=float, default=0.0, help='Fake LLM tokens per second')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fake LLM failure probability')
+    parser.add_argument('--error-mode', type=str, default='status', choices=ERROR_MODES)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    llm_settings = {
+        'latency': args.latency,
+        'token_rate': args.token_rate,
+        'error_rate': args.error_rate,
+        'error_mode': args.error_mode
+    }
+    scenarios, llm_stats = run_scenarios(args.scenarios, args.quick, llm_settings)
+    results = {
+        'meta': {
+            'timestamp': int(time.time()),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': args.quick,
+            'fake_llm': {**llm_settings, 'stats': llm_stats}
+        },
+        'scenarios': scenarios
+    }
+
+    comparisons = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            comparisons = compare(results, json.load(f), args.threshold)
+        results['comparison'] = {'baseline': args.baseline, 'threshold': args.threshold, 'metrics': comparisons}
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    print_report(results, comparisons)
+    failed = any(entry.get('error') for entry in scenarios.values())
+    regressed = any(comparison['regressed'] for comparison in comparisons)
+    return 1 if failed or regressed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Benchmark Scenarios
+
+Each scenario takes the open Workspace and its parameters and returns a
+dict of named measurements (see harness.summarize), plus any extra
+numbers worth comparing between runs. Parameters are scaled down with
+--quick in run.py.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import itertools
+import threading
+import requests
+from benchmarks.harness import measure, summarize
+from benchmarks.feed_fixture_server import start_server as start_feed_server
+
+def seed_users(workspace, count, password):
+    """Write count accounts straight into users.json; returns their emails."""
+    users = {}
+    for index in range(count):
+        users[str(uuid.uuid4())] = {
+            'username': f"reporter{index}",
+            'email': f"reporter{index}@newsroom.test",
+            'password': password,
+            'created_at': int(time.time())
+        }
+    user_data_path = workspace.server.config['user_data_path']
+    with open(user_data_path, 'w', encoding='utf-8') as f:
+        json.dump(users, f)
+    return [user['email'] for user in users.values()]
+
+def login_at_scale(workspace, users=2000, logins=300, concurrency=8):
+    """Concurrent logins against a users.json holding many accounts."""
+    password = 'benchmark-password-1!'
+    emails = seed_users(workspace, users, password)
+    picks = [random.choice(emails) for _ in range(logins)]
+
+    def login(index):
+        result = workspace.post(requests.Session(), 'login', data={'email': picks[index], 'password': password})
+        return result.get('status') == 'success'
+
+    return {'login': measure(login, logins, concurrency)}
+
+def output_files_large_registry(workspace, files=5000, requests_count=30, content_bytes=2000):
+    """get_output_files on a structure whose registry holds many outputs."""
+    session, user_id = workspace.register(f"registry-{uuid.uuid4().hex[:8]}@newsroom.test")
+    structure_id = f"bench-registry-{files}"
+    output_dir = os.path.join('data', 'users', user_id, structure_id)
+    os.makedirs(output_dir, exist_ok=True)
+
+    content = ('Lorem ipsum dolor sit amet. ' * (content_bytes // 28 + 1))[:content_bytes]
+    registry = {'files': []}
+    for index in range(files):
+        path = os.path.join(output_dir, f"output_{index}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        # Half of the entries keep their content inline, half are read from disk
+        registry['files'].append({
+            'id': str(uuid.uuid4()),
+            'node_id': f"node-{index % 50}",
+            'node_name': f"Node {index % 50}",
+            'filename': f"output_{index}.txt",
+            'path': path,
+            'created_at': int(time.time()),
+            'size': content_bytes,
+            'content': content if index % 2 else ''
+        })
+    with open(os.path.join(output_dir, 'file_registry.json'), 'w', encoding='utf-8') as f:
+        json.dump(registry, f)
+
+    sizes = []
+    def fetch(index):
+        response = session.post(workspace.url + '/', json={'action': 'get_output_files', 'structure_id': structure_id}, timeout=120)
+        response.raise_for_status()
+        sizes.append(len(response.content))
+        return len(response.json().get('data', {}).get('files', [])) == files
+
+    result = {'get_output_files': measure(fetch, requests_count)}
+    result['get_output_files']['response_bytes'] = max(sizes, default=0)
+    return result
+
+def build_structure(shape, depth):
+    """
+    A structure of the given shape:
+        linear       start -> node 1 -> ... -> node depth -> finish
+        branching    two candidates per level, every step routed by the LLM
+        conditional  two candidates per level, routed by keyword conditions
+    """
+    nodes = [{'id': 'start', 'type': 'start', 'name': 'Start'}]
+    connections = []
+    previous = ['start']
+
+    for level in range(1, depth + 1):
+        width = 1 if shape == 'linear' else 2
+        current = []
+        for branch in range(width):
+            node_id = f"n{level}{'ab'[branch]}"
+            nodes.append({
+                'id': node_id,
+                'type': 'text',
+                'name': f"Step {level}{'ab'[branch]}",
+                'configuration': {'header': f"Step {level}", 'prompt': f"Write paragraph {level} of the story."}
+            })
+            current.append(node_id)
+        for source in previous:
+            for branch, target in enumerate(current):
+                connection = {'id': f"{source}-{target}", 'from': source, 'to': target}
+                if shape == 'conditional' and source != 'start':
+                    connection['condition'] = {'type': 'keyword', 'values': ['completion']} if branch == 0 else {'type': 'default'}
+                connections.append(connection)
+        previous = current
+
+    nodes.append({'id': 'finish', 'type': 'finish', 'name': 'Finish'})
+    connections.extend({'id': f"{source}-finish", 'from': source, 'to': 'finish'} for source in previous)
+    return {'id': f"bench-{shape}-{depth}-{uuid.uuid4().hex[:6]}", 'structure': {'nodes': nodes, 'connections': connections}}
+
+def wait_for_run(workspace, session, process_id, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = workspace.post(session, 'get_process_status', process_id=process_id)
+        status = result.get('data', {}).get('status')
+        if status in ('completed', 'failed'):
+            return status, len(result['data'].get('path', []))
+        time.sleep(0.02)
+    return 'timeout', 0
+
+def structure_runs(workspace, shapes=('linear', 'branching', 'conditional'), depth=6, runs=8, concurrency=4, timeout=120):
+    """Auto-run structures of several shapes end to end through the job queue."""
+    session, _ = workspace.register(f"runs-{uuid.uuid4().hex[:8]}@newsroom.test")
+    result = {}
+    for shape in shapes:
+        steps = []
+
+        def run(index):
+            # A fresh structure per run so outputs are not served from the node cache
+            started = workspace.post(session, 'start_process', structure_data=build_structure(shape, depth), auto_run=True)
+            if started.get('status') != 'success':
+                return False
+            status, path_length = wait_for_run(workspace, session, started['data']['process_id'], timeout)
+            steps.append(path_length)
+            return status == 'completed'
+
+        measurement = measure(run, runs, concurrency)
+        measurement['steps_per_run'] = max(steps, default=0)
+        result[f"run_{shape}"] = measurement
+    return result
+
+def noisy_response(size, seed):
+    """An echoed completion with the kind of noise refine_response has to cut through."""
+    rng = random.Random(seed)
+    payload = json.dumps({'next_node_id': f"node-{seed}", 'reason': 'x' * rng.randint(10, 80)})
+    noise = ''.join(rng.choice('abcdefghij {}[]":,\n') for _ in range(size))
+    kind = seed % 3
+    if kind == 0:
+        completion = f"{payload}\nSure! Here is some more text: {noise}"
+    elif kind == 1:
+        completion = f"{payload}{noise}<|im_end|>"
+    else:
+        completion = noise
+    return f"<|im_user|>\nChoose.\n<|im_end|>\n<|im_assistant|>\n{completion}"
+
+class _Response:
+    """The part of requests.Response that refine_response reads."""
+
+    def __init__(self, text):
+        self.text = text
+
+def refine_noisy_outputs(workspace, sizes=(200, 2000, 8000), samples=30):
+    """refine_response on echoed completions with trailing noise, by noise size."""
+    from backend.application.refinement import refine_response
+
+    result = {}
+    for size in sizes:
+        responses = [_Response(noisy_response(size, seed)) for seed in range(samples)]
+        result[f"refine_{size}"] = measure(lambda index: refine_response(responses[index]) is not None, samples)
+    return result
+
+def static_assets(workspace, page_loads=50, concurrency=8):
+    """Cold page loads: the index page followed by every frontend asset."""
+    extensions = tuple(workspace.server.config['allowed_extensions'])
+    assets = []
+    for directory, _, filenames in os.walk('frontend', followlinks=True):
+        assets.extend('/' + os.path.join(directory, name).replace(os.sep, '/') for name in filenames if name.endswith(extensions))
+    assets.sort()
+
+    asset_latencies = []
+    def page_load(index):
+        session = requests.Session()
+        ok = session.get(workspace.url + '/', timeout=30).status_code == 200
+        for asset in assets:
+            started = time.perf_counter()
+            ok = session.get(workspace.url + asset, timeout=30).status_code == 200 and ok
+            asset_latencies.append(time.perf_counter() - started)
+        return ok
+
+    result = {'page_load': measure(page_load, page_loads, concurrency)}
+    result['page_load']['assets'] = len(assets)
+    result['asset'] = summarize(asset_latencies)
+    return result
+
+def feed_polling(workspace, feeds=300, items=100, subscriptions=20):
+    """
+    read_rss subscriptions through the API, then full polls of every feed
+    from a local fixture server: a cold poll that downloads and parses
+    everything and a conditional poll that is answered with 304s.
+    """
+    import backend.application.feed_ingest as feed_ingest
+
+    server, fixtures = start_feed_server(items=items)
+    base = f"http://127.0.0.1:{server.server_address[1]}/feeds/"
+    try:
+        session, user_id = workspace.register(f"feeds-{uuid.uuid4().hex[:8]}@newsroom.test")
+        structure = {'id': f"feeds-{uuid.uuid4().hex[:8]}"}
+        result = {'read_rss': measure(
+            lambda index: workspace.post(session, 'read_rss', rss_url=f"{base}sub{index}.xml", structure_data=structure).get('status') == 'success',
+            subscriptions
+        )}
+
+        for index in range(feeds):
+            feed_ingest.subscribe(f"{base}{index}.{'atom' if index % 2 else 'xml'}", user_id)
+        for name in ('cold_poll', 'conditional_poll'):
+            requests_before = fixtures.stats['requests']
+            started = time.perf_counter()
+            polled = feed_ingest.poll_all()
+            elapsed = time.perf_counter() - started
+            result[name] = summarize([elapsed])
+            result[name]['feeds'] = polled
+            result[name]['requests'] = fixtures.stats['requests'] - requests_before
+            result[name]['throughput'] = round(polled / elapsed, 3) if elapsed else 0.0
+            result[name]['feeds_per_minute'] = round(polled / elapsed * 60) if elapsed else 0
+        result['conditional_poll']['not_modified'] = fixtures.stats['not_modified']
+    finally:
+        server.shutdown()
+    return result
+
+def corpus_search(workspace, documents=200000, queries=200, concurrency=4):
+    """search_web over a synthetic corpus with Zipf-distributed words, indexed in segments of 50k."""
+    import backend.application.search_index as search_index
+
+    session, user_id = workspace.register(f"search-{uuid.uuid4().hex[:8]}@newsroom.test")
+    rng = random.Random(7)
+    vocabulary = [f"term{index}" for index in range(50000)]
+    cumulative = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(vocabulary))))
+    search_index.configure({'search': {'flush_docs': 50000}})
+
+    started = time.perf_counter()
+    for start in range(0, documents, 10000):
+        search_index.add_documents([
+            search_index.make_document(f"bench:{index}", ' '.join(rng.choices(vocabulary, cum_weights=cumulative, k=60)),
+                                       user_id if index % 2 else None, 'document')
+            for index in range(start, min(start + 10000, documents))
+        ])
+    search_index.flush()
+    indexing = time.perf_counter() - started
+
+    query_terms = [' '.join(rng.choices(vocabulary[:2000], k=rng.randint(1, 4))) for _ in range(queries)]
+    result = {'search_web': measure(
+        lambda index: workspace.post(session, 'search_web', query=query_terms[index]).get('status') == 'success',
+        queries, concurrency
+    )}
+    result['index_search'] = measure(lambda index: search_index.search(query_terms[index], user_id) is not None, queries)
+    result['indexing'] = {'documents': documents, 'throughput': round(documents / indexing, 3)}
+    return result
+
+def story_grouping(workspace, items=10000, stories=2000, repeats=3):
+    """
+    Similarity node clustering and ranking of wire-style items: every
+    story appears several times with a few words changed.
+    """
+    import backend.application.similarity as similarity
+
+    rng = random.Random(11)
+    vocabulary = [f"term{index}" for index in range(30000)]
+    cumulative = list(itertools.accumulate(1 / (rank + 1) ** 1.05 for rank in range(len(vocabulary))))
+    originals = [rng.choices(vocabulary, cum_weights=cumulative, k=80) for _ in range(stories)]
+    texts = []
+    for index in range(items):
+        words = list(originals[index % stories])
+        for _ in range(rng.randint(0, 20)):
+            words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        texts.append(' '.join(words))
+
+    cluster_node = {'type': 'similarity', 'configuration': {'method': 'cluster'}}
+    rank_node = {'type': 'similarity', 'configuration': {'method': 'rank', 'query': texts[0]}}
+    clusters = []
+
+    def group(index):
+        clusters.append(len(json.loads(similarity.run_node(cluster_node, texts))['clusters']))
+
+    result = {'cluster': measure(group, repeats)}
+    result['rank'] = measure(lambda index: similarity.run_node(rank_node, texts) is not None, repeats)
+    result['cluster']['items'] = items
+    result['cluster']['clusters'] = clusters[0]
+    result['cluster']['throughput'] = round(items / (result['cluster']['mean_ms'] / 1000), 3)
+    return result
+
+def llm_resilience(workspace, hedges=5, tail_latency=2.0, hedge_delay=0.1, failure_threshold=3, reset_timeout=0.5):
+    """
+    Hedging and the circuit breaker against the fake LLM server, driven
+    through its /control settings. Raises when either does not behave:
+        hedge    a request whose primary hits the latency tail is answered
+                 by its hedge, well before the tail latency
+        breaker  with the server down, failure_threshold failures open the
+                 breaker, later calls fail fast with circuit_open without
+                 reaching the server, and once reset_timeout has passed a
+                 failed probe reopens it and a successful one closes it
+    """
+    import backend.llm as llm
+    import backend.llm_router as llm_router
+
+    control_url = workspace.llm_url.rstrip('/') + '/control'
+    original = requests.get(workspace.llm_url, timeout=5).json()
+
+    def control(**settings):
+        requests.post(control_url, json=settings, timeout=5).raise_for_status()
+
+    def server_requests():
+        return requests.get(workspace.llm_url, timeout=5).json()['requests']
+
+    def configure_llm(**llm_config):
+        llm.configure({**workspace.server.config, 'llm': {**workspace.server.config.get('llm', {}), **llm_config}})
+
+    def breaker_state():
+        return llm_router.stats()['endpoints'][0]['circuit_breaker']['state']
+
+    def check(condition, message):
+        if not condition:
+            raise RuntimeError(message)
+
+    result = {}
+    try:
+        control(latency='fixed:0.01', tail_probability=0, error_rate=0, down=False)
+
+        # A hedge after hedge_delay on every request, whatever latencies were seen before
+        configure_llm(hedge={'enabled': True, 'initial_delay': hedge_delay, 'min_samples': 10 ** 9})
+        latencies = []
+        for _ in range(hedges):
+            before, hedges_before, wins_before = server_requests(), llm.stats()['hedges'], llm.stats()['hedge_wins']
+            control(tail_probability=1.0, tail_latency=tail_latency)
+            outcome = {}
+
+            def call():
+                started = time.perf_counter()
+                outcome['response'] = llm.generate_llm_response("Hedge check", user_id='resilience')
+                outcome['latency'] = time.perf_counter() - started
+
+            thread = threading.Thread(target=call)
+            thread.start()
+            # Only the primary lands in the tail; the hedge gets the normal latency
+            deadline = time.time() + 5
+            while server_requests() == before and time.time() < deadline:
+                time.sleep(0.005)
+            control(tail_probability=0)
+            thread.join(timeout=tail_latency * 2 + 5)
+
+            stats = llm.stats()
+            check(not isinstance(outcome.get('response'), dict), f"Hedged request failed: {outcome.get('response')}")
+            check(stats['hedges'] == hedges_before + 1, "No hedge was sent for a slow primary")
+            check(stats['hedge_wins'] == wins_before + 1, "The hedge did not win over a slow primary")
+            check(outcome['latency'] < tail_latency / 2, f"Hedged request took {outcome['latency']:.3f}s")
+            latencies.append(outcome['latency'])
+        result['hedged'] = summarize(latencies)
+        # Let the slow primaries finish before the endpoints are replaced
+        time.sleep(tail_latency)
+
+        configure_llm(hedge={'enabled': False}, circuit_breaker={
+            'failure_threshold': failure_threshold, 'reset_timeout': reset_timeout, 'half_open_probes': 1
+        })
+        control(down=True)
+        for attempt in range(failure_threshold):
+            response = llm.generate_llm_response("Breaker check", user_id='resilience')
+            check(isinstance(response, dict) and not response.get('circuit_open'), f"Failure {attempt + 1} did not reach the server")
+        check(breaker_state() == 'open', f"Breaker is {breaker_state()} after {failure_threshold} failures")
+
+        before = server_requests()
+        rejected = []
+        for _ in range(20):
+            started = time.perf_counter()
+            response = llm.generate_llm_response("Breaker check", user_id='resilience')
+            rejected.append(time.perf_counter() - started)
+            check(isinstance(response, dict) and response.get('circuit_open'), "Open breaker did not reject with circuit_open")
+        check(server_requests() == before, "Open breaker let requests through to the server")
+        result['rejected'] = summarize(rejected)
+        check(result['rejected']['p99_ms'] < 50, f"Rejections are slow: {result['rejected']['p99_ms']}ms")
+
+        time.sleep(reset_timeout)
+        response = llm.generate_llm_response("Breaker check", user_id='resilience')
+        check(isinstance(response, dict) and not response.get('circuit_open'), "Half-open breaker sent no probe")
+        check(breaker_state() == 'open', "A failed probe did not reopen the breaker")
+
+        control(down=False)
+        time.sleep(reset_timeout)
+        started = time.perf_counter()
+        response = llm.generate_llm_response("Breaker check", user_id='resilience')
+        check(not isinstance(response, dict), f"Recovered server was not used: {response}")
+        check(breaker_state() == 'closed', f"Breaker is {breaker_state()} after a successful probe")
+        result['recovery'] = summarize([time.perf_counter() - started])
+    finally:
+        control(**{key: original[key] for key in ('latency', 'tail_probability', 'tail_latency', 'error_rate', 'down')})
+        llm.configure(workspace.server.config)
+    return result
+
+SCENARIOS = {
+    'login': (login_at_scale, {'users': 2000, 'logins': 300}, {'users': 200, 'logins': 40}),
+    'output_files': (output_files_large_registry, {'files': 5000, 'requests_count': 30}, {'files': 300, 'requests_count': 5}),
+    'structure_runs': (structure_runs, {'depth': 6, 'runs': 8}, {'depth': 3, 'runs': 2}),
+    'refine': (refine_noisy_outputs, {'sizes': (200, 2000, 8000), 'samples': 30}, {'sizes': (200, 2000), 'samples': 5}),
+    'static_assets': (static_assets, {'page_loads': 50}, {'page_loads': 5}),
+    'feeds': (feed_polling, {'feeds': 300, 'items': 100, 'subscriptions': 20}, {'feeds': 40, 'items': 50, 'subscriptions': 5}),
+    'search': (corpus_search, {'documents': 200000, 'queries': 200}, {'documents': 20000, 'queries': 30}),
+    'similarity': (story_grouping, {'items': 10000, 'stories': 2000}, {'items': 1000, 'stories': 200, 'repeats': 1}),
+    'resilience': (llm_resilience, {'hedges': 10}, {'hedges': 3})
+}
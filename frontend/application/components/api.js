@@ -23,6 +23,20 @@ export async function sendRequest(requestData) {
     }
 }
 
+export function subscribeEvents(onEvent, processId = null) {
+    const params = processId ? `?process_id=${encodeURIComponent(processId)}` : '';
+    const source = new EventSource(`/events${params}`, { withCredentials: true });
+    
+    ['process_started', 'node_transition', 'process_completed', 'process_error', 'file_generated', 'node_error', 'resync']
+        .forEach(type => {
+            source.addEventListener(type, (event) => {
+                onEvent(type, event.data ? JSON.parse(event.data) : {});
+            });
+        });
+    
+    return source;
+}
+
 export async function searchWeb(query, jobId) {
     return await sendRequest({
         action: 'search_web',
@@ -39,13 +53,29 @@ export async function processRSS(url, jobId) {
     });
 }
 
-export async function processFile(fileName, fileContent, jobId) {
-    return await sendRequest({
-        action: 'load_file',
-        file_name: fileName,
-        file_content: fileContent,
-        job_id: jobId
-    });
+export async function uploadFile(file, target) {
+    // Files are streamed as the raw request body instead of inside JSON
+    const params = new URLSearchParams({ name: file.name, ...target });
+    try {
+        const response = await fetch(`/upload?${params}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': file.type || 'application/octet-stream',
+            },
+            credentials: 'include',
+            body: file
+        });
+        return await response.json();
+    } catch (error) {
+        return {
+            status: 'error',
+            message: error.message
+        };
+    }
+}
+
+export async function processFile(file, jobId) {
+    return await uploadFile(file, { job_id: jobId });
 }
 
 export async function processPrompt(prompt) {
@@ -56,9 +86,44 @@ export async function processPrompt(prompt) {
     });
 }
 
-export async function loadJohtoData() {
+export async function loadJohtoData(refresh = false) {
+    return await sendRequest({
+        action: 'load_johto_data',
+        refresh
+    });
+}
+
+export async function getSyncStatus() {
+    return await sendRequest({
+        action: 'get_sync_status'
+    });
+}
+
+export async function waitForJohtoSync(pollInterval = 2000) {
+    while (true) {
+        const response = await getSyncStatus();
+        if (response.status !== 'success' || !response.data.sync.running) {
+            return response;
+        }
+        await new Promise(resolve => setTimeout(resolve, pollInterval));
+    }
+}
+
+export async function listStructures(userId, offset = 0, limit = 50, prefix = '') {
+    return await sendRequest({
+        action: 'list_structures',
+        user_id: userId,
+        offset,
+        limit,
+        prefix
+    });
+}
+
+export async function getStructure(userId, structureId) {
     return await sendRequest({
-        action: 'load_johto_data'
+        action: 'get_structure',
+        user_id: userId,
+        structure_id: structureId
     });
 }
 
@@ -25,12 +25,18 @@ export async function createApp(data, container) {
     appState.userData = data;
     
     try {
-        const response = await api.loadJohtoData();
+        let response = await api.loadJohtoData();
+        
+        // Show the cached index right away, then reload it once a running sync finishes
+        if (response.status === 'success' && response.data?.sync?.running && !response.data.users?.length) {
+            await api.waitForJohtoSync();
+            response = await api.loadJohtoData();
+        }
         
         if (response.status === 'success') {
-            if (response.data && response.data.structures) {
-                console.log('Structures: ', response.data.structures);
-                appState.structures = response.data.structures;
+            if (response.data && response.data.users) {
+                console.log('Structure index: ', response.data.index);
+                appState.structures = response.data.users;
                 
                 if (appState.activeTab === 'structures') {
                     const event = new CustomEvent('johto-data-loaded');
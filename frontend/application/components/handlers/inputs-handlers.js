@@ -95,33 +95,16 @@ export function setupInputsTabHandlers() {
             }
             
             const file = fileInput.files[0];
+            const response = await api.uploadFile(file, { structure_id: appState.currentStructure.id });
             
-            const reader = new FileReader();
-            reader.onload = async (event) => {
-                try {
-                    const fileContent = event.target.result;
-                    
-                    const response = await api.sendRequest({
-                        action: 'load_file',
-                        file_name: file.name,
-                        file_content: fileContent,
-                        structure_data: appState.currentStructure
-                    });
-                    
-                    if (response.status === 'success') {
-                        console.log('File uploaded successfully');
-                        fileInput.value = '';
-                    } else {
-                        throw new Error(response.message || 'File upload failed');
-                    }
-                } catch (error) {
-                    showError('Error processing file', error);
-                }
-            };
-            
-            reader.readAsText(file);
+            if (response.status === 'success') {
+                console.log('File uploaded successfully');
+                fileInput.value = '';
+            } else {
+                throw new Error(response.message || 'File upload failed');
+            }
         } catch (error) {
-            showError('Error reading file', error);
+            showError('Error uploading file', error);
         }
     });
 }
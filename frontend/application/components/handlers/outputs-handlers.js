@@ -21,6 +21,16 @@ export function setupOutputsTabHandlers() {
         await refreshOutputsView();
     });
     
+    // Refresh the list as soon as the server reports a new file for the selected structure
+    api.subscribeEvents((type, event) => {
+        if (type !== 'file_generated' || !appState.currentStructure) return;
+        if (event.data?.structure_id !== appState.currentStructure.id) return;
+        
+        if (appState.activeTab === 'outputs') {
+            refreshOutputsView();
+        }
+    });
+    
     // Register delete all outputs button handler
     registerButtonHandler('delete-all-outputs-btn', async (event, button) => {
         console.log('Delete output files button clicked - moving all files to old/ directory');
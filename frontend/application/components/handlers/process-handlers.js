@@ -129,8 +129,8 @@ async function executeNode() {
         const response = await sendRequest(requestBody);
         console.log('Response from execute_node:', response);
         
-        // If file was generated, add to our files list
-        if (response?.data?.file_generated && response?.data?.file_info) {
+        // If file was generated or reused from an unchanged node, add to our files list
+        if (response?.data?.file_info) {
             if (!appState.generatedFiles) {
                 appState.generatedFiles = [];
             }
@@ -218,10 +218,12 @@ async function chooseNextNode() {
     } else {
         const requestBody = {
             action: 'choose_next_node',
+            structure_id: appState.currentStructure.id,
             current_node: appState.currentNode,
             connections: goingToConnections.map(id => 
                 appState.currentStructure.structure.nodes.find(n => n.id === id)
-            ).filter(Boolean)
+            ).filter(Boolean),
+            edges: appState.currentStructure.structure.connections.filter(c => c.startNode === appState.currentNode.id)
         };
 
         console.log('Request body for choosing next node:', requestBody);
@@ -22,6 +22,8 @@ function getLoadingAnimation() {
     return johtoLoadingAnimation;
 }
 
+const STRUCTURES_PAGE_SIZE = 50;
+
 export function setupStructuresTabHandlers() {
     document.addEventListener('johto-data-loaded', () => {
         if (appState.structures) {
@@ -35,11 +37,33 @@ export function setupStructuresTabHandlers() {
         }
     });
     
-    registerButtonHandler('select-structure-btn', (event, button) => {
+    document.getElementById('structures-list')?.addEventListener('click', (event) => {
+        const heading = event.target.closest('.collapsible-heading');
+        const userSection = heading?.closest('.collapsible-section');
+        if (!userSection || userSection.dataset.loaded) return;
+        
+        loadStructuresPage(userSection);
+    });
+    
+    registerButtonHandler('select-structure-btn', async (event, button) => {
         const structureCard = button.closest('.structure-card');
         if (!structureCard || !structureCard.dataset.item) return;
         
-        selectStructure(JSON.parse(structureCard.dataset.item));
+        const summary = JSON.parse(structureCard.dataset.item);
+        const response = await api.getStructure(summary.userId, summary.id);
+        
+        if (response.status === 'success' && response.data && response.data.structure) {
+            selectStructure(response.data.structure);
+        } else {
+            showError('Error loading structure', new Error(response.message || 'Failed to load structure'));
+        }
+    });
+    
+    registerButtonHandler('load-more-structures-btn', (event, button) => {
+        const userSection = button.closest('.collapsible-section');
+        if (userSection) {
+            loadStructuresPage(userSection);
+        }
     });
     
     registerButtonHandler('refresh-structures-btn', async () => {
@@ -47,10 +71,20 @@ export function setupStructuresTabHandlers() {
             const loadingAnimation = getLoadingAnimation();
             loadingAnimation.show();
             
+            const refreshResponse = await api.loadJohtoData(true);
+            if (refreshResponse.status !== 'success') {
+                throw new Error(refreshResponse.message || 'Failed to start structure sync');
+            }
+            
+            const syncResponse = await api.waitForJohtoSync();
+            if (syncResponse.data?.sync?.last_error) {
+                throw new Error(syncResponse.data.sync.last_error);
+            }
+            
             const response = await api.loadJohtoData();
             
-            if (response.status === 'success' && response.data && response.data.structures) {
-                appState.structures = response.data.structures;
+            if (response.status === 'success' && response.data && response.data.users) {
+                appState.structures = response.data.users;
                 updateStructuresList(appState.structures);
                 console.log('Structures refreshed successfully');
             } else {
@@ -65,114 +99,96 @@ export function setupStructuresTabHandlers() {
     });
 }
 
-function updateStructuresList(structures) {
+function updateStructuresList(users) {
     const structuresList = document.getElementById('structures-list');
     if (!structuresList) return;
     
-    appState.structures = structures;
+    appState.structures = users;
+    
+    const usersWithStructures = (users || []).filter(user => user.structure_count > 0);
     
-    if (!structures || Object.keys(structures).length === 0) {
+    if (usersWithStructures.length === 0) {
         structuresList.innerHTML = '<p class="empty-state">No structures loaded. Please load johto.online data first.</p>';
         return;
     }
     
     structuresList.innerHTML = '';
     
-    const usersWithStructures = Object.keys(structures)
-        .map(userId => {
-            const userData = structures[userId];
-            const username = userData.username || 'Unknown User';
-            const userStructures = userData.structures || {};
-            const structureCount = Object.keys(userStructures).length;
-            
-            return {
-                userId,
-                username,
-                userStructures,
-                structureCount
-            };
-        })
-        .filter(user => user.structureCount > 0)
-        .sort((a, b) => b.structureCount - a.structureCount);
-    
-    usersWithStructures.forEach(({ userId, username, userStructures }) => {
+    usersWithStructures.forEach(({ userId, username, structure_count }) => {
         const userSection = document.createElement('div');
         userSection.className = 'collapsible-section';
+        userSection.dataset.userId = userId;
+        userSection.dataset.offset = '0';
         structuresList.appendChild(userSection);
         
         const userHeading = document.createElement('h3');
         userHeading.className = 'collapsible-heading';
-        userHeading.innerHTML = `${username} (${Object.keys(userStructures).length}) <span class="toggle-icon">▶</span>`;
+        userHeading.innerHTML = `${username || 'Unknown User'} (${structure_count}) <span class="toggle-icon">▶</span>`;
         userSection.appendChild(userHeading);
         
         const userStructuresContainer = document.createElement('div');
         userStructuresContainer.className = 'collapsible-content collapsed';
         userSection.appendChild(userStructuresContainer);
+    });
+}
+
+async function loadStructuresPage(userSection) {
+    if (userSection.dataset.loading) return;
+    userSection.dataset.loading = 'true';
+    
+    const container = userSection.querySelector('.collapsible-content');
+    const offset = parseInt(userSection.dataset.offset || '0', 10);
+    
+    try {
+        const response = await api.listStructures(userSection.dataset.userId, offset, STRUCTURES_PAGE_SIZE);
         
-        Object.keys(userStructures).forEach(fileName => {
-            const structure = userStructures[fileName];
-            
-            const structureElement = document.createElement('div');
-            structureElement.className = 'structure-card';
-            
-            const structureData = {
-                id: fileName,
-                name: structure.name || fileName.replace('.json', ''),
-                userId: userId,
-                username: username,
-                ...structure
-            };
-            structureElement.dataset.item = JSON.stringify(structureData);
-            
-            let nodeCount = 0;
-            let connectionCount = 0;
-                        
-            if (structure.structure && structure.structure.nodes) {
-                if (Array.isArray(structure.structure.nodes)) {
-                    nodeCount = structure.structure.nodes.length;
-                } else if (typeof structure.structure.nodes === 'object') {
-                    nodeCount = Object.keys(structure.structure.nodes).length;
-                }
-            } else if (structure.nodes) {
-                if (Array.isArray(structure.nodes)) {
-                    nodeCount = structure.nodes.length;
-                } else if (typeof structure.nodes === 'object') {
-                    nodeCount = Object.keys(structure.nodes).length;
-                }
-            }
-            
-            if (structure.structure && structure.structure.connections) {
-                if (Array.isArray(structure.structure.connections)) {
-                    connectionCount = structure.structure.connections.length;
-                } else if (typeof structure.structure.connections === 'object') {
-                    connectionCount = Object.keys(structure.structure.connections).length;
-                }
-            } else if (structure.connections) {
-                if (Array.isArray(structure.connections)) {
-                    connectionCount = structure.connections.length;
-                } else if (typeof structure.connections === 'object') {
-                    connectionCount = Object.keys(structure.connections).length;
-                }
-            }
-            
-            const structureName = structure.name || fileName.replace('.json', '');
-            
-            structureElement.innerHTML = `
-                <div class="structure-content">
-                    <h3>${structureName}</h3>
-                    <div class="structure-meta">
-                        <span class="structure-meta-item">Nodes: ${nodeCount}</span>
-                        <span class="structure-meta-item">Connections: ${connectionCount}</span>
-                    </div>
-                </div>
-                <div class="structure-actions">
-                    <button class="btn select-structure-btn primary" data-button-type="select-structure-btn">Select</button>
-                </div>
-            `;
-            
-            userStructuresContainer.appendChild(structureElement);
+        if (response.status !== 'success' || !response.data) {
+            throw new Error(response.message || 'Failed to load structures');
+        }
+        
+        container.querySelector('.load-more-structures-btn')?.remove();
+        
+        response.data.items.forEach(summary => {
+            container.appendChild(createStructureCard(summary));
         });
-    });
+        
+        const nextOffset = offset + response.data.items.length;
+        userSection.dataset.offset = String(nextOffset);
+        userSection.dataset.loaded = 'true';
+        
+        if (nextOffset < response.data.total) {
+            const loadMoreButton = document.createElement('button');
+            loadMoreButton.className = 'btn load-more-structures-btn';
+            loadMoreButton.dataset.buttonType = 'load-more-structures-btn';
+            loadMoreButton.textContent = `Load more (${response.data.total - nextOffset} remaining)`;
+            container.appendChild(loadMoreButton);
+        }
+    } catch (error) {
+        showError('Error loading structures', error);
+    } finally {
+        delete userSection.dataset.loading;
+    }
+}
+
+function createStructureCard(summary) {
+    const structureElement = document.createElement('div');
+    structureElement.className = 'structure-card';
+    structureElement.dataset.item = JSON.stringify(summary);
+    
+    structureElement.innerHTML = `
+        <div class="structure-content">
+            <h3>${summary.name}</h3>
+            <div class="structure-meta">
+                <span class="structure-meta-item">Nodes: ${summary.node_count}</span>
+                <span class="structure-meta-item">Connections: ${summary.connection_count}</span>
+            </div>
+        </div>
+        <div class="structure-actions">
+            <button class="btn select-structure-btn primary" data-button-type="select-structure-btn">Select</button>
+        </div>
+    `;
+    
+    return structureElement;
 }
 
 function selectStructure(structure) {